@@ -1,34 +1,280 @@
-from school.xauat.xauat_client import XAUATAcademicSystemClient
-from school.nwafu.nwafu_client import NWAFUAcademicSystemClient
+from school.registry import school_registry
 from calendar_generator import CalendarGenerator
+from session_pool import session_pool
+from calendar_cache import hash_username
+from timetable_diff import timetable_history
+from school.fetch_pool import run_concurrently
+from school.semesters import semester_span, semesters_in_range, in_range
+from collections import OrderedDict
+from datetime import datetime
+from metrics import stage
+import asyncio
+import os
+import threading
+import time
+
+# Async clients hold an httpx session instead of a requests one, so they are
+# pooled apart from the sync ones.
+ASYNC_POOL_SUFFIX = '/async'
 
 class AcademicSystemClientFactory:
+    # School clients are declared in school.registry and imported on first use
+    registry = school_registry
+
+    @staticmethod
+    def supports(school):
+        return school.lower() in AcademicSystemClientFactory.registry
+
+    @staticmethod
+    def client_class(school):
+        return AcademicSystemClientFactory.registry.load(school)
+
     @staticmethod
     def create_client(school, username, password):
-        # Map school names to their respective client classes
-        clients = {
-            'xauat': XAUATAcademicSystemClient,
-            'nwafu': NWAFUAcademicSystemClient,
-            # Add other schools and their clients here
-        }
-        
-        school_key = school.lower()
-        if school_key in clients:
-            return clients[school_key](username, password)
-            
-        raise ValueError(f"Unsupported school: {school}")
+        client_class = AcademicSystemClientFactory.client_class(school)
+        return session_pool.checkout(school.lower(), username, password,
+                                     lambda: client_class(username, password))
+
+    @staticmethod
+    async def acreate_client(school, username, password):
+        client_class = AcademicSystemClientFactory.client_class(school)
+
+        async def create():
+            client = client_class(username, password, autologin=False)
+            await client.alogin()
+            return client
+
+        return await session_pool.acheckout(school.lower() + ASYNC_POOL_SUFFIX, username, password, create)
+
+    @staticmethod
+    def release_client(school, client):
+        key = school.lower()
+        if getattr(client, 'http', None) is not None:
+            key += ASYNC_POOL_SUFFIX
+        session_pool.checkin(key, client)
+
+# A subscription can't span more semesters than this
+MAX_SEMESTERS = 8
+
+class SemesterDataCache:
+    """
+    Raw course data of past and future semesters (client.course_snapshot()),
+    keyed by (school, username hash, semester). Only the current semester
+    changes often, so it is never cached here and is fetched on every build;
+    the others are reused until ``ttl`` runs out.
+    """
+
+    def __init__(self, ttl=6 * 3600, max_entries=2048):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, snapshot):
+        with self._lock:
+            self._entries[key] = (snapshot, time.time() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+semester_data = SemesterDataCache(
+    ttl=int(os.getenv("SEMESTER_DATA_TTL", default=6 * 3600)),
+    max_entries=int(os.getenv("SEMESTER_DATA_MAX_ENTRIES", default=2048)),
+)
+
+class Timetable:
+    __slots__ = ('courses', 'exams', 'revision', 'semester')
+
+    def __init__(self, courses, exams, revision, semester):
+        self.courses = courses
+        self.exams = exams
+        self.revision = revision
+        self.semester = semester
 
 class AcademicCalendarService:
-    def __init__(self, school, username, password):
-        self.client = AcademicSystemClientFactory.create_client(school, username, password)
+    def __init__(self, school, username, password, client=None, pooled=True):
+        self.school = school
+        self.subscriber_key = (school.lower(), hash_username(school, username))
+        self.client = client or AcademicSystemClientFactory.create_client(school, username, password)
+        # One-off clients (batch exports) are dropped instead of going back to the pool
+        self.pooled = pooled
 
-    def generate_calendar(self, event_filter=None):
-        if not self.client.is_authenticated:
+    @classmethod
+    async def acreate(cls, school, username, password):
+        client = await AcademicSystemClientFactory.acreate_client(school, username, password)
+        return cls(school, username, password, client=client)
+
+    @staticmethod
+    def create_event_filter(filter_type):
+        if filter_type == 'future':
+            current_time = datetime.now()
+            return lambda event: event['start'] > current_time
+        elif filter_type == 'no_classroom':
+            return lambda event: event.get('roomZh', '') != '未知地点'
+        return None
+
+    def load_timetable(self, semesters=None, date_range=None):
+        """
+        Fetch and normalize the timetable and give every event a stable UID.
+
+        ``semesters`` is a list of semester ids and ``date_range`` a (start,
+        end) pair of dates; without either only the current semester is
+        loaded. With a range, only the semesters overlapping it are fetched
+        and only the classes inside it are expanded.
+
+        Returns a Timetable, or None if the login failed. Its revision only
+        changes when the timetable differs from the last fetch.
+        """
+        try:
+            if not self.client.is_authenticated:
+                return None
+
+            selected = self.select_semesters(semesters, date_range, self.client.list_semesters)
+            # Courses and exams come from unrelated endpoints, so they are
+            # fetched in parallel.
+            snapshots, _ = run_concurrently(lambda: [self.fetch_semester(semester) for semester in selected],
+                                            self.client.fetch_exams)
+            processed = self.process_semesters(selected, snapshots, date_range)
+        finally:
+            self.release_client()
+        return self.track_timetable(*processed)
+
+    async def aload_timetable(self, semesters=None, date_range=None):
+        """load_timetable for the ASGI server, fetching with the client's async methods."""
+        try:
+            if not self.client.is_authenticated:
+                return None
+
+            list_semesters = None
+            if semesters is None and date_range is not None:
+                listed = await self.client.alist_semesters()
+                list_semesters = lambda: listed
+            selected = self.select_semesters(semesters, date_range, list_semesters)
+
+            async def fetch_selected():
+                return [await self.afetch_semester(semester) for semester in selected]
+
+            snapshots, _ = await asyncio.gather(fetch_selected(), self.client.afetch_exams())
+            processed = self.process_semesters(selected, snapshots, date_range)
+        finally:
+            self.release_client()
+        # Diffing and the SQLite writes block, keep them off the event loop
+        return await asyncio.to_thread(self.track_timetable, *processed)
+
+    def release_client(self):
+        if self.pooled:
+            AcademicSystemClientFactory.release_client(self.school, self.client)
+
+    def select_semesters(self, semesters, date_range, list_semesters):
+        """
+        The semesters to load; None stands for the current one, whatever it
+        is by the time the courses are fetched.
+        """
+        if semesters:
+            return [None if semester == self.client.current_semester else semester
+                    for semester in semesters[:MAX_SEMESTERS]]
+        if date_range is not None:
+            listed = list_semesters()
+            overlapping = semesters_in_range(listed, date_range)[-MAX_SEMESTERS:]
+            if overlapping:
+                return [None if semester == self.client.current_semester else semester for semester in overlapping]
+            # Nothing to fetch if the range is outside every semester we could date
+            if any(semester_span(name) for _, name in listed):
+                return []
+        return [None]
+
+    def semester_key(self, semester):
+        return self.subscriber_key + (semester,)
+
+    def fetch_semester(self, semester):
+        """client.course_snapshot() of ``semester``, from semester_data unless it is the current one."""
+        if semester is None:
+            self.client.fetch_courses()
+            return self.client.course_snapshot()
+        snapshot = semester_data.get(self.semester_key(semester))
+        if snapshot is not None:
+            return snapshot
+        try:
+            if not self.client.fetch_courses(semester):
+                return None
+        except Exception as e:
+            print(f"Failed to fetch courses of semester {semester}: {e}")
+            return None
+        snapshot = self.client.course_snapshot()
+        semester_data.put(self.semester_key(semester), snapshot)
+        return snapshot
+
+    async def afetch_semester(self, semester):
+        if semester is None:
+            await self.client.afetch_courses()
+            return self.client.course_snapshot()
+        snapshot = semester_data.get(self.semester_key(semester))
+        if snapshot is not None:
+            return snapshot
+        try:
+            if not await self.client.afetch_courses(semester):
+                return None
+        except Exception as e:
+            print(f"Failed to fetch courses of semester {semester}: {e}")
             return None
+        snapshot = self.client.course_snapshot()
+        semester_data.put(self.semester_key(semester), snapshot)
+        return snapshot
+
+    def process_semesters(self, selected, snapshots, date_range):
+        """
+        Expand the fetched semesters into the track_timetable arguments.
+        Anything but the default subscription gets a variant label such as
+        "301+302@2024-09-01..2025-01-31".
+        """
+        courses = []
+        for semester, snapshot in zip(selected, snapshots):
+            if snapshot is None:
+                continue
+            self.client.restore_course_snapshot(snapshot)
+            courses.extend(self.client.process_course_data(date_range))
 
-        self.client.fetch_courses()
-        self.client.fetch_exams()
-        courses = self.client.process_course_data()
+        # The exams shown upstream are those of the current semester
         self.client.process_exam_data()
+        exams = self.client.exams if None in selected or date_range is not None else []
+        if date_range is not None:
+            exams = [exam for exam in exams if in_range(exam['start'].date(), date_range)]
+
+        current = self.client.current_semester
+        if selected == [None] and date_range is None:
+            return courses, exams, current, None
+        variant = "+".join(current if semester is None else semester for semester in selected)
+        if date_range is not None:
+            variant += "@" + "..".join(day.isoformat() if day else "" for day in date_range)
+        return courses, exams, current, variant
 
-        return CalendarGenerator.create_calendar(courses, self.client.exams, event_filter)
+    def track_timetable(self, courses, exams, semester, variant=None):
+        """
+        Diff against the last fetch and record it. ``variant`` labels a
+        semester list or date range subscription, see process_semesters.
+        """
+        with stage('diff', self.subscriber_key[0]):
+            if variant is not None:
+                # Every semester list or range keeps its own history, so
+                # feeds of the same student don't churn each other's revisions
+                _, revision = timetable_history.apply(self.subscriber_key + (variant,), courses, exams, variant)
+                return Timetable(courses, exams, revision, variant)
+            _, revision = timetable_history.apply(self.subscriber_key, courses, exams, semester)
+        return Timetable(courses, exams, revision, semester)
+
+    def generate_calendar(self, event_filter=None, recurrence='expanded'):
+        timetable = self.load_timetable()
+        if timetable is None:
+            return None
+        return CalendarGenerator.create_calendar(timetable.courses, timetable.exams, event_filter, recurrence)
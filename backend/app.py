@@ -1,39 +1,343 @@
 from flask import Flask, request, Response, redirect
-from academic_calendar_service import AcademicCalendarService
-from datetime import datetime
+from academic_calendar_service import AcademicCalendarService, AcademicSystemClientFactory, MAX_SEMESTERS
+from calendar_generator import CalendarGenerator, RECURRENCE_MODES, CALENDAR_FORMATS
+from calendar_cache import CalendarCache, make_cache_key, make_subscriber_cache_key, credential_digest
+from credential_vault import credential_vault
+from refresh_scheduler import RefreshScheduler
+from single_flight import SingleFlight, TooManyWaiters
+from timetable_store import timetable_store
+from compression import negotiate
+from school.upstream_policy import UpstreamUnavailable, open_circuits
+from metrics import registry, start_trace, current_trace, SERVER_TIMING, REQUESTS, REQUEST_SECONDS, CACHE_LOOKUPS
+from datetime import date
+import base64
+import json
+import os
+import time
 
 app = Flask(__name__)
 
+# Identical concurrent /class requests (and background refreshes) share
+# one build; the key includes a per-process digest of the password.
+calendar_flights = SingleFlight(max_followers=int(os.getenv("SINGLE_FLIGHT_MAX_FOLLOWERS", default=32)))
+_FLIGHT_SALT = os.urandom(16)
+
+def configured_secret(name):
+    """A base64 secret from the environment, or None."""
+    value = os.getenv(name)
+    return base64.urlsafe_b64decode(value + '=' * (-len(value) % 4)) if value else None
+
+calendar_cache = CalendarCache(
+    ttl=int(os.getenv("CALENDAR_CACHE_TTL", default=1800)),
+    max_entries=int(os.getenv("CALENDAR_CACHE_MAX_ENTRIES", default=1024)),
+    max_bytes=int(os.getenv("CALENDAR_CACHE_MAX_BYTES", default=64 * 1024 * 1024)),
+    max_stale=int(os.getenv("CALENDAR_CACHE_MAX_STALE", default=7 * 24 * 3600)),
+    store=timetable_store,
+    # Keys the password digests of persisted renders; keep it out of TIMETABLE_DB
+    secret=configured_secret("CALENDAR_CACHE_SECRET"),
+)
+
+registry.gauge("coursesync_calendar_cache_entries", "Rendered calendars held in memory.",
+               lambda: len(calendar_cache))
+registry.gauge("coursesync_calendar_cache_bytes", "Bytes of rendered calendars held in memory.",
+               lambda: calendar_cache.total_bytes)
+registry.gauge("coursesync_builds_in_flight", "Calendar builds currently running.",
+               calendar_flights.in_flight)
+registry.gauge("coursesync_upstream_circuits_open", "Schools whose circuit breaker is open or half-open.",
+               open_circuits)
+
+def metric_school(school):
+    # Only known schools become label values, so junk input can't blow up the series count
+    school = (school or '').lower()
+    return school if AcademicSystemClientFactory.supports(school) else 'other'
+
+CALENDAR_OPTION_NAMES = ('filter', 'mode', 'semesters', 'semester', 'start', 'end', 'format')
+
+class SubscriptionNotFound(LookupError):
+    pass
+
+def parse_calendar_options(args):
+    options = {
+        'filter': args.get('filter'),
+        'mode': args.get('mode', 'expanded'),
+        'semesters': parse_semester_list(args.get('semesters') or args.get('semester')),
+        'start': parse_date(args.get('start'), 'start'),
+        'end': parse_date(args.get('end'), 'end'),
+        # Left out for ICS, so existing subscriptions keep their cache keys
+        'format': args.get('format') if args.get('format') != 'ics' else None,
+    }
+    if options['mode'] not in RECURRENCE_MODES:
+        raise ValueError(f"Unsupported mode: {options['mode']}")
+    if options['format'] is not None and options['format'] not in CALENDAR_FORMATS:
+        raise ValueError(f"Unsupported format: {options['format']}")
+    if options['start'] and options['end'] and options['start'] > options['end']:
+        raise ValueError("start must not be after end")
+    return {name: value for name, value in options.items() if value is not None}
+
+def parse_semester_list(value):
+    # Normalized so the same list always maps to the same cache entry
+    if not value:
+        return None
+    semesters = sorted({semester.strip() for semester in value.split(',') if semester.strip()})
+    if len(semesters) > MAX_SEMESTERS:
+        raise ValueError(f"At most {MAX_SEMESTERS} semesters can be requested")
+    return ','.join(semesters) or None
+
+def parse_date(value, name):
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(value).isoformat()
+    except ValueError:
+        raise ValueError(f"Invalid {name} date: {value}")
+
+def timetable_args(options):
+    """The load_timetable arguments for parsed calendar options."""
+    start, end = options.get('start'), options.get('end')
+    return {
+        'semesters': options['semesters'].split(',') if options.get('semesters') else None,
+        'date_range': (date.fromisoformat(start) if start else None, date.fromisoformat(end) if end else None)
+                      if start or end else None,
+    }
+
+def build_calendar(school, username, password, options, previous=None):
+    """
+    Returns (calendar_data, timetable); calendar_data is None if the login
+    failed. ``previous`` is a cached render that is reused as long as the
+    timetable hasn't changed since it was made.
+    """
+    service = AcademicCalendarService(school, username, password)
+    timetable = service.load_timetable(**timetable_args(options))
+    if timetable is None:
+        return None, None
+    return render_timetable(timetable, options, previous), timetable
+
+def render_timetable(timetable, options, previous=None):
+    # 'future' depends on the current time, so it is always re-rendered
+    if previous is not None and previous.revision == timetable.revision and options.get('filter') != 'future':
+        return previous.body
+
+    event_filter = AcademicCalendarService.create_event_filter(options.get('filter'))
+    return CalendarGenerator.create_calendar(timetable.courses, timetable.exams, event_filter,
+                                             options.get('mode', 'expanded'), options.get('format', 'ics'))
+
+def render_calendar(cache_key, school, username, password, options, secret=None):
+    """
+    Build, cache and return the entry for ``cache_key``, or None if the login
+    failed. The entry is bound to ``secret``, the password unless it is a
+    token subscription.
+    """
+    secret = secret or password
+
+    def render():
+        previous = calendar_cache.get(cache_key, secret, allow_stale=True)
+        calendar_data, timetable = build_calendar(school, username, password, options, previous)
+        if calendar_data is None:
+            return None
+        return calendar_cache.put(cache_key, secret, calendar_data, timetable.revision, timetable.semester)
+
+    flight_key = cache_key + (credential_digest(secret, _FLIGHT_SALT),)
+    return calendar_flights.do(flight_key, render)
+
+def resolve_calendar_request(args):
+    """
+    (school, username, secret, options, cache_key) for a /class query.
+
+    ``secret`` is what the cached render is bound to: the password, or the
+    token of a ?token= subscription. Token subscriptions leave ``username``
+    None, their credentials stay encrypted until a render needs them (see
+    unlock_subscription). Raises ValueError for a bad query and
+    SubscriptionNotFound for an unknown token.
+    """
+    token = args.get('token')
+    if token:
+        subscription = credential_vault.lookup(token) if credential_vault is not None else None
+        if subscription is None:
+            raise SubscriptionNotFound("订阅不存在或已取消")
+        # Options in the URL override the ones saved with the subscription
+        merged = dict(subscription.options)
+        merged.update((name, args.get(name)) for name in CALENDAR_OPTION_NAMES if args.get(name))
+        options = parse_calendar_options(merged)
+        cache_key = make_subscriber_cache_key(subscription.school, subscription.subscriber_id, options)
+        return subscription.school, None, token, options, cache_key
+
+    school = args.get('school', 'xauat')
+    if not AcademicSystemClientFactory.supports(school):
+        raise ValueError(f"Unsupported school: {school}")
+    username = args.get('username')
+    password = args.get('password') or args.get('passwd')
+    if not username or not password:
+        raise ValueError("缺少用户名或密码")
+    options = parse_calendar_options(args)
+    return school, username, password, options, make_cache_key(school, username, options)
+
+def unlock_subscription(username, secret):
+    """(username, password) for resolve_calendar_request's username and secret, or None."""
+    if username is not None:
+        return username, secret
+    return credential_vault.credentials(secret) if credential_vault is not None else None
+
+def refresh_subscription(subscription):
+    start_trace(metric_school(subscription.school))
+    # Token subscriptions are scheduled with username None and the token as password
+    credentials = unlock_subscription(subscription.username, subscription.password)
+    entry = None
+    if credentials is not None:
+        entry = render_calendar(subscription.key, subscription.school, *credentials, subscription.options,
+                                secret=subscription.password)
+    if entry is None:
+        # The password was changed or the subscription cancelled: stop
+        # serving the last render to whoever still knows the old secret
+        calendar_cache.invalidate(subscription.key)
+        return False
+    return True
+
+refresh_scheduler = RefreshScheduler(
+    refresh_subscription,
+    interval=int(os.getenv("REFRESH_INTERVAL", default=1500)),
+    jitter=int(os.getenv("REFRESH_JITTER", default=300)),
+    per_school_concurrency=int(os.getenv("REFRESH_CONCURRENCY_PER_SCHOOL", default=4)),
+    idle_timeout=int(os.getenv("SUBSCRIPTION_IDLE_TIMEOUT", default=2 * 24 * 3600)),
+)
+
+def calendar_response_parts(cache_key, entry, options, request_headers):
+    """
+    (status, headers, body) for a cached calendar, shared by the Flask and
+    ASGI apps. ``request_headers`` is looked up with lowercase names.
+    """
+    encoding = negotiate(request_headers.get('accept-encoding'), len(entry.body))
+    headers = entry.headers(encoding)
+    headers['Vary'] = 'Accept-Encoding'
+    if entry.is_not_modified(request_headers.get('if-none-match'), request_headers.get('if-modified-since')):
+        return 304, headers, b''
+
+    content_type, filename = CALENDAR_FORMATS[options.get('format', 'ics')]
+    headers['Content-Type'] = content_type
+    headers['Content-Disposition'] = f'attachment; filename={filename}'
+    if encoding is None:
+        return 200, headers, entry.body
+    headers['Content-Encoding'] = encoding
+    return 200, headers, calendar_cache.encoded_body(cache_key, entry, encoding)
+
+def calendar_response(cache_key, entry, options):
+    status, headers, body = calendar_response_parts(cache_key, entry, options, request.headers)
+    return Response(body, status=status, headers=headers)
+
 @app.route('/class', methods=['GET'])
 def get_academic_calendar():
     school = request.args.get('school', default='xauat')
-    username = request.args.get('username')
-    password = request.args.get('password') or request.args.get('passwd')
-    filter_type = request.args.get('filter')
-    
-    if not username or not password:
-        return "缺少用户名或密码", 400
-    
+    trace = start_trace(metric_school(school))
+    response = app.make_response(serve_calendar(school))
+
+    REQUESTS.inc(trace.school, str(response.status_code))
+    REQUEST_SECONDS.observe(time.perf_counter() - trace.started, trace.school)
+    if SERVER_TIMING:
+        response.headers['Server-Timing'] = trace.server_timing()
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+def serve_calendar(school):
     try:
-        service = AcademicCalendarService(school, username, password)
-        
-        event_filter = None
-        if filter_type == 'future':
-            current_time = datetime.now()
-            event_filter = lambda event: event['start'] > current_time
-        elif filter_type == 'no_classroom':
-            event_filter = lambda event: event.get('roomZh', '') != '未知地点'
-        
-        calendar_data = service.generate_calendar(event_filter)
-        
-        if calendar_data is None:
-            return "认证失败", 401
-        
-        response = Response(calendar_data, mimetype='text/calendar')
-        response.headers['Content-Disposition'] = 'attachment; filename=calendar.ics'
-        return response
+        school, username, secret, options, cache_key = resolve_calendar_request(request.args)
+    except SubscriptionNotFound as e:
+        return str(e), 404
     except ValueError as e:
         return str(e), 400
+    current_trace().school = metric_school(school)
+
+    # Serve the last good render straight away and let the scheduler bring
+    # it up to date in the background if it has gone stale.
+    entry = calendar_cache.get(cache_key, secret, allow_stale=True)
+    if entry is not None:
+        fresh = entry.is_fresh()
+        CACHE_LOOKUPS.inc('hit' if fresh else 'stale')
+        refresh_scheduler.touch(cache_key, school, username, secret, options)
+        if not fresh:
+            refresh_scheduler.refresh_async(cache_key)
+        return calendar_response(cache_key, entry, options)
+
+    CACHE_LOOKUPS.inc('miss')
+    try:
+        credentials = unlock_subscription(username, secret)
+        if credentials is None:
+            return "认证失败", 401
+        entry = render_calendar(cache_key, school, *credentials, options, secret=secret)
+    except TooManyWaiters:
+        return "请求过多，请稍后再试", 503, {'Retry-After': '5'}
+    except UpstreamUnavailable as e:
+        # Failing fast: the school's circuit breaker is open or its queue is full
+        return "教务系统暂时不可用", 503, {'Retry-After': str(int(e.retry_after or 5) + 1)}
+    except Exception as e:
+        print(f"Failed to build calendar for {school}: {e}")
+        return "教务系统暂时不可用", 503
+
+    if entry is None:
+        return "认证失败", 401
+
+    refresh_scheduler.touch(cache_key, school, username, secret, options, refreshed=True)
+    return calendar_response(cache_key, entry, options)
+
+def subscribe_parts(fields, base_url):
+    """
+    Check the credentials in ``fields`` by building the calendar once, then
+    save them in the vault. Returns (status, headers, body) with the token
+    URL, for the Flask and ASGI apps.
+    """
+    if credential_vault is None:
+        return 503, {}, "订阅功能未启用"
+    school = (fields.get('school') or 'xauat').lower()
+    username = fields.get('username')
+    password = fields.get('password') or fields.get('passwd')
+    if not username or not password:
+        return 400, {}, "缺少用户名或密码"
+    try:
+        AcademicSystemClientFactory.client_class(school)
+        options = parse_calendar_options(fields)
+    except ValueError as e:
+        return 400, {}, str(e)
+
+    token = None
+    try:
+        token = credential_vault.create(school, username, password, options)
+        subscription = credential_vault.lookup(token)
+        cache_key = make_subscriber_cache_key(school, subscription.subscriber_id, options)
+        # Also warms the cache for the first poll
+        entry = render_calendar(cache_key, school, username, password, options, secret=token)
+    except TooManyWaiters:
+        entry = False
+    except Exception as e:
+        print(f"Failed to create subscription for {school}: {e}")
+        entry = False
+    if not entry:
+        if token is not None:
+            credential_vault.revoke(token)
+        if entry is None:
+            return 401, {}, "认证失败"
+        return 503, {}, "教务系统暂时不可用"
+
+    refresh_scheduler.touch(cache_key, school, None, token, options, refreshed=True)
+    body = json.dumps({'token': token, 'url': f"{base_url.rstrip('/')}/class?token={token}"})
+    return 201, {'Content-Type': 'application/json'}, body
+
+def unsubscribe_parts(token):
+    if credential_vault is None or not token or not credential_vault.revoke(token):
+        return 404, {}, "订阅不存在或已取消"
+    return 204, {}, ""
+
+@app.route('/subscribe', methods=['POST'])
+def subscribe():
+    # Credentials only in the body, never in a URL
+    fields = request.get_json(silent=True) if request.is_json else request.form.to_dict()
+    status, headers, body = subscribe_parts(fields or {}, request.host_url)
+    return Response(body, status=status, headers=headers)
+
+@app.route('/subscribe', methods=['DELETE'])
+def unsubscribe():
+    status, headers, body = unsubscribe_parts(request.args.get('token') or request.form.get('token'))
+    return Response(body, status=status, headers=headers)
 
 if __name__ == '__main__':
     app.run(debug=True)
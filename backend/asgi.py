@@ -0,0 +1,184 @@
+"""
+ASGI entry point serving /class with the same contract as the Flask app.
+
+Cache hits in memory are answered on the event loop. Everything that
+touches disk or decrypts (restoring a render from the timetable store,
+vault lookups and unlocking token subscriptions, first compressions) runs
+in a worker thread, and cache misses log in and fetch through the clients'
+httpx methods, so a slow disk or academic system ties up a thread or a
+coroutine instead of the loop. The calendar cache, session pool and
+refresh scheduler are shared with app.py; background refreshes keep running
+on the scheduler's threads.
+
+    uvicorn asgi:app --port 5001
+"""
+import asyncio
+import json
+import time
+from urllib.parse import parse_qsl
+from academic_calendar_service import AcademicCalendarService
+from calendar_cache import credential_digest
+from compression import negotiate
+from single_flight import TooManyWaiters
+from school.upstream_policy import UpstreamUnavailable
+from metrics import registry, start_trace, SERVER_TIMING, REQUESTS, REQUEST_SECONDS, CACHE_LOOKUPS
+from app import (calendar_cache, calendar_flights, refresh_scheduler, resolve_calendar_request,
+                 unlock_subscription, SubscriptionNotFound, subscribe_parts, unsubscribe_parts,
+                 render_timetable, timetable_args, calendar_response_parts, metric_school, _FLIGHT_SALT)
+
+async def render_calendar(cache_key, school, username, password, options, secret=None):
+    """Async version of app.render_calendar."""
+    secret = secret or password
+
+    async def render():
+        previous = await cached_entry(cache_key, secret)
+        service = await AcademicCalendarService.acreate(school, username, password)
+        timetable = await service.aload_timetable(**timetable_args(options))
+        if timetable is None:
+            return None
+        calendar_data = await asyncio.to_thread(render_timetable, timetable, options, previous)
+        return await asyncio.to_thread(calendar_cache.put, cache_key, secret, calendar_data,
+                                       timetable.revision, timetable.semester)
+
+    flight_key = cache_key + (credential_digest(secret, _FLIGHT_SALT),)
+    return await calendar_flights.ado(flight_key, render)
+
+async def resolve_request(args):
+    if args.get('token'):
+        # Token subscriptions are looked up in the vault (SQLite)
+        return await asyncio.to_thread(resolve_calendar_request, args)
+    return resolve_calendar_request(args)
+
+async def cached_entry(cache_key, secret):
+    """calendar_cache.get(..., allow_stale=True), going to the store off the event loop."""
+    entry = calendar_cache.get(cache_key, secret, allow_stale=True, restore=False)
+    if entry is None and calendar_cache.store is not None:
+        entry = await asyncio.to_thread(calendar_cache.get, cache_key, secret, True)
+    return entry
+
+async def response_parts(cache_key, entry, options, headers):
+    encoding = negotiate(headers.get('accept-encoding'), len(entry.body))
+    if encoding is not None and encoding not in entry.encoded:
+        # Compressing a body the first time is CPU work, keep it off the event loop
+        return await asyncio.to_thread(calendar_response_parts, cache_key, entry, options, headers)
+    return calendar_response_parts(cache_key, entry, options, headers)
+
+async def get_academic_calendar(args, headers, trace):
+    try:
+        school, username, secret, options, cache_key = await resolve_request(args)
+    except SubscriptionNotFound as e:
+        return 404, {}, str(e)
+    except ValueError as e:
+        return 400, {}, str(e)
+    trace.school = metric_school(school)
+
+    entry = await cached_entry(cache_key, secret)
+    if entry is not None:
+        fresh = entry.is_fresh()
+        CACHE_LOOKUPS.inc('hit' if fresh else 'stale')
+        refresh_scheduler.touch(cache_key, school, username, secret, options)
+        if not fresh:
+            refresh_scheduler.refresh_async(cache_key)
+        return await response_parts(cache_key, entry, options, headers)
+
+    CACHE_LOOKUPS.inc('miss')
+    try:
+        # Decrypting a token subscription reads the vault
+        credentials = (await asyncio.to_thread(unlock_subscription, username, secret) if username is None
+                       else (username, secret))
+        if credentials is None:
+            return 401, {}, "认证失败"
+        entry = await render_calendar(cache_key, school, *credentials, options, secret=secret)
+    except TooManyWaiters:
+        return 503, {'Retry-After': '5'}, "请求过多，请稍后再试"
+    except UpstreamUnavailable as e:
+        return 503, {'Retry-After': str(int(e.retry_after or 5) + 1)}, "教务系统暂时不可用"
+    except Exception as e:
+        print(f"Failed to build calendar for {school}: {e}")
+        return 503, {}, "教务系统暂时不可用"
+
+    if entry is None:
+        return 401, {}, "认证失败"
+
+    refresh_scheduler.touch(cache_key, school, username, secret, options, refreshed=True)
+    return await response_parts(cache_key, entry, options, headers)
+
+async def read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            return b''.join(chunks)
+
+async def subscribe(scope, receive, args, headers):
+    """POST /subscribe with a JSON or form body, DELETE /subscribe?token=..."""
+    if scope['method'] == 'DELETE':
+        return unsubscribe_parts(args.get('token'))
+
+    body = (await read_body(receive)).decode('utf-8', errors='replace')
+    if headers.get('content-type', '').startswith('application/json'):
+        try:
+            fields = json.loads(body or '{}')
+        except ValueError:
+            fields = {}
+    else:
+        fields = dict(parse_qsl(body, keep_blank_values=True))
+    base_url = f"{scope.get('scheme', 'http')}://{headers.get('host', 'localhost')}/"
+    # Logging in and the vault write block, keep them off the event loop
+    return await asyncio.to_thread(subscribe_parts, fields if isinstance(fields, dict) else {}, base_url)
+
+async def send_response(send, status, headers, body, head=False):
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+        headers.setdefault('Content-Type', 'text/html; charset=utf-8')
+    headers['Content-Length'] = str(len(body))
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers.items()],
+    })
+    await send({'type': 'http.response.body', 'body': b'' if head else body})
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            refresh_scheduler.stop()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+    if scope['type'] != 'http':
+        return
+
+    if scope['path'] == '/metrics':
+        return await send_response(send, 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'},
+                                   registry.render(), head=scope['method'] == 'HEAD')
+    if scope['path'] not in ('/class', '/subscribe'):
+        return await send_response(send, 404, {}, "Not Found")
+    allowed = ('GET', 'HEAD') if scope['path'] == '/class' else ('POST', 'DELETE')
+    if scope['method'] not in allowed:
+        return await send_response(send, 405, {'Allow': ', '.join(allowed)}, "Method Not Allowed")
+
+    # Like request.args, the first value of a repeated parameter wins
+    args = {}
+    for name, value in parse_qsl(scope['query_string'].decode('latin-1'), keep_blank_values=True):
+        args.setdefault(name, value)
+    headers = {name.decode('latin-1'): value.decode('latin-1') for name, value in scope['headers']}
+
+    if scope['path'] == '/subscribe':
+        status, response_headers, body = await subscribe(scope, receive, args, headers)
+        return await send_response(send, status, response_headers, body)
+
+    trace = start_trace(metric_school(args.get('school', 'xauat')))
+    status, response_headers, body = await get_academic_calendar(args, headers, trace)
+    REQUESTS.inc(trace.school, str(status))
+    REQUEST_SECONDS.observe(time.perf_counter() - trace.started, trace.school)
+    if SERVER_TIMING:
+        response_headers['Server-Timing'] = trace.server_timing()
+    await send_response(send, status, response_headers, body, head=scope['method'] == 'HEAD')
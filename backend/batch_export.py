@@ -0,0 +1,402 @@
+"""
+Export the calendars of many students at once, e.g. a counselor exporting a
+whole cohort, without going through /class once per student.
+
+Credentials come from a CSV file with a ``school,username,password`` header
+or from JSON lines with the same keys ("-" reads stdin; a missing school
+falls back to --school). Students are exported on a bounded worker pool,
+with a rate limit and a concurrency cap per school so a big cohort doesn't
+hammer one academic system:
+
+    python batch_export.py students.csv --out-dir calendars/
+    python batch_export.py students.csv --tar cohort.tar --rate xauat=1 --workers 16
+    python batch_export.py - --combined cohort.ics --mode rrule < students.jsonl
+
+Results are written as they arrive: one .ics per student in a directory or
+tarball, or all events in one combined feed. Finished students are recorded
+in a progress file, so an interrupted run picks up where it stopped with
+--resume. Failures go to an errors file, one JSON line per student, and are
+retried by the next --resume.
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import re
+import sys
+import tarfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import date
+from academic_calendar_service import AcademicCalendarService, AcademicSystemClientFactory, MAX_SEMESTERS
+from calendar_generator import CalendarGenerator, CALENDAR_PROPERTIES, RECURRENCE_MODES
+from calendar_cache import hash_username
+import ics_writer
+
+COMBINED_PROPERTIES = tuple((name, '课程表（批量导出）' if name == 'X-WR-CALNAME' else value)
+                            for name, value in CALENDAR_PROPERTIES)
+
+
+class RateLimiter:
+    """Spaces calls out to at most ``rate`` per second (no limit when rate <= 0)."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            wait_for = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if wait_for > 0:
+            time.sleep(wait_for)
+
+
+class SchoolThrottle:
+    """A RateLimiter and a concurrency cap per school."""
+
+    def __init__(self, rates, default_rate, concurrency):
+        self.rates = rates
+        self.default_rate = default_rate
+        self.concurrency = concurrency
+        self._limiters = {}
+        self._slots = {}
+        self._lock = threading.Lock()
+
+    def limits(self, school):
+        with self._lock:
+            if school not in self._limiters:
+                self._limiters[school] = RateLimiter(self.rates.get(school, self.default_rate))
+                self._slots[school] = threading.BoundedSemaphore(self.concurrency)
+            return self._limiters[school], self._slots[school]
+
+
+class Credential:
+    __slots__ = ('school', 'username', 'password')
+
+    def __init__(self, school, username, password):
+        self.school = school.lower()
+        self.username = username
+        self.password = password
+
+    @property
+    def key(self):
+        return f"{self.school}/{self.username}"
+
+
+def read_credentials(stream, default_school):
+    """Yield Credentials from CSV or JSON lines, without reading the whole input first."""
+    first = stream.readline()
+    if not first:
+        return
+    if first.lstrip().startswith('{'):
+        lines = (line for line in _chain(first, stream) if line.strip())
+        rows = (json.loads(line) for line in lines)
+    else:
+        rows = csv.DictReader(_chain(first, stream))
+    for number, row in enumerate(rows, 1):
+        username, password = (row.get('username') or '').strip(), row.get('password') or row.get('passwd')
+        if not username or not password:
+            print(f"Skipping credential #{number}: missing username or password", file=sys.stderr)
+            continue
+        yield Credential((row.get('school') or default_school).strip(), username, password)
+
+
+def _chain(first, stream):
+    yield first
+    yield from stream
+
+
+def safe_name(value):
+    return re.sub(r'[^\w.-]', '_', value) or '_'
+
+
+class Progress:
+    """
+    Append-only record of finished students. Each line carries the output
+    size after that student was written, so a tarball or combined feed can
+    be cut back to the last complete entry on resume.
+    """
+
+    def __init__(self, path, resume):
+        self.path = path
+        self.done = set()
+        self.offset = None
+        if resume and os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # A line cut short by a crash
+                        continue
+                    self.done.add(record['key'])
+                    self.offset = record.get('offset')
+        self._file = open(path, 'a' if resume else 'w', encoding='utf-8')
+
+    def record(self, key, offset=None):
+        self.done.add(key)
+        self._file.write(json.dumps({'key': key, 'offset': offset}) + '\n')
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class ErrorLog:
+    def __init__(self, path, resume):
+        self.path = path
+        self._file = open(path, 'a' if resume else 'w', encoding='utf-8')
+
+    def record(self, credential, error):
+        self._file.write(json.dumps({
+            'school': credential.school,
+            'username': credential.username,
+            'error': error,
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        }, ensure_ascii=False) + '\n')
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class DirectoryOutput:
+    """One <school>/<username>.ics per student, each written atomically."""
+    combined = False
+
+    def __init__(self, path, offset=None):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def write(self, credential, data):
+        directory = os.path.join(self.path, safe_name(credential.school))
+        os.makedirs(directory, exist_ok=True)
+        target = os.path.join(directory, safe_name(credential.username) + '.ics')
+        with open(target + '.tmp', 'wb') as f:
+            f.write(data)
+        os.replace(target + '.tmp', target)
+        return None
+
+    def close(self):
+        pass
+
+
+class TarOutput:
+    """The same layout as DirectoryOutput inside a tarball (.tar, .tar.gz/.tgz)."""
+    combined = False
+
+    def __init__(self, path, offset=None):
+        compressed = path.endswith(('.gz', '.tgz'))
+        if offset is not None:
+            if compressed:
+                raise ValueError("A compressed tarball can't be resumed, export to a .tar instead")
+            # Drop anything after the last complete member and end the archive
+            # there again; append mode then writes over the end blocks
+            with open(path, 'r+b') as f:
+                f.truncate(offset)
+                f.seek(offset)
+                f.write(tarfile.NUL * tarfile.BLOCKSIZE * 2)
+            self.tar = tarfile.open(path, 'a')
+        else:
+            self.tar = tarfile.open(path, 'w:gz' if compressed else 'w')
+
+    def write(self, credential, data):
+        info = tarfile.TarInfo(f"{safe_name(credential.school)}/{safe_name(credential.username)}.ics")
+        info.size = len(data)
+        info.mtime = int(time.time())
+        info.mode = 0o644
+        self.tar.addfile(info, io.BytesIO(data))
+        self.tar.fileobj.flush()
+        return self.tar.offset
+
+    def close(self):
+        self.tar.close()
+
+
+class CombinedOutput:
+    """A single feed with the events of every student."""
+    combined = True
+
+    def __init__(self, path, offset=None):
+        if offset is not None:
+            self.file = open(path, 'r+b')
+            self.file.truncate(offset)
+            self.file.seek(offset)
+        else:
+            self.file = open(path, 'wb')
+            self.file.write(ics_writer.calendar_header(COMBINED_PROPERTIES))
+            self.file.flush()
+
+    def write(self, credential, data):
+        self.file.write(data)
+        self.file.flush()
+        return self.file.tell()
+
+    def close(self):
+        self.file.write(ics_writer.CALENDAR_FOOTER)
+        self.file.close()
+
+
+def export_one(credential, options, throttle, combined):
+    """
+    Log in, fetch and render one student. Returns the bytes to write, or
+    None if the login failed; upstream errors propagate.
+    """
+    limiter, slots = throttle.limits(credential.school)
+    with slots:
+        limiter.acquire()
+        client = AcademicSystemClientFactory.client_class(credential.school)(credential.username, credential.password)
+        service = AcademicCalendarService(credential.school, credential.username, credential.password,
+                                          client=client, pooled=False)
+        timetable = service.load_timetable(options['semesters'], options['date_range'])
+    if timetable is None:
+        return None
+
+    event_filter = AcademicCalendarService.create_event_filter(options['filter'])
+    if not combined:
+        return CalendarGenerator.create_calendar(timetable.courses, timetable.exams, event_filter, options['mode'])
+
+    # UIDs are only unique per student, so they get a per-student prefix
+    # in the shared feed; header and footer are written once by the output
+    prefix = hash_username(credential.school, credential.username)[:16]
+    for event in timetable.exams + list(timetable.courses):
+        if event.get('uid'):
+            event['uid'] = f"{prefix}-{event['uid']}"
+    chunks = list(CalendarGenerator.stream_calendar(timetable.courses, timetable.exams, event_filter,
+                                                    options['mode']))
+    return b''.join(chunks[1:-1])
+
+
+def run_export(credentials, output, progress, errors, options, throttle, workers):
+    """Export everything not yet in ``progress``; returns (exported, failed, skipped)."""
+    exported = failed = skipped = 0
+    pending = {}
+    # Only a bounded window of students is in flight, so a huge input file
+    # is streamed rather than queued up front
+    window = workers * 2
+
+    def collect(futures):
+        nonlocal exported, failed
+        for future in futures:
+            credential = pending.pop(future)
+            try:
+                data = future.result()
+            except Exception as e:
+                print(f"Failed to export {credential.key}: {e}", file=sys.stderr)
+                errors.record(credential, str(e) or type(e).__name__)
+                failed += 1
+                continue
+            if data is None:
+                errors.record(credential, "认证失败")
+                failed += 1
+                continue
+            progress.record(credential.key, output.write(credential, data))
+            exported += 1
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batch-export") as executor:
+        for credential in credentials:
+            if credential.key in progress.done:
+                skipped += 1
+                continue
+            try:
+                AcademicSystemClientFactory.client_class(credential.school)
+            except ValueError as e:
+                errors.record(credential, str(e))
+                failed += 1
+                continue
+            while len(pending) >= window:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+            pending[executor.submit(export_one, credential, options, throttle, output.combined)] = credential
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            collect(done)
+    return exported, failed, skipped
+
+
+def parse_rates(values):
+    rates = {}
+    for value in values:
+        school, _, rate = value.partition('=')
+        if not rate:
+            raise argparse.ArgumentTypeError(f"Expected SCHOOL=RATE, got {value!r}")
+        rates[school.strip().lower()] = float(rate)
+    return rates
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('input', help='credential file (CSV or JSON lines), "-" for stdin')
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--out-dir', help="write <school>/<username>.ics files into this directory")
+    target.add_argument('--tar', help="write the .ics files into a tarball (.tar, .tar.gz)")
+    target.add_argument('--combined', help="write one feed with every student's events")
+    parser.add_argument('--school', default='xauat', help="school of rows that don't name one")
+    parser.add_argument('--mode', default='expanded', choices=RECURRENCE_MODES)
+    parser.add_argument('--filter', default=None, choices=('future', 'no_classroom'))
+    parser.add_argument('--semesters', default=None, help="comma separated semester ids")
+    parser.add_argument('--start', type=date.fromisoformat, default=None, help="first day to export (YYYY-MM-DD)")
+    parser.add_argument('--end', type=date.fromisoformat, default=None, help="last day to export (YYYY-MM-DD)")
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--rate', action='append', default=[], metavar='SCHOOL=RATE',
+                        help="logins per second for one school, may be repeated")
+    parser.add_argument('--default-rate', type=float, default=2.0, help="logins per second for other schools")
+    parser.add_argument('--per-school-concurrency', type=int, default=4)
+    parser.add_argument('--progress', default=None, help="progress file (default: <output>.progress.jsonl)")
+    parser.add_argument('--errors', default=None, help="error report (default: <output>.errors.jsonl)")
+    parser.add_argument('--resume', action='store_true', help="skip students finished by an earlier run")
+    args = parser.parse_args(argv)
+
+    semesters = [s.strip() for s in (args.semesters or '').split(',') if s.strip()] or None
+    if semesters and len(semesters) > MAX_SEMESTERS:
+        parser.error(f"at most {MAX_SEMESTERS} semesters can be exported")
+    if args.start and args.end and args.start > args.end:
+        parser.error("--start must not be after --end")
+    options = {
+        'mode': args.mode,
+        'filter': args.filter,
+        'semesters': semesters,
+        'date_range': (args.start, args.end) if args.start or args.end else None,
+    }
+    try:
+        throttle = SchoolThrottle(parse_rates(args.rate), args.default_rate, args.per_school_concurrency)
+    except (argparse.ArgumentTypeError, ValueError) as e:
+        parser.error(str(e))
+
+    output_path = (args.out_dir or args.tar or args.combined).rstrip('/')
+    output_class = DirectoryOutput if args.out_dir else TarOutput if args.tar else CombinedOutput
+    progress = Progress(args.progress or output_path + '.progress.jsonl', args.resume)
+    errors = ErrorLog(args.errors or output_path + '.errors.jsonl', args.resume)
+    resuming = args.resume and bool(progress.done) and os.path.exists(output_path)
+    try:
+        output = output_class(output_path, progress.offset if resuming else None)
+    except ValueError as e:
+        parser.error(str(e))
+
+    started = time.perf_counter()
+    stream = sys.stdin if args.input == '-' else open(args.input, encoding='utf-8-sig', newline='')
+    try:
+        exported, failed, skipped = run_export(read_credentials(stream, args.school), output, progress, errors,
+                                               options, throttle, max(1, args.workers))
+    finally:
+        output.close()
+        progress.close()
+        errors.close()
+        if stream is not sys.stdin:
+            stream.close()
+
+    print(f"exported {exported}, failed {failed}, skipped {skipped} in {time.perf_counter() - started:.1f}s")
+    if failed:
+        print(f"errors written to {errors.path}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,178 @@
+"""
+Drive /class at a fixed concurrency and report latency percentiles,
+throughput and the server's peak RSS.
+
+By default a mock upstream (bench.mock_upstream) and the server are both
+started locally, so the numbers only depend on this code:
+
+    python -m bench.load_test --server wsgi --concurrency 16 --requests 2000 --users 50
+    python -m bench.load_test --server asgi --latency 0.2 --lessons 30
+    python -m bench.load_test --server none --target http://127.0.0.1:5001
+
+With ``--users`` smaller than ``--requests`` most requests are cache hits;
+``--no-cache`` makes every request a miss.
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from bench.mock_upstream import MockUpstream
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SERVER_COMMANDS = {
+    'wsgi': [sys.executable, '-c',
+             'import logging, os; from app import app; logging.getLogger("werkzeug").setLevel(logging.WARNING); '
+             'app.run(host="127.0.0.1", port=int(os.environ["PORT"]), threaded=True)'],
+    'asgi': [sys.executable, '-m', 'uvicorn', 'asgi:app', '--host', '127.0.0.1', '--log-level', 'warning'],
+}
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def peak_rss_kb(pid):
+    """VmHWM of a running process on Linux, None elsewhere."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+    return None
+
+
+def start_server(kind, port, env):
+    command = list(SERVER_COMMANDS[kind])
+    if kind == 'asgi':
+        command += ['--port', str(port)]
+    process = subprocess.Popen(command, cwd=BACKEND_DIR, env={**os.environ, **env, 'PORT': str(port)})
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{kind} server exited with {process.returncode}")
+        try:
+            requests.get(f"http://127.0.0.1:{port}/class", timeout=1)
+            return process
+        except requests.RequestException:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"{kind} server did not start on port {port}")
+
+
+def run_load(target, school, concurrency, total, users, mode, timeout):
+    local = threading.local()
+    latencies = []
+    statuses = Counter()
+    lock = threading.Lock()
+
+    def one(i):
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = requests.Session()
+        params = {'school': school, 'username': f"bench{i % users}", 'password': 'secret', 'mode': mode}
+        started = time.perf_counter()
+        try:
+            status = session.get(f"{target}/class", params=params, timeout=timeout).status_code
+        except requests.RequestException as e:
+            status = type(e).__name__
+        elapsed = time.perf_counter() - started
+        with lock:
+            latencies.append(elapsed)
+            statuses[status] += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(total)))
+    wall = time.perf_counter() - started
+    return sorted(latencies), statuses, wall
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--server', choices=('wsgi', 'asgi', 'none'), default='wsgi',
+                        help="server to start, or 'none' to load an already running --target")
+    parser.add_argument('--target', default=None, help="base URL of the server under test")
+    parser.add_argument('--port', type=int, default=5099)
+    parser.add_argument('--school', default='xauat', choices=('xauat', 'nwafu'))
+    parser.add_argument('--mode', default='expanded')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--users', type=int, default=50, help="distinct usernames cycled through")
+    parser.add_argument('--timeout', type=float, default=60)
+    parser.add_argument('--no-cache', action='store_true', help="set CALENDAR_CACHE_TTL=0 on the server")
+    parser.add_argument('--latency', type=float, default=0.0, help="mock upstream delay per request")
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--lessons', type=int, default=12)
+    parser.add_argument('--weeks', type=int, default=18)
+    parser.add_argument('--json', action='store_true', help="print the report as JSON")
+    args = parser.parse_args()
+
+    upstream = None
+    server = None
+    target = args.target
+    if args.server != 'none':
+        upstream = MockUpstream(latency=args.latency, jitter=args.jitter,
+                                lessons=args.lessons, weeks=args.weeks).start()
+        env = {**upstream.environ(), 'TIMETABLE_DB': '', 'PYTHONUNBUFFERED': '1'}
+        if args.no_cache:
+            env['CALENDAR_CACHE_TTL'] = '0'
+            env['CALENDAR_CACHE_MAX_STALE'] = '0'
+        server = start_server(args.server, args.port, env)
+        target = f"http://127.0.0.1:{args.port}"
+    elif target is None:
+        parser.error("--target is required with --server none")
+
+    rss = None
+    try:
+        latencies, statuses, wall = run_load(target, args.school, args.concurrency, args.requests,
+                                             args.users, args.mode, args.timeout)
+        rss = peak_rss_kb(server.pid) if server is not None else None
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+            if rss is None:
+                # ru_maxrss is in kB on Linux, bytes on macOS
+                rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+                if sys.platform == 'darwin':
+                    rss //= 1024
+        if upstream is not None:
+            upstream_calls = sum(upstream.stats().values())
+            upstream.stop()
+
+    report = {
+        'server': args.server,
+        'school': args.school,
+        'requests': len(latencies),
+        'concurrency': args.concurrency,
+        'statuses': {str(status): count for status, count in statuses.items()},
+        'rps': len(latencies) / wall if wall else 0.0,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p95_ms': percentile(latencies, 0.95) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'max_ms': (latencies[-1] if latencies else 0.0) * 1000,
+        'peak_rss_mb': rss / 1024 if rss else None,
+        'upstream_requests': upstream_calls if upstream is not None else None,
+    }
+    if args.json:
+        print(json.dumps(report))
+        return
+    for name, value in report.items():
+        print(f"{name:>18}: {value:.2f}" if isinstance(value, float) else f"{name:>18}: {value}")
+
+
+if __name__ == '__main__':
+    main()
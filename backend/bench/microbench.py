@@ -0,0 +1,89 @@
+"""
+Microbenchmarks for the CPU-bound steps of a calendar build, on the same
+synthetic timetables the mock upstream serves.
+
+    python -m bench.microbench --lessons 12 --weeks 18 --repeat 20
+"""
+import argparse
+import statistics
+import time
+from calendar_generator import CalendarGenerator
+from school.xauat.xauat_client import XAUATAcademicSystemClient
+from school.nwafu.nwafu_client import NWAFUAcademicSystemClient
+from bench.mock_upstream import xauat_schedule, xauat_exam_page, nwafu_rows, login_page, NWAFU_SEMESTER, FIRST_WEEK
+from datetime import datetime
+
+
+def measure(fn, repeat, number=1):
+    """Returns per-call times in seconds, one per repeat."""
+    fn()
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(number):
+            fn()
+        times.append((time.perf_counter() - started) / number)
+    return times
+
+
+def xauat_client(lessons, weeks):
+    client = XAUATAcademicSystemClient('bench', 'secret', autologin=False)
+    client.course_details = xauat_schedule(lessons, weeks)
+    return client
+
+
+def nwafu_client(lessons, weeks):
+    client = NWAFUAcademicSystemClient('bench', 'secret', autologin=False)
+    client.courses = nwafu_rows(lessons, weeks)
+    client.current_semester = NWAFU_SEMESTER
+    client.first_week_date = datetime.combine(FIRST_WEEK, datetime.min.time()).timestamp()
+    return client
+
+
+def benchmarks(lessons, weeks):
+    xauat = xauat_client(lessons, weeks)
+    nwafu = nwafu_client(lessons, weeks)
+    courses = xauat.process_course_data()
+    exams = []
+    exam_page = xauat_exam_page()
+    cas_page = login_page()
+
+    def render(serializer, recurrence):
+        def run():
+            CalendarGenerator.SERIALIZER = serializer
+            CalendarGenerator.create_calendar(courses, exams, None, recurrence)
+        return run
+
+    return [
+        ("xauat process_course_data", xauat.process_course_data),
+        ("nwafu process_course_data", nwafu.process_course_data),
+        ("xauat parse_exams", lambda: XAUATAcademicSystemClient.parse_exams(exam_page)),
+        ("nwafu parse_salt_and_execution", lambda: NWAFUAcademicSystemClient.parse_salt_and_execution(cas_page)),
+        ("create_calendar fast/expanded", render('fast', 'expanded')),
+        ("create_calendar fast/rrule", render('fast', 'rrule')),
+        ("create_calendar icalendar/expanded", render('icalendar', 'expanded')),
+        ("create_calendar icalendar/rrule", render('icalendar', 'rrule')),
+    ], len(courses)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--lessons', type=int, default=12)
+    parser.add_argument('--weeks', type=int, default=18)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--number', type=int, default=5, help="calls per timed repeat")
+    args = parser.parse_args()
+
+    serializer = CalendarGenerator.SERIALIZER
+    try:
+        cases, occurrences = benchmarks(args.lessons, args.weeks)
+        print(f"{args.lessons} lessons x {args.weeks} weeks = {occurrences} class occurrences")
+        for name, fn in cases:
+            times = measure(fn, args.repeat, args.number)
+            print(f"{name:<38} min {min(times) * 1000:8.3f} ms   median {statistics.median(times) * 1000:8.3f} ms")
+    finally:
+        CalendarGenerator.SERIALIZER = serializer
+
+
+if __name__ == '__main__':
+    main()
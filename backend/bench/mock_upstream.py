@@ -0,0 +1,277 @@
+"""
+Local stand-in for the XAUAT and NWAFU academic systems.
+
+Serves just enough of both sites for the clients to log in and fetch a
+synthetic timetable, with a configurable delay per request. XAUAT lives
+under /student, NWAFU's authserver and ehall share the root, so both
+schools can be pointed at one server:
+
+    XAUAT_BASE_URL=http://127.0.0.1:8900/student
+    NWAFU_AUTH_URL=NWAFU_EHALL_URL=http://127.0.0.1:8900
+
+Any password works except BAD_PASSWORD. GET /__stats returns the number of
+requests served per path.
+
+    python -m bench.mock_upstream --port 8900 --latency 0.05 --lessons 12
+"""
+import argparse
+import base64
+import hashlib
+import json
+import random
+import threading
+import time
+from collections import Counter
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+from Crypto.Cipher import AES
+
+BAD_PASSWORD = "wrong"
+SALT = "mockSalt12345678"
+XAUAT_SEMESTER = "301"
+NWAFU_SEMESTER = "2024-2025-1"
+FIRST_WEEK = date(2024, 9, 9)
+
+XAUAT_SLOTS = [(800, 940), (1000, 1140), (1400, 1540), (1600, 1740), (1900, 2040)]
+NWAFU_SLOTS = [(1, 2), (3, 4), (6, 7), (8, 9), (11, 12)]
+
+
+def xauat_schedule(lessons=12, weeks=18, seed=0):
+    """The /ws/schedule-table/datum result for ``lessons`` courses, each held once or twice a week."""
+    rng = random.Random(seed)
+    lesson_list, schedule_list = [], []
+    for lesson_id in range(1, lessons + 1):
+        lesson_list.append({'id': lesson_id, 'courseName': f"课程{lesson_id}"})
+        slots = rng.sample([(day, slot) for day in range(5) for slot in XAUAT_SLOTS], rng.choice((1, 2)))
+        first_week, last_week = rng.randint(1, 4), rng.randint(weeks - 4, weeks)
+        for week in range(first_week, last_week + 1):
+            for day, (start, end) in slots:
+                schedule_list.append({
+                    'lessonId': lesson_id,
+                    'date': (FIRST_WEEK + timedelta(weeks=week - 1, days=day)).isoformat(),
+                    'startTime': start,
+                    'endTime': end,
+                    'room': {'nameZh': f"教{lesson_id % 7}-{100 + lesson_id}"},
+                    'personName': f"教师{lesson_id}",
+                })
+    return {'lessonList': lesson_list, 'scheduleList': schedule_list, 'scheduleGroupList': []}
+
+
+def xauat_exam_page(exams=6):
+    rows = []
+    for i in range(exams):
+        day = (FIRST_WEEK + timedelta(weeks=17, days=i % 5)).isoformat()
+        rows.append({
+            'course': {'nameZh': f"课程{i + 1}"},
+            'examGroup': {'examTime': {'dateTimeString': f"{day} 09:00~11:00"}},
+            'examPlace': {'room': {'nameZh': f"考场{i + 1}"}},
+            'seatNo': str(i + 1),
+        })
+    return f"<script>\nvar studentExamInfoVms = {json.dumps(rows, ensure_ascii=False)};\n</script>"
+
+
+def nwafu_rows(lessons=12, weeks=18, seed=0):
+    """cxxszhxqkb rows with the SKZC week bitmap the NWAFU client expands."""
+    rng = random.Random(seed)
+    rows = []
+    for lesson_id in range(1, lessons + 1):
+        for day, (first, last) in rng.sample([(day, slot) for day in range(1, 6) for slot in NWAFU_SLOTS],
+                                             rng.choice((1, 2))):
+            bitmap = "".join("1" if rng.random() < 0.85 else "0" for _ in range(weeks))
+            rows.append({
+                'XNXQDM': NWAFU_SEMESTER,
+                'KCH': f"K{lesson_id:04d}",
+                'KCM': f"课程{lesson_id}",
+                'SKJS': f"教师{lesson_id}",
+                'JASDM': f"{lesson_id % 7}-{100 + lesson_id}",
+                'KSJC': first,
+                'JSJC': last,
+                'SKZC': bitmap,
+                'SKXQ': str(day),
+            })
+    return rows
+
+
+def login_page():
+    return (f'<form id="pwdFromId"><input type="hidden" id="pwdEncryptSalt" value="{SALT}"/>'
+            f'<input type="hidden" name="execution" id="execution" value="e1s1"/></form>')
+
+
+def _xauat_password_hash(password):
+    return hashlib.sha1(f"{SALT}-{password}".encode('utf-8')).hexdigest()
+
+
+def _nwafu_password(encrypted):
+    # The client prefixes 64 random characters, so the unknown IV only
+    # garbles the part that is thrown away
+    data = AES.new(SALT.encode('utf-8'), AES.MODE_CBC, b"\0" * 16).decrypt(base64.b64decode(encrypted))
+    return data[64:-data[-1]].decode('utf-8', errors='replace')
+
+
+class MockUpstream:
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, jitter=0.0, lessons=12, weeks=18, exams=6):
+        self.latency = latency
+        self.jitter = jitter
+        self.counts = Counter()
+        self._lock = threading.Lock()
+        # Everything a student sees is the same, so render it once
+        self.xauat_datum = json.dumps({'result': xauat_schedule(lessons, weeks)}, ensure_ascii=False).encode('utf-8')
+        self.xauat_exams = xauat_exam_page(exams).encode('utf-8')
+        self.xauat_lesson_ids = json.dumps({'lessonIds': list(range(1, lessons + 1))}).encode('utf-8')
+        rows = nwafu_rows(lessons, weeks)
+        self.nwafu_courses = json.dumps({'datas': {'cxxszhxqkb': {'rows': rows}}}, ensure_ascii=False).encode('utf-8')
+        self.server = ThreadingHTTPServer((host, port), self._handler_class())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def environ(self):
+        """Environment variables that point both clients at this server."""
+        return {
+            'XAUAT_BASE_URL': f"{self.url}/student",
+            'NWAFU_AUTH_URL': self.url,
+            'NWAFU_EHALL_URL': self.url,
+        }
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name="mock-upstream", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counts)
+
+    def _handler_class(self):
+        upstream = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                self.route('GET')
+
+            def do_POST(self):
+                self.route('POST')
+
+            def route(self, method):
+                path = urlsplit(self.path).path
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length) if length else b''
+                if path == '/__stats':
+                    return self.reply(200, json.dumps(upstream.stats()).encode('utf-8'), 'application/json')
+
+                with upstream._lock:
+                    upstream.counts[path] += 1
+                delay = upstream.latency + random.uniform(0, upstream.jitter)
+                if delay > 0:
+                    time.sleep(delay)
+                handler = ROUTES.get((method, path))
+                if handler is None:
+                    return self.reply(404, b'not found', 'text/plain')
+                handler(self, upstream, body)
+
+            def logged_in(self):
+                return 'session=ok' in (self.headers.get('Cookie') or '')
+
+            def reply(self, status, body=b'', content_type='text/html; charset=utf-8', headers=()):
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                for name, value in headers:
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def json(self, data):
+                payload = data if isinstance(data, bytes) else json.dumps(data, ensure_ascii=False).encode('utf-8')
+                self.reply(200, payload, 'application/json; charset=utf-8')
+
+        return Handler
+
+
+def _xauat_login(handler, upstream, body):
+    ok = json.loads(body or b'{}').get('password') != _xauat_password_hash(BAD_PASSWORD)
+    headers = [('Set-Cookie', 'session=ok; Path=/')] if ok else []
+    handler.reply(200, json.dumps({'result': ok}).encode('utf-8'), 'application/json', headers)
+
+
+def _xauat_course_table(handler, upstream, body):
+    if not handler.logged_in():
+        return handler.reply(302, headers=[('Location', '/student/login')])
+    handler.reply(200, f'<select><option selected" value="{XAUAT_SEMESTER}">2024-2025-1</option></select>'.encode('utf-8'))
+
+
+def _nwafu_login_page(handler, upstream, body):
+    handler.reply(200, login_page().encode('utf-8'))
+
+
+def _nwafu_login(handler, upstream, body):
+    form = parse_qs(body.decode('utf-8'))
+    if _nwafu_password(form['password'][0]) == BAD_PASSWORD:
+        return handler.reply(401, b'bad credentials')
+    handler.reply(200, b'ok', headers=[('Set-Cookie', 'session=ok; Path=/')])
+
+
+def _nwafu_task_count(handler, upstream, body):
+    if not handler.logged_in():
+        return handler.reply(302, headers=[('Location', '/authserver/login')])
+    handler.json({'code': '0', 'data': 0})
+
+
+JWAPP = "/jwapp/sys"
+
+ROUTES = {
+    ('GET', '/student/login-salt'): lambda h, u, b: h.reply(200, SALT.encode('utf-8'), 'text/plain'),
+    ('POST', '/student/login'): _xauat_login,
+    ('GET', '/student/for-std/course-table'): _xauat_course_table,
+    ('GET', '/student/for-std/course-table/get-data'): lambda h, u, b: h.json(u.xauat_lesson_ids),
+    ('POST', '/student/ws/schedule-table/datum'): lambda h, u, b: h.json(u.xauat_datum),
+    ('GET', '/student/for-std/exam-arrange'): lambda h, u, b: h.reply(200, u.xauat_exams),
+    ('GET', '/authserver/login'): _nwafu_login_page,
+    ('POST', '/authserver/login'): _nwafu_login,
+    ('POST', '/taskcenterapp/sys/taskCenter/taskNew/getMyProcessCount.do'): _nwafu_task_count,
+    ('GET', f"{JWAPP}/funauthapp/api/getAppConfig/wdkbby-5959167891382285.do"): lambda h, u, b: h.json({}),
+    ('POST', f"{JWAPP}/wdkbby/modules/jshkcb/dqxnxq.do"):
+        lambda h, u, b: h.json({'datas': {'dqxnxq': {'rows': [{'DM': NWAFU_SEMESTER}]}}}),
+    ('POST', f"{JWAPP}/wdkbby/modules/xskcb/cxxljc.do"):
+        lambda h, u, b: h.json({'datas': {'cxxljc': {'rows': [{'XQKSRQ': f"{FIRST_WEEK} 00:00:00"}]}}}),
+    ('POST', f"{JWAPP}/wdkbby/modules/xskcb/xsdkkc.do"): lambda h, u, b: h.json({'datas': {'xsdkkc': {'rows': []}}}),
+    ('POST', f"{JWAPP}/wdkbby/modules/xskcb/cxxszhxqkb.do"): lambda h, u, b: h.json(u.nwafu_courses),
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8900)
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument('--jitter', type=float, default=0.0, help="extra random delay of up to this many seconds")
+    parser.add_argument('--lessons', type=int, default=12)
+    parser.add_argument('--weeks', type=int, default=18)
+    parser.add_argument('--exams', type=int, default=6)
+    args = parser.parse_args()
+
+    upstream = MockUpstream(args.host, args.port, args.latency, args.jitter, args.lessons, args.weeks, args.exams)
+    for name, value in upstream.environ().items():
+        print(f"{name}={value}")
+    try:
+        upstream.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
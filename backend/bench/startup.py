@@ -0,0 +1,104 @@
+"""
+Cold-start cost: how long a fresh interpreter takes to import a server
+entry point, and then to load a school's client on the first request.
+
+Every repeat runs in a new process, since a warm interpreter has already
+paid for its imports. Heavy dependencies loaded by the import alone,
+before any school is used, are listed, so a module-level import that
+creeps back in shows up.
+
+    python -m bench.startup
+    python -m bench.startup --module asgi --school nwafu --repeat 20
+    python -m bench.startup --module app --top 15
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Only needed once a school is used, or by the ASGI server
+HEAVY_MODULES = ('requests', 'httpx', 'icalendar', 'Crypto', 'school.nwafu.encrypt',
+                 'school.xauat.xauat_client', 'school.nwafu.nwafu_client')
+
+PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import {module}
+imported = time.perf_counter()
+heavy = [name for name in {heavy!r} if name in sys.modules]
+from school.registry import school_registry
+for school in {schools!r}:
+    school_registry.load(school)
+loaded = time.perf_counter()
+print(json.dumps({{
+    'import': imported - started,
+    'schools': loaded - imported,
+    'modules': len(sys.modules),
+    'heavy': heavy,
+}}))
+"""
+
+
+def probe(module, schools, env):
+    code = PROBE.format(module=module, schools=list(schools), heavy=HEAVY_MODULES)
+    out = subprocess.run([sys.executable, '-c', code], cwd=BACKEND_DIR, env=env,
+                         capture_output=True, text=True, check=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def slowest_imports(module, env, top):
+    """The ``top`` imports with the largest cumulative time, from -X importtime."""
+    err = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'], cwd=BACKEND_DIR,
+                         env=env, capture_output=True, text=True, check=True).stderr
+    rows = []
+    for line in err.splitlines():
+        parts = line.split('|')
+        if len(parts) == 3 and parts[1].strip().isdigit():
+            rows.append((int(parts[1]), parts[2].strip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--module', action='append', help="entry point to import (default: app and asgi)")
+    parser.add_argument('--school', action='append', default=[], help="school adapter loaded after the import")
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--top', type=int, default=0, help="also list the N slowest imports")
+    parser.add_argument('--json', action='store_true', help="print the report as JSON")
+    args = parser.parse_args()
+
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE='1', SCHOOL_PRELOAD='')
+    report = {}
+    for module in args.module or ['app', 'asgi']:
+        runs = [probe(module, args.school, env) for _ in range(args.repeat)]
+        imports = [run['import'] for run in runs]
+        schools = [run['schools'] for run in runs]
+        report[module] = {
+            'import_median_ms': statistics.median(imports) * 1000,
+            'import_min_ms': min(imports) * 1000,
+            'schools_median_ms': statistics.median(schools) * 1000,
+            'modules': runs[-1]['modules'],
+            'heavy_loaded': runs[-1]['heavy'],
+        }
+        if args.top:
+            report[module]['slowest'] = [(name, us / 1000) for us, name in slowest_imports(module, env, args.top)]
+
+    if args.json:
+        print(json.dumps(report))
+        return
+    for module, result in report.items():
+        print(f"{module}: import median {result['import_median_ms']:.1f} ms, min {result['import_min_ms']:.1f} ms, "
+              f"{result['modules']} modules")
+        if args.school:
+            print(f"  + {', '.join(args.school)}: median {result['schools_median_ms']:.1f} ms")
+        print(f"  heavy modules loaded: {', '.join(result['heavy_loaded']) or 'none'}")
+        for name, ms in result.get('slowest', ()):
+            print(f"  {ms:8.1f} ms  {name}")
+
+
+if __name__ == '__main__':
+    main()
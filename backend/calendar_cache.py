@@ -0,0 +1,245 @@
+import hashlib
+import hmac
+import os
+import threading
+import time
+from collections import OrderedDict
+from email.utils import formatdate, parsedate_to_datetime
+from compression import compress
+
+
+def hash_username(school, username):
+    return hashlib.sha256(f"{school.lower()}:{username}".encode('utf-8')).hexdigest()
+
+
+def make_cache_key(school, username, options=None):
+    return make_subscriber_cache_key(school, hash_username(school, username), options)
+
+
+def make_subscriber_cache_key(school, subscriber_id, options=None):
+    # Token subscriptions are keyed by their subscriber id instead of a username hash
+    variant = tuple(sorted((options or {}).items()))
+    return (school.lower(), subscriber_id, variant)
+
+
+def credential_digest(password, salt, secret=b''):
+    # With a server-side ``secret`` in the key, a digest on its own (say, read
+    # from the timetable store) can't be brute-forced back into the password
+    return hmac.new(secret + salt, password.encode('utf-8'), hashlib.sha256).digest()
+
+
+class CachedCalendar:
+    __slots__ = ('body', 'etag', 'last_modified', 'created', 'expires',
+                 'credential_salt', 'credential_digest', 'revision', 'encoded')
+
+    def __init__(self, body, etag, last_modified, created, expires, credential_salt, credential_digest,
+                 revision=None):
+        self.body = body
+        self.etag = etag
+        self.last_modified = last_modified
+        self.created = created
+        self.expires = expires
+        self.credential_salt = credential_salt
+        self.credential_digest = credential_digest
+        # Timetable revision the body was rendered from (see TimetableHistory)
+        self.revision = revision
+        # Compressed copies of body by Content-Encoding, filled in on first use
+        self.encoded = {}
+
+    @property
+    def size(self):
+        return len(self.body) + sum(len(body) for body in self.encoded.values())
+
+    def is_fresh(self, now=None):
+        return (now or time.time()) < self.expires
+
+    def age(self, now=None):
+        return (now or time.time()) - self.created
+
+    def check_password(self, password, secret=b''):
+        digest = credential_digest(password, self.credential_salt, secret)
+        return hmac.compare_digest(digest, self.credential_digest)
+
+    def variant_etag(self, encoding=None):
+        # A compressed body is another representation, so it gets its own strong ETag
+        return f'{self.etag[:-1]}-{encoding}"' if encoding else self.etag
+
+    def headers(self, encoding=None, now=None):
+        # Only the freshness left, so a stale render served while it is being
+        # refreshed (max-age=0) isn't kept by clients for another full TTL
+        max_age = max(0, int(self.expires - (now or time.time())))
+        return {
+            'ETag': self.variant_etag(encoding),
+            'Last-Modified': formatdate(self.last_modified, usegmt=True),
+            'Cache-Control': f'private, max-age={max_age}',
+        }
+
+    def is_not_modified(self, if_none_match=None, if_modified_since=None):
+        # If-None-Match 优先于 If-Modified-Since (RFC 7232 §6)
+        if if_none_match:
+            for tag in if_none_match.split(','):
+                tag = tag.strip()
+                if tag.startswith('W/'):
+                    tag = tag[2:]
+                # Any encoding of the same body counts, see variant_etag
+                if '-' in tag and tag.endswith('"'):
+                    tag = tag[:tag.rindex('-')] + '"'
+                if tag == '*' or tag == self.etag:
+                    return True
+            return False
+        if if_modified_since:
+            try:
+                since = parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+            return int(self.last_modified) <= since
+        return False
+
+
+class CalendarCache:
+    """
+    LRU cache of rendered calendar bodies (and their compressed copies) with
+    a TTL and a total size bound.
+
+    Entries are keyed on (school, username hash, calendar options) and remember a salted
+    digest of the password they were built with, so a poll with a different
+    password never gets someone else's calendar.
+
+    Expired entries are kept for up to ``max_stale`` seconds so they can still
+    be served while a refresh is running or the school's system is down.
+
+    With a ``store`` (see TimetableStore) every render is written through to
+    disk and misses are looked up there, so a new process starts warm. The
+    password digests are keyed with ``secret``, which is never stored; without
+    a configured secret renders aren't persisted, since a per-process one
+    couldn't check them after a restart.
+    """
+
+    def __init__(self, ttl=1800, max_entries=1024, max_bytes=64 * 1024 * 1024, max_stale=7 * 24 * 3600,
+                 store=None, secret=None):
+        self.ttl = ttl
+        self.max_stale = max_stale
+        if store is not None and secret is None:
+            print("CALENDAR_CACHE_SECRET is not set, rendered calendars are not persisted")
+            store = None
+        self.store = store
+        self._secret = secret or os.urandom(32)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def total_bytes(self):
+        return self._total_bytes
+
+    def get(self, key, password, allow_stale=False, restore=True):
+        # restore=False only looks in memory, never at the store (see asgi.cached_entry)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None and restore:
+            entry = self._restore(key)
+        if entry is None:
+            return None
+        with self._lock:
+            # A concurrent put or eviction may have replaced or dropped the
+            # entry since it was read; only touch the slot if it is still ours
+            current = self._entries.get(key) is entry
+            if now >= entry.expires + self.max_stale:
+                if current:
+                    self._remove(key)
+                return None
+            # 过期条目留在缓存中直到被淘汰，重建后内容不变时可沿用其 Last-Modified
+            if not allow_stale and not entry.is_fresh(now):
+                return None
+            if current:
+                self._entries.move_to_end(key)
+        if not entry.check_password(password, self._secret):
+            return None
+        return entry
+
+    def put(self, key, password, body, revision=None, semester=None):
+        now = time.time()
+        etag = f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+        with self._lock:
+            previous = self._entries.get(key)
+            # 内容未变化时保留原来的 Last-Modified，客户端的条件请求才能命中
+            if previous is not None and previous.etag == etag:
+                last_modified = previous.last_modified
+            else:
+                last_modified = now
+            salt = os.urandom(16)
+            entry = CachedCalendar(body, etag, last_modified, now, now + self.ttl,
+                                   salt, credential_digest(password, salt, self._secret), revision)
+            if previous is not None:
+                self._remove(key)
+            if entry.size <= self.max_bytes:
+                self._entries[key] = entry
+                self._total_bytes += entry.size
+                self._evict()
+        if self.store is not None:
+            self.store.save_artifact(key, entry, semester)
+        return entry
+
+    def encoded_body(self, key, entry, encoding):
+        """
+        ``entry``'s body compressed with ``encoding``. It is compressed on the
+        first request for that encoding and kept with the entry, counted
+        against max_bytes like the body.
+        """
+        body = entry.encoded.get(encoding)
+        if body is not None:
+            return body
+        body = compress(entry.body, encoding)
+        with self._lock:
+            if encoding not in entry.encoded:
+                entry.encoded[encoding] = body
+                # Entries already evicted (or never admitted) aren't counted
+                if self._entries.get(key) is entry:
+                    self._total_bytes += len(body)
+                    self._evict()
+        return body
+
+    def invalidate(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+        # 否则重启后又会从 store 恢复出来
+        if self.store is not None:
+            self.store.delete_artifact(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._total_bytes = 0
+
+    def _restore(self, key):
+        if self.store is None:
+            return None
+        stored = self.store.load_artifact(key)
+        if stored is None:
+            return None
+        # Freshness is counted from when it was rendered, so a warm start
+        # serves old renders as stale and refreshes them right away
+        entry = CachedCalendar(expires=stored['created'] + self.ttl, **stored)
+        with self._lock:
+            if key in self._entries:
+                return self._entries[key]
+            self._entries[key] = entry
+            self._total_bytes += entry.size
+            self._evict()
+        return entry
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._total_bytes -= entry.size
+
+    def _evict(self):
+        while self._entries and (len(self._entries) > self.max_entries or self._total_bytes > self.max_bytes):
+            key = next(iter(self._entries))
+            self._remove(key)
@@ -1,50 +1,235 @@
-from icalendar import Calendar, Event, Alarm, vDatetime
 from datetime import timedelta
+import json
+import os
+import ics_writer
+import jcal_writer
+from recurrence import compress_occurrences
+from metrics import stage, EVENTS_RENDERED, CALENDAR_BYTES
+
+CALENDAR_PROPERTIES = (
+    ('X-WR-CALNAME', '课程表'),
+    ('X-APPLE-CALENDAR-COLOR', '#540EB9'),
+    ('X-WR-TIMEZONE', 'Asia/Shanghai'),
+)
+
+EXAM_ALARM = ics_writer.AlarmTemplate(30)
+COURSE_ALARM = ics_writer.AlarmTemplate(15)
+
+# 'expanded' writes one VEVENT per class, 'rrule' one weekly series per
+# course slot with EXDATE/RDATE exceptions
+RECURRENCE_MODES = ('expanded', 'rrule')
+
+# Output formats of /class: (Content-Type, download file name). 'json' is
+# the compact timetable of create_timetable_json, 'jcal' is RFC 7265.
+CALENDAR_FORMATS = {
+    'ics': ('text/calendar; charset=utf-8', 'calendar.ics'),
+    'json': ('application/json; charset=utf-8', 'calendar.json'),
+    'jcal': ('application/calendar+json; charset=utf-8', 'calendar.json'),
+}
+
+def format_minutes(value):
+    return value.isoformat(timespec='minutes')
 
 class CalendarGenerator:
+    # 'fast' streams RFC 5545 directly, 'icalendar' builds the object tree,
+    # 'verify' renders both and checks that they are equivalent.
+    SERIALIZER = os.getenv("ICS_SERIALIZER", default="fast")
+
+    @staticmethod
+    def create_calendar(courses, exams, event_filter=None, recurrence='expanded', calendar_format='ics'):
+        with stage('render'):
+            if calendar_format == 'json':
+                data = CalendarGenerator.create_timetable_json(courses, exams, event_filter)
+            elif calendar_format == 'jcal':
+                data = jcal_writer.calendar(CALENDAR_PROPERTIES, CalendarGenerator.calendar_events(
+                    courses, exams, event_filter, recurrence))
+            else:
+                data = CalendarGenerator.serialize(courses, exams, event_filter, recurrence)
+        CALENDAR_BYTES.inc(calendar_format, recurrence, amount=len(data))
+        return data
+
+    @staticmethod
+    def serialize(courses, exams, event_filter=None, recurrence='expanded'):
+        serializer = CalendarGenerator.SERIALIZER
+        if serializer == 'icalendar':
+            return CalendarGenerator.create_icalendar(courses, exams, event_filter, recurrence)
+
+        courses, exams = list(courses), list(exams)
+        data = b''.join(CalendarGenerator.stream_calendar(courses, exams, event_filter, recurrence))
+        if serializer == 'verify':
+            expected = CalendarGenerator.create_icalendar(courses, exams, event_filter, recurrence, count=False)
+            if not ics_writer.calendars_equivalent(data, expected):
+                print("Warning: fast ICS serializer output differs from icalendar, using icalendar output")
+                return expected
+        return data
+
+    @staticmethod
+    def stream_calendar(courses, exams, event_filter=None, recurrence='expanded'):
+        """Yield the calendar as byte chunks, one per event."""
+        yield ics_writer.calendar_header(CALENDAR_PROPERTIES)
+        for event in CalendarGenerator.calendar_events(courses, exams, event_filter, recurrence):
+            yield ics_writer.event_chunk(**event)
+        yield ics_writer.CALENDAR_FOOTER
+
+    @staticmethod
+    def calendar_events(courses, exams, event_filter=None, recurrence='expanded'):
+        """
+        Yield the events of the calendar, exams first, as keyword arguments
+        of ics_writer.event_chunk (and jcal_writer.event_component).
+        """
+        exam_count = course_count = 0
+
+        filtered_exams = filter(event_filter, exams) if event_filter else exams
+        for exam in filtered_exams:
+            exam_count += 1
+            yield {
+                'uid': exam.get('uid') or f"exam-{exam['course']}-{exam['start'].isoformat()}",
+                'start': exam['start'],
+                'end': exam['end'],
+                'summary': f"{exam['course']}考试",
+                'description': f"考试时间: {exam['time']}",
+                'location': f"教室: {exam['room']} 座位号: {exam['seat_no']}",
+                'alarm': EXAM_ALARM,
+                'alarm_description': f"{exam['course']}考试即将开始！",
+                'sequence': exam.get('sequence'),
+                'last_modified': exam.get('lastModified'),
+            }
+
+        if recurrence == 'rrule':
+            # Grouped before filtering, so series UIDs don't depend on the filter
+            filtered_courses = compress_occurrences(courses, event_filter)
+        else:
+            filtered_courses = filter(event_filter, courses) if event_filter else courses
+        for course in filtered_courses:
+            course_count += 1
+            yield {
+                'uid': course.get('uid') or f"course-{course['lessonId']}-{course['start'].isoformat()}",
+                'start': course['start'],
+                'end': course['end'],
+                'summary': course['courseName'],
+                'description': course['personName'],
+                'location': course['roomZh'],
+                'alarm': COURSE_ALARM,
+                'alarm_description': f"{course['courseName']}课程在{course['roomZh']}即将开始！",
+                'count': course.get('count', 1),
+                'exdates': course.get('exdates'),
+                'rdates': course.get('rdates'),
+                'sequence': course.get('sequence'),
+                'last_modified': course.get('lastModified'),
+            }
+
+        EVENTS_RENDERED.inc('exam', recurrence, amount=exam_count)
+        EVENTS_RENDERED.inc('course', recurrence, amount=course_count)
+
+    @staticmethod
+    def create_timetable_json(courses, exams, event_filter=None):
+        """
+        A compact JSON timetable for the web frontend: every course slot once,
+        with the [start, end] of each of its classes, instead of a VEVENT and
+        VALARM per class.
+        """
+        slots = {}
+        filtered_courses = filter(event_filter, courses) if event_filter else courses
+        for course in filtered_courses:
+            slot_key = (course['lessonId'], course['courseName'], course['personName'], course['roomZh'])
+            slot = slots.get(slot_key)
+            if slot is None:
+                slot = slots[slot_key] = {
+                    'id': course['lessonId'],
+                    'name': course['courseName'],
+                    'teacher': course['personName'],
+                    'room': course['roomZh'],
+                    'times': [],
+                }
+            slot['times'].append([format_minutes(course['start']), format_minutes(course['end'])])
+
+        for slot in slots.values():
+            slot['times'].sort()
+
+        filtered_exams = filter(event_filter, exams) if event_filter else exams
+        timetable = {
+            'courses': list(slots.values()),
+            'exams': [{
+                'course': exam['course'],
+                'start': format_minutes(exam['start']),
+                'end': format_minutes(exam['end']),
+                'time': exam['time'],
+                'room': exam['room'],
+                'seat': exam['seat_no'],
+            } for exam in filtered_exams],
+        }
+        return json.dumps(timetable, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+    @staticmethod
+    def add_revision(event, item):
+        if item.get('sequence') is not None:
+            event.add('SEQUENCE', item['sequence'])
+        if item.get('lastModified') is not None:
+            event.add('LAST-MODIFIED', item['lastModified'])
+
     @staticmethod
-    def create_calendar(courses, exams, event_filter=None):
+    def create_icalendar(courses, exams, event_filter=None, recurrence='expanded', count=True):
+        # Only the 'icalendar' and 'verify' serializers need the library
+        from icalendar import Calendar, Event, Alarm, vDatetime
+
         cal = Calendar()
-        cal.add('X-WR-CALNAME', '课程表')
-        cal.add('X-APPLE-CALENDAR-COLOR', '#540EB9')
-        cal.add('X-WR-TIMEZONE', 'Asia/Shanghai')
+        for name, value in CALENDAR_PROPERTIES:
+            cal.add(name, value)
+        exam_count = course_count = 0
 
         # Filter exams if event_filter is provided
         filtered_exams = filter(event_filter, exams) if event_filter else exams
         for exam in filtered_exams:
+            exam_count += 1
             event = Event()
-            event.add('UID', f"exam-{exam['course']}-{exam['start'].isoformat()}")
+            event.add('UID', exam.get('uid') or f"exam-{exam['course']}-{exam['start'].isoformat()}")
             event.add('DTSTART', vDatetime(exam['start']))
             event.add('DTEND', vDatetime(exam['end']))
             event.add('SUMMARY', f"{exam['course']}考试")
             event.add('DESCRIPTION', f"考试时间: {exam['time']}")
             event.add('LOCATION', f"教室: {exam['room']} 座位号: {exam['seat_no']}")
-            
+            CalendarGenerator.add_revision(event, exam)
+
             alarm = Alarm()
             alarm.add('ACTION', 'DISPLAY')
             alarm.add('DESCRIPTION', f"{exam['course']}考试即将开始！")
             alarm.add('TRIGGER', timedelta(minutes=-30))
             event.add_component(alarm)
-            
+
             cal.add_component(event)
 
         # Filter courses if event_filter is provided
-        filtered_courses = filter(event_filter, courses) if event_filter else courses
+        if recurrence == 'rrule':
+            # Grouped before filtering, so series UIDs don't depend on the filter
+            filtered_courses = compress_occurrences(courses, event_filter)
+        else:
+            filtered_courses = filter(event_filter, courses) if event_filter else courses
         for course in filtered_courses:
+            course_count += 1
             event = Event()
-            event.add('UID', f"course-{course['lessonId']}-{course['start'].isoformat()}")
+            event.add('UID', course.get('uid') or f"course-{course['lessonId']}-{course['start'].isoformat()}")
             event.add('DTSTART', vDatetime(course['start']))
             event.add('DTEND', vDatetime(course['end']))
+            if course.get('count', 1) > 1:
+                event.add('RRULE', {'FREQ': 'WEEKLY', 'COUNT': course['count']})
+            if course.get('exdates'):
+                event.add('EXDATE', course['exdates'])
+            if course.get('rdates'):
+                event.add('RDATE', course['rdates'])
             event.add('SUMMARY', course['courseName'])
             event.add('DESCRIPTION', course['personName'])
             event.add('LOCATION', course['roomZh'])
-            
+            CalendarGenerator.add_revision(event, course)
+
             alarm = Alarm()
             alarm.add('ACTION', 'DISPLAY')
             alarm.add('DESCRIPTION', f"{course['courseName']}课程在{course['roomZh']}即将开始！")
             alarm.add('TRIGGER', timedelta(minutes=-15))
             event.add_component(alarm)
-            
+
             cal.add_component(event)
 
+        if count:
+            EVENTS_RENDERED.inc('exam', recurrence, amount=exam_count)
+            EVENTS_RENDERED.inc('course', recurrence, amount=course_count)
         return cal.to_ical()
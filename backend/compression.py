@@ -0,0 +1,78 @@
+"""
+Content-Encoding negotiation for rendered calendars.
+
+A semester calendar is hundreds of KB of very repetitive text, so gzip and
+brotli shrink it several times over. Compressed bodies are cached next to
+the rendered one (see CalendarCache.encoded_body), so a body is compressed
+once per encoding rather than on every poll. Brotli is optional: without
+the ``brotli`` package only gzip is offered.
+"""
+import gzip
+import os
+
+# Smaller bodies (error pages, empty calendars) are sent as they are
+MIN_SIZE = int(os.getenv("COMPRESS_MIN_BYTES", default=1024))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", default=6))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", default=6))
+
+_brotli = None
+
+
+def brotli_module():
+    """The brotli module, or None if it isn't installed."""
+    global _brotli
+    if _brotli is None:
+        try:
+            import brotli
+        except ImportError:
+            brotli = False
+        _brotli = brotli
+    return _brotli or None
+
+
+def supported_encodings():
+    # In order of preference when the client accepts several equally
+    return ('br', 'gzip') if brotli_module() else ('gzip',)
+
+
+def parse_accept_encoding(header):
+    """{coding: q} of an Accept-Encoding header, e.g. 'gzip, br;q=0.8' -> {'gzip': 1.0, 'br': 0.8}"""
+    accepted = {}
+    for item in (header or '').split(','):
+        coding, _, params = item.partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(';'):
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[coding] = q
+    return accepted
+
+
+def negotiate(accept_encoding, size):
+    """The coding to send a ``size``-byte body with, or None for identity."""
+    if size < MIN_SIZE or not accept_encoding:
+        return None
+    accepted = parse_accept_encoding(accept_encoding)
+    wildcard = accepted.get('*', 0.0)
+    best, best_q = None, 0.0
+    for coding in supported_encodings():
+        q = accepted.get(coding, wildcard)
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def compress(body, encoding):
+    if encoding == 'gzip':
+        # mtime=0: the same body always compresses to the same bytes
+        return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+    if encoding == 'br':
+        return brotli_module().compress(body, quality=BROTLI_QUALITY)
+    raise ValueError(f"Unsupported encoding: {encoding}")
@@ -0,0 +1,204 @@
+"""
+Encrypted credentials behind token subscription URLs.
+
+POST /subscribe stores a student's credentials here and hands out an opaque
+token; /class?token=... then never carries the password again. Each row is
+sealed with AES-GCM under a key derived from the vault key and the token
+itself, and only a hash of the token is stored, so neither a copy of the
+database nor the vault key alone is enough to recover a password.
+
+Unlike the timetable store this is not a cache: it lives in its own SQLite
+file and is never rebuilt.
+"""
+import base64
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import sqlite3
+import tempfile
+import threading
+import time
+from timetable_store import create_private_file
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS subscriptions (
+    token_hash TEXT PRIMARY KEY,
+    school TEXT NOT NULL,
+    options TEXT NOT NULL,
+    nonce BLOB NOT NULL,
+    ciphertext BLOB NOT NULL,
+    tag BLOB NOT NULL,
+    created REAL NOT NULL,
+    last_used REAL NOT NULL
+)
+"""
+
+# last_used is only rewritten this often, so polls stay read-only
+TOUCH_INTERVAL = 24 * 3600
+
+
+def token_hash(token):
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+
+class VaultSubscription:
+    __slots__ = ('subscriber_id', 'school', 'options')
+
+    def __init__(self, subscriber_id, school, options):
+        # Stable id for cache keys; it is derived from the token, not the username
+        self.subscriber_id = subscriber_id
+        self.school = school
+        self.options = options
+
+
+class CredentialVault:
+    def __init__(self, path, key):
+        if len(key) != 32:
+            raise ValueError("The credential vault key must be 32 bytes")
+        self.path = path
+        self._key = key
+        self._local = threading.local()
+        self._connection().execute(SCHEMA)
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _cipher(self, token, nonce=None):
+        from Crypto.Cipher import AES
+
+        # A per-token key: without the token a row can't be decrypted
+        key = hmac.new(self._key, token.encode('utf-8'), hashlib.sha256).digest()
+        return AES.new(key, AES.MODE_GCM, nonce=nonce)
+
+    def create(self, school, username, password, options=None):
+        """Store the credentials and return the new subscription token."""
+        token = secrets.token_urlsafe(24)
+        hashed = token_hash(token)
+        cipher = self._cipher(token)
+        cipher.update(hashed.encode('utf-8'))
+        plaintext = json.dumps({'username': username, 'password': password}).encode('utf-8')
+        ciphertext, tag = cipher.encrypt_and_digest(plaintext)
+        now = time.time()
+        self._connection().execute(
+            "INSERT INTO subscriptions VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (hashed, school.lower(), json.dumps(options or {}), cipher.nonce, ciphertext, tag, now, now))
+        return token
+
+    def lookup(self, token):
+        """The subscription of ``token`` without decrypting anything, or None."""
+        hashed = token_hash(token)
+        row = self._connection().execute(
+            "SELECT school, options, last_used FROM subscriptions WHERE token_hash = ?", (hashed,)).fetchone()
+        if row is None:
+            return None
+        school, options, last_used = row
+        now = time.time()
+        if now - last_used > TOUCH_INTERVAL:
+            self._connection().execute("UPDATE subscriptions SET last_used = ? WHERE token_hash = ?", (now, hashed))
+        return VaultSubscription(f"token-{hashed[:32]}", school, json.loads(options))
+
+    def credentials(self, token):
+        """(username, password) of ``token``, or None if it is unknown or the row doesn't decrypt."""
+        hashed = token_hash(token)
+        row = self._connection().execute(
+            "SELECT nonce, ciphertext, tag FROM subscriptions WHERE token_hash = ?", (hashed,)).fetchone()
+        if row is None:
+            return None
+        nonce, ciphertext, tag = row
+        cipher = self._cipher(token, nonce)
+        cipher.update(hashed.encode('utf-8'))
+        try:
+            data = json.loads(cipher.decrypt_and_verify(ciphertext, tag))
+        except ValueError as e:
+            print(f"Failed to decrypt subscription credentials: {e}")
+            return None
+        return data['username'], data['password']
+
+    def revoke(self, token):
+        cursor = self._connection().execute("DELETE FROM subscriptions WHERE token_hash = ?", (token_hash(token),))
+        return cursor.rowcount > 0
+
+
+class VaultConfigError(RuntimeError):
+    pass
+
+
+def in_temp_dir(path):
+    temp = os.path.realpath(tempfile.gettempdir())
+    return os.path.realpath(path).startswith(temp + os.sep)
+
+
+def create_key_file(key_path):
+    """
+    The key in ``key_path``, creating it first if it doesn't exist. The key
+    is written to a private temporary file and linked into place, which
+    fails if the file already exists, so concurrent workers never read a
+    half-written key: whoever loses the race reads the winner's.
+    """
+    directory = os.path.dirname(os.path.abspath(key_path))
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".vault-key-")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(secrets.token_bytes(32))
+            f.flush()
+            os.fsync(f.fileno())
+        try:
+            os.link(temp_path, key_path)
+            print(f"Created credential vault key {key_path}")
+        except FileExistsError:
+            pass
+    finally:
+        os.unlink(temp_path)
+    with open(key_path, 'rb') as f:
+        return f.read()
+
+
+def load_vault_key(path):
+    """
+    CREDENTIAL_VAULT_KEY (base64, 32 bytes), or else the key in
+    CREDENTIAL_VAULT_KEY_FILE, created on first use. The key file must be
+    configured explicitly and kept apart from the vault, otherwise a copy
+    of the vault directory would carry its own key.
+    """
+    configured = os.getenv("CREDENTIAL_VAULT_KEY")
+    if configured:
+        return base64.urlsafe_b64decode(configured + '=' * (-len(configured) % 4))
+
+    key_path = os.getenv("CREDENTIAL_VAULT_KEY_FILE")
+    if not key_path:
+        raise VaultConfigError("CREDENTIAL_VAULT_DB is set but neither CREDENTIAL_VAULT_KEY "
+                               "nor CREDENTIAL_VAULT_KEY_FILE is")
+    if os.path.dirname(os.path.realpath(key_path)) == os.path.dirname(os.path.realpath(path)):
+        raise VaultConfigError(f"CREDENTIAL_VAULT_KEY_FILE must not be next to the vault: {key_path}")
+    if in_temp_dir(key_path):
+        raise VaultConfigError(f"CREDENTIAL_VAULT_KEY_FILE must be persistent, not in the temp directory: {key_path}")
+    return create_key_file(key_path)
+
+
+def open_default_vault():
+    """
+    The vault at CREDENTIAL_VAULT_DB, or None if it isn't set (token
+    subscriptions are off then). A vault that is configured but can't be
+    opened stops the process: starting without it would quietly break
+    every subscription token already handed out.
+    """
+    path = os.getenv("CREDENTIAL_VAULT_DB", default="")
+    if not path:
+        return None
+    if in_temp_dir(path):
+        raise VaultConfigError(f"CREDENTIAL_VAULT_DB must be persistent, not in the temp directory: {path}")
+    try:
+        create_private_file(path)
+        return CredentialVault(path, load_vault_key(path))
+    except (OSError, ValueError, sqlite3.Error) as e:
+        raise VaultConfigError(f"Failed to open credential vault {path}: {e}") from e
+
+
+credential_vault = open_default_vault()
@@ -0,0 +1,142 @@
+"""
+Direct RFC 5545 writer for the calendars built by CalendarGenerator.
+
+Instead of building an icalendar object tree per event, each VEVENT is
+formatted straight into bytes and yielded as one chunk, so a whole semester
+can be streamed into a Flask ``Response`` or written to disk as it is made.
+"""
+from datetime import timezone
+
+CRLF = "\r\n"
+
+# RFC 5545 §3.3.11 TEXT escaping, applied with a single str.translate pass
+_TEXT_ESCAPES = str.maketrans({
+    "\\": "\\\\",
+    ";": "\\;",
+    ",": "\\,",
+    "\n": "\\n",
+})
+
+
+def escape_text(value):
+    value = str(value)
+    if "\r" in value:
+        value = value.replace("\r\n", "\n").replace("\r", "\n")
+    return value.translate(_TEXT_ESCAPES)
+
+
+def fold_line(line):
+    """
+    Encode one content line, folded at 75 octets without splitting a UTF-8
+    sequence (RFC 5545 §3.1).
+    """
+    data = line.encode("utf-8")
+    if len(data) <= 75:
+        return data + b"\r\n"
+
+    # Same split points as icalendar: at most 74 octets per segment, the
+    # leading space of continuation lines not counted.
+    parts = []
+    start = 0
+    while len(data) - start > 74:
+        end = start + 74
+        # Step back off UTF-8 continuation bytes (0b10xxxxxx)
+        while data[end] & 0xC0 == 0x80:
+            end -= 1
+        # Keep escape sequences like "\\," on one line
+        backslashes = 0
+        while end - 1 - backslashes > start and data[end - 1 - backslashes] == 0x5C:
+            backslashes += 1
+        if backslashes % 2:
+            end -= 1
+        parts.append(data[start:end])
+        start = end
+    parts.append(data[start:])
+    return b"\r\n ".join(parts) + b"\r\n"
+
+
+def text_line(name, value):
+    return fold_line(f"{name}:{escape_text(value)}")
+
+
+def format_datetime(value):
+    if value.tzinfo is not None and value.utcoffset() is not None:
+        return value.astimezone(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    return f"{value.year:04d}{value.month:02d}{value.day:02d}T{value.hour:02d}{value.minute:02d}{value.second:02d}"
+
+
+def format_trigger(minutes_before):
+    return f"-PT{minutes_before}M"
+
+
+class AlarmTemplate:
+    """The VALARM block shared by every event, minus its description."""
+
+    def __init__(self, minutes_before):
+        self.minutes_before = minutes_before
+        self.head = b"BEGIN:VALARM\r\nACTION:DISPLAY\r\n"
+        self.tail = f"TRIGGER:{format_trigger(minutes_before)}\r\nEND:VALARM\r\n".encode("utf-8")
+
+    def render(self, description):
+        return self.head + text_line("DESCRIPTION", description) + self.tail
+
+
+def calendar_header(properties):
+    lines = [b"BEGIN:VCALENDAR\r\n"]
+    lines.extend(text_line(name, value) for name, value in properties)
+    return b"".join(lines)
+
+
+CALENDAR_FOOTER = b"END:VCALENDAR\r\n"
+
+
+def recurrence_lines(count=1, exdates=(), rdates=()):
+    lines = []
+    if count > 1:
+        lines.append(f"RRULE:FREQ=WEEKLY;COUNT={count}")
+    if exdates:
+        lines.append("EXDATE:" + ",".join(map(format_datetime, exdates)))
+    if rdates:
+        lines.append("RDATE:" + ",".join(map(format_datetime, rdates)))
+    return b"".join(fold_line(line) for line in lines)
+
+
+def revision_lines(sequence=None, last_modified=None):
+    lines = ""
+    if sequence is not None:
+        lines += f"SEQUENCE:{sequence}\r\n"
+    if last_modified is not None:
+        lines += f"LAST-MODIFIED:{format_datetime(last_modified)}\r\n"
+    return lines.encode("utf-8")
+
+
+def event_chunk(uid, start, end, summary, description, location, alarm, alarm_description,
+                count=1, exdates=None, rdates=None, sequence=None, last_modified=None):
+    return b"".join((
+        b"BEGIN:VEVENT\r\n",
+        text_line("SUMMARY", summary),
+        f"DTSTART:{format_datetime(start)}\r\nDTEND:{format_datetime(end)}\r\n".encode("utf-8"),
+        recurrence_lines(count, exdates, rdates) if count > 1 or exdates or rdates else b"",
+        text_line("UID", uid),
+        revision_lines(sequence, last_modified),
+        text_line("DESCRIPTION", description),
+        text_line("LOCATION", location),
+        alarm.render(alarm_description),
+        b"END:VEVENT\r\n",
+    ))
+
+
+def _normalize(ics_bytes):
+    from icalendar import Calendar
+
+    components = []
+    for component in Calendar.from_ical(ics_bytes).walk():
+        props = sorted((name, value.to_ical() if hasattr(value, "to_ical") else str(value))
+                       for name, value in component.items())
+        components.append((component.name, props))
+    return components
+
+
+def calendars_equivalent(first, second):
+    """Parse two ICS documents and compare their components and properties."""
+    return _normalize(first) == _normalize(second)
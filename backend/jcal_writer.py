@@ -0,0 +1,72 @@
+"""
+jCal (RFC 7265) writer for the calendars built by CalendarGenerator.
+
+Takes the same event arguments as ics_writer.event_chunk, so both formats
+carry the same properties in the same order; only the encoding differs.
+"""
+import json
+from datetime import timezone
+from ics_writer import format_trigger
+
+
+def format_datetime(value):
+    # RFC 7265 §3.5.5: the RFC 5545 value with "-" and ":" put back in
+    if value.tzinfo is not None and value.utcoffset() is not None:
+        return value.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+    return (f"{value.year:04d}-{value.month:02d}-{value.day:02d}"
+            f"T{value.hour:02d}:{value.minute:02d}:{value.second:02d}")
+
+
+def text(name, value):
+    return [name, {}, "text", str(value)]
+
+
+def alarm_component(alarm, description):
+    return ["valarm", [
+        text("action", "DISPLAY"),
+        text("description", description),
+        ["trigger", {}, "duration", format_trigger(alarm.minutes_before)],
+    ], []]
+
+
+def recurrence_properties(count=1, exdates=None, rdates=None):
+    properties = []
+    if count > 1:
+        properties.append(["rrule", {}, "recur", {"freq": "WEEKLY", "count": count}])
+    if exdates:
+        properties.append(["exdate", {}, "date-time", *map(format_datetime, exdates)])
+    if rdates:
+        properties.append(["rdate", {}, "date-time", *map(format_datetime, rdates)])
+    return properties
+
+
+def event_component(uid, start, end, summary, description, location, alarm, alarm_description,
+                    count=1, exdates=None, rdates=None, sequence=None, last_modified=None):
+    properties = [
+        text("summary", summary),
+        ["dtstart", {}, "date-time", format_datetime(start)],
+        ["dtend", {}, "date-time", format_datetime(end)],
+    ]
+    if count > 1 or exdates or rdates:
+        properties.extend(recurrence_properties(count, exdates, rdates))
+    properties.append(text("uid", uid))
+    if sequence is not None:
+        properties.append(["sequence", {}, "integer", sequence])
+    if last_modified is not None:
+        properties.append(["last-modified", {}, "date-time", format_datetime(last_modified)])
+    properties.append(text("description", description))
+    properties.append(text("location", location))
+    return ["vevent", properties, [alarm_component(alarm, alarm_description)]]
+
+
+def calendar(properties, events):
+    """
+    The whole jCal document as UTF-8 JSON. ``properties`` are the calendar's
+    (name, value) pairs; X- names are typed "unknown" as §5 asks for
+    properties a parser doesn't know.
+    """
+    calendar_properties = [[name.lower(), {}, "unknown" if name.upper().startswith("X-") else "text", value]
+                           for name, value in properties]
+    components = [event_component(**event) for event in events]
+    document = ["vcalendar", calendar_properties, components]
+    return json.dumps(document, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
@@ -2,4 +2,10 @@ from app import app
 import os
 
 if __name__ == '__main__':
-    app.run(debug=True, port=os.getenv("PORT", default=5001), host='0.0.0.0')
+    port = int(os.getenv("PORT", default=5001))
+    # SERVER_MODE=asgi serves /class from the async app through uvicorn
+    if os.getenv("SERVER_MODE", default="wsgi") == "asgi":
+        import uvicorn
+        uvicorn.run("asgi:app", port=port, host='0.0.0.0')
+    else:
+        app.run(debug=True, port=port, host='0.0.0.0')
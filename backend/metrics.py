@@ -0,0 +1,282 @@
+"""
+In-process metrics in the Prometheus text format, plus per-request stage
+traces for the Server-Timing header.
+
+Every stage of a calendar build (login, semester lookup, course and exam
+fetches, parsing, diffing, rendering) is timed with ``stage`` or the
+``timed`` decorator. The timings go into a histogram labelled by school and
+stage and, while a request is being traced, into that request's Trace.
+"""
+import contextvars
+import inspect
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs.extend(f'{name}="{_escape(value)}"' for name, value in extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        return self._values.get(labels, 0)
+
+    def collect(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+
+class Gauge:
+    """A value read from ``callback`` at scrape time."""
+
+    def __init__(self, name, documentation, callback):
+        self.name = name
+        self.documentation = documentation
+        self.callback = callback
+
+    def collect(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge",
+                f"{self.name} {_format_value(self.callback())}"]
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # labels -> [bucket counts..., sum, count]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+                    break
+            state[-2] += value
+            state[-1] += 1
+
+    def count(self, *labels):
+        state = self._values.get(labels)
+        return state[-1] if state else 0
+
+    def collect(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((labels, list(state)) for labels, state in self._values.items())
+        for labels, state in items:
+            cumulative = 0
+            for i, bound in enumerate(self.buckets):
+                cumulative += state[i]
+                label_text = _format_labels(self.labelnames, labels, (('le', _format_value(float(bound))),))
+                lines.append(f"{self.name}_bucket{label_text} {cumulative}")
+            label_text = _format_labels(self.labelnames, labels, (('le', '+Inf'),))
+            lines.append(f"{self.name}_bucket{label_text} {state[-1]}")
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} {_format_value(float(state[-2]))}")
+            lines.append(f"{self.name}_count{label_text} {state[-1]}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name, documentation, callback):
+        return self.register(Gauge(name, documentation, callback))
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            try:
+                lines.extend(metric.collect())
+            except Exception as e:
+                print(f"Failed to collect metric {metric.name}: {e}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+REQUESTS = registry.counter(
+    "coursesync_requests_total", "Calendar requests by school and HTTP status.", ("school", "status"))
+REQUEST_SECONDS = registry.histogram(
+    "coursesync_request_seconds", "Time to answer a calendar request.", ("school",))
+STAGE_SECONDS = registry.histogram(
+    "coursesync_stage_seconds", "Time spent in each stage of a calendar build.", ("school", "stage"))
+STAGE_ERRORS = registry.counter(
+    "coursesync_stage_errors_total", "Stages that raised an exception.", ("school", "stage"))
+UPSTREAM_RESPONSES = registry.counter(
+    "coursesync_upstream_responses_total", "Responses from the academic systems by method and status.",
+    ("school", "method", "status"))
+UPSTREAM_BYTES = registry.counter(
+    "coursesync_upstream_response_bytes_total", "Response body bytes received from the academic systems.",
+    ("school",))
+UPSTREAM_RETRIES = registry.counter(
+    "coursesync_upstream_retries_total", "Upstream requests retried, by the status or 'error' that caused it.",
+    ("school", "reason"))
+UPSTREAM_REJECTED = registry.counter(
+    "coursesync_upstream_rejected_total",
+    "Upstream requests refused locally (circuit_open, rate_limited).", ("school", "reason"))
+CACHE_LOOKUPS = registry.counter(
+    "coursesync_calendar_cache_lookups_total", "Calendar cache lookups by result (hit, stale, miss).",
+    ("result",))
+EVENTS_RENDERED = registry.counter(
+    "coursesync_calendar_events_total", "VEVENTs written into rendered calendars.", ("kind", "recurrence"))
+CALENDAR_BYTES = registry.counter(
+    "coursesync_calendar_bytes_total", "Bytes of calendars rendered.", ("format", "recurrence"))
+FLIGHT_CALLS = registry.counter(
+    "coursesync_single_flight_calls_total",
+    "Calendar builds by single-flight role (leader, follower, rejected).", ("role",))
+FLIGHT_ERRORS = registry.counter(
+    "coursesync_single_flight_errors_total", "Coalesced builds that raised, failing every caller waiting on them.")
+FLIGHT_SECONDS = registry.histogram(
+    "coursesync_single_flight_seconds", "Time a leader spent on a coalesced build.")
+
+
+class Trace:
+    """Stage durations of one request, summed per stage name."""
+
+    def __init__(self, school=None):
+        self.school = school
+        self.started = time.perf_counter()
+        self.stages = {}
+        self._lock = threading.Lock()
+
+    def add(self, name, seconds):
+        with self._lock:
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def server_timing(self):
+        with self._lock:
+            stages = list(self.stages.items())
+        parts = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in stages]
+        parts.append(f"total;dur={(time.perf_counter() - self.started) * 1000:.1f}")
+        return ", ".join(parts)
+
+
+_current_trace = contextvars.ContextVar("coursesync_trace", default=None)
+
+# Server-Timing reveals how long each upstream step took, so it is opt-in
+SERVER_TIMING = os.getenv("SERVER_TIMING", default="0") == "1"
+
+
+def start_trace(school=None):
+    """
+    Start collecting stage timings for the current request. Returns the
+    Trace; threads started with a copy of this context (run_concurrently,
+    asyncio.to_thread) add to the same trace.
+    """
+    trace = Trace(school)
+    _current_trace.set(trace)
+    return trace
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+def _school_label(school):
+    if school:
+        return school
+    trace = _current_trace.get()
+    return trace.school if trace is not None and trace.school else "unknown"
+
+
+def record_stage(name, seconds, school=None, failed=False):
+    school = _school_label(school)
+    STAGE_SECONDS.observe(seconds, school, name)
+    if failed:
+        STAGE_ERRORS.inc(school, name)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add(name, seconds)
+
+
+@contextmanager
+def stage(name, school=None):
+    started = time.perf_counter()
+    failed = False
+    try:
+        yield
+    except BaseException:
+        failed = True
+        raise
+    finally:
+        record_stage(name, time.perf_counter() - started, school, failed)
+
+
+def timed(name):
+    """
+    Method decorator timing a client stage, labelled with the class's
+    SCHOOL. Works on both plain and async methods.
+    """
+    def decorator(method):
+        if inspect.iscoroutinefunction(method):
+            @wraps(method)
+            async def async_wrapper(self, *args, **kwargs):
+                with stage(name, getattr(self, 'SCHOOL', None)):
+                    return await method(self, *args, **kwargs)
+            return async_wrapper
+
+        @wraps(method)
+        def wrapper(self, *args, **kwargs):
+            with stage(name, getattr(self, 'SCHOOL', None)):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record_upstream_response(school, method, status, size):
+    UPSTREAM_RESPONSES.inc(school or "unknown", method, str(status))
+    UPSTREAM_BYTES.inc(school or "unknown", amount=size)
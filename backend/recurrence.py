@@ -0,0 +1,124 @@
+import hashlib
+from datetime import timedelta
+
+WEEK = timedelta(days=7)
+
+
+def _series_key(course):
+    start, end = course['start'], course['end']
+    return (course['lessonId'], course['courseName'], course['personName'], course['roomZh'],
+            start.weekday(), start.time(), end - start)
+
+
+def series_uid(course):
+    """
+    The UID of the series ``course`` belongs to. It only depends on the
+    series key, so it stays the same whichever of its weeks are left.
+    """
+    start, end = course['start'], course['end']
+    names = '\x1f'.join((course['courseName'], course['personName'], course['roomZh']))
+    digest = hashlib.sha1(names.encode()).hexdigest()[:8]
+    minutes = (end - start) // timedelta(minutes=1)
+    return f"series-{course['lessonId']}-{start.weekday()}-{start:%H%M}-{minutes}-{digest}"
+
+
+def _group_series(courses):
+    groups = {}
+    for course in courses:
+        groups.setdefault(_series_key(course), []).append(course)
+    return groups.values()
+
+
+def _compress(occurrences):
+    first = min(occurrences, key=lambda course: course['start'])
+    # Same weekday and time, so distinct starts always fall in distinct weeks
+    starts = sorted({course['start'] for course in occurrences})
+    weeks = {(start - first['start']).days // 7 for start in starts}
+    count = max(weeks) + 1
+
+    series = dict(first)
+    series['uid'] = series_uid(first)
+    # A series is as new as its most recently changed occurrence, or its
+    # dates (see track_series), whichever changed last
+    if 'sequence' in first:
+        series['sequence'] = max(course.get('seriesSequence', course['sequence']) for course in occurrences)
+        series['lastModified'] = max(course.get('seriesModified', course['lastModified']) for course in occurrences)
+    series['count'] = 1
+    series['exdates'] = []
+    series['rdates'] = []
+    if len(starts) > 1:
+        missing = [first['start'] + WEEK * week for week in range(count) if week not in weeks]
+        # A weekly rule only pays off if it needs fewer exceptions than
+        # listing the dates outright
+        if len(missing) < len(starts):
+            series['count'] = count
+            series['exdates'] = missing
+        else:
+            series['rdates'] = starts[1:]
+    return series
+
+
+def compress_occurrences(courses, event_filter=None):
+    """
+    Group weekly course occurrences into recurring series.
+
+    Occurrences that share course, teacher, room, weekday and time slot form
+    one series. The series are grouped over all of ``courses`` and
+    ``event_filter`` only then drops occurrences, so a series keeps its UID
+    however many of its weeks the filter leaves. Each series is a course
+    dict for its first remaining occurrence, with 'uid' from series_uid, plus:
+        'count': int, occurrences covered by RRULE:FREQ=WEEKLY;COUNT=count
+        'exdates': List[datetime], weeks inside that range without a class
+        'rdates': List[datetime], extra dates when the weeks are too
+                  irregular for a weekly rule (count is then 1)
+    """
+    result = []
+    for occurrences in _group_series(courses):
+        if event_filter is not None:
+            occurrences = [course for course in occurrences if event_filter(course)]
+            if not occurrences:
+                continue
+        result.append(_compress(occurrences))
+    result.sort(key=lambda series: series['start'])
+    return result
+
+
+def series_signature(series):
+    """The dates a client expands a series into: its start, rule and exceptions."""
+    return [series['start'].isoformat(), series['end'].isoformat(), series['count'],
+            [day.isoformat() for day in series['exdates']], [day.isoformat() for day in series['rdates']]]
+
+
+def track_series(previous, courses, now):
+    """
+    Keep the SEQUENCE of every series ahead of its dates.
+
+    A cancelled week only turns into a new EXDATE, and the occurrences left
+    keep their SEQUENCE, so clients would ignore the changed series. A
+    series whose rule or exceptions differ from the ``previous`` snapshot
+    therefore gets a SEQUENCE above the last one it was sent with.
+
+    ``previous`` maps series UID (see series_uid) to
+    [signature, sequence, last modified]. The occurrences are annotated in
+    place with 'seriesSequence' and 'seriesModified', which
+    compress_occurrences prefers; returns the new snapshot.
+    """
+    state = {}
+    for occurrences in _group_series(courses):
+        series = _compress(occurrences)
+        if 'sequence' not in series:
+            continue
+        uid = series['uid']
+        signature = series_signature(series)
+        sequence, modified = series['sequence'], series['lastModified']
+        if uid in previous:
+            old_signature, old_sequence, old_modified = previous[uid]
+            if old_signature != signature:
+                sequence, modified = max(sequence, old_sequence + 1), now
+            else:
+                sequence, modified = max(sequence, old_sequence), max(modified, old_modified)
+        state[uid] = [signature, sequence, modified]
+        for course in occurrences:
+            course['seriesSequence'] = sequence
+            course['seriesModified'] = modified
+    return state
@@ -0,0 +1,139 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Subscription:
+    __slots__ = ('key', 'school', 'username', 'password', 'options',
+                 'last_seen', 'last_refreshed', 'next_refresh', 'refreshing', 'failures')
+
+    def __init__(self, key, school, username, password, options, now):
+        self.key = key
+        self.school = school
+        self.username = username
+        self.password = password
+        self.options = options
+        self.last_seen = now
+        self.last_refreshed = now
+        self.next_refresh = now
+        self.refreshing = False
+        self.failures = 0
+
+
+class RefreshScheduler:
+    """
+    Keeps recently polled calendars warm by re-rendering them in the
+    background.
+
+    ``refresh`` is called with a Subscription on a worker thread and should
+    return False when the subscription is no longer valid (e.g. the password
+    was changed), in which case it is dropped. Exceptions are treated as a
+    temporary upstream failure and retried with backoff, while the last good
+    render keeps being served.
+    """
+
+    def __init__(self, refresh, interval=1500, jitter=300, per_school_concurrency=4,
+                 idle_timeout=2 * 24 * 3600, tick=5, max_workers=16):
+        self.refresh = refresh
+        self.interval = interval
+        self.jitter = jitter
+        self.per_school_concurrency = per_school_concurrency
+        self.idle_timeout = idle_timeout
+        self.tick = tick
+        self._subscriptions = {}
+        self._school_slots = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="calendar-refresh")
+        self._thread = None
+        self._stopped = threading.Event()
+
+    def __len__(self):
+        return len(self._subscriptions)
+
+    def touch(self, key, school, username, password, options=None, refreshed=False):
+        """Record a poll of ``key``; ``refreshed`` means it was just rendered."""
+        now = time.time()
+        with self._lock:
+            sub = self._subscriptions.get(key)
+            if sub is None:
+                sub = Subscription(key, school, username, password, options or {}, now)
+                self._subscriptions[key] = sub
+                refreshed = True
+            sub.last_seen = now
+            sub.password = password
+            if refreshed:
+                sub.last_refreshed = now
+                sub.next_refresh = self._next_refresh(now)
+        self.start()
+        return sub
+
+    def refresh_async(self, key):
+        with self._lock:
+            sub = self._subscriptions.get(key)
+            if sub is None:
+                return False
+            sub.next_refresh = 0
+        return self._submit(sub)
+
+    def forget(self, key):
+        with self._lock:
+            self._subscriptions.pop(key, None)
+
+    def start(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="calendar-refresh-scheduler", daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def _next_refresh(self, now):
+        return now + self.interval + random.uniform(-self.jitter, self.jitter)
+
+    def _run(self):
+        while not self._stopped.wait(self.tick):
+            now = time.time()
+            with self._lock:
+                for key in [k for k, sub in self._subscriptions.items() if now - sub.last_seen > self.idle_timeout]:
+                    del self._subscriptions[key]
+                due = [sub for sub in self._subscriptions.values()
+                       if not sub.refreshing and sub.next_refresh <= now]
+            for sub in due:
+                self._submit(sub)
+
+    def _submit(self, sub):
+        with self._lock:
+            if sub.refreshing:
+                return False
+            slots = self._school_slots.setdefault(sub.school, threading.BoundedSemaphore(self.per_school_concurrency))
+            # Leave it due; the next tick tries again once a slot frees up
+            if not slots.acquire(blocking=False):
+                return False
+            sub.refreshing = True
+        self._executor.submit(self._refresh_one, sub, slots)
+        return True
+
+    def _refresh_one(self, sub, slots):
+        try:
+            valid = self.refresh(sub)
+        except Exception as e:
+            print(f"Failed to refresh calendar for {sub.school}: {e}")
+            sub.failures += 1
+            # Back off on a failing school, but never longer than one interval
+            delay = min(self.tick * 2 ** sub.failures, self.interval)
+            sub.next_refresh = time.time() + delay
+        else:
+            if valid is False:
+                self.forget(sub.key)
+            else:
+                now = time.time()
+                sub.failures = 0
+                sub.last_refreshed = now
+                sub.next_refresh = self._next_refresh(now)
+        finally:
+            sub.refreshing = False
+            slots.release()
@@ -0,0 +1,74 @@
+import asyncio
+import threading
+from metrics import record_upstream_response, UPSTREAM_RETRIES
+from .upstream_policy import RETRY_STATUSES, upstream_policy
+
+# httpx is only needed by the ASGI server, so it is imported on first use.
+# Like http_session, every AsyncClient shares one transport (one connection
+# pool per host) and keeps its own cookies. Pooled clients are never closed
+# with aclose(), since that would close the shared transport as well.
+_transports = {}
+_lock = threading.Lock()
+
+def _shared_transport(verify):
+    import httpx
+
+    with _lock:
+        transport = _transports.get(verify)
+        if transport is None:
+            limits = httpx.Limits(max_connections=64, max_keepalive_connections=32)
+            transport = _transports[verify] = httpx.AsyncHTTPTransport(verify=verify, limits=limits)
+        return transport
+
+def policy_transport(inner, policy):
+    """
+    Wrap an httpx transport so every request, redirects included, goes
+    through ``policy``. Mark idempotent POSTs with
+    ``extensions={'idempotent': True}``.
+    """
+    import httpx
+
+    class PolicyTransport(httpx.AsyncBaseTransport):
+        async def handle_async_request(self, request):
+            attempts = policy.attempts(request.method, request.extensions.get('idempotent', False))
+            for attempt in range(attempts):
+                wait = policy.admit()
+                if wait:
+                    await asyncio.sleep(wait)
+                try:
+                    resp = await inner.handle_async_request(request)
+                except Exception as e:
+                    policy.record()
+                    if attempt + 1 == attempts or not isinstance(e, httpx.TransportError):
+                        raise
+                    UPSTREAM_RETRIES.inc(policy.school, 'error')
+                    await asyncio.sleep(policy.retry_delay(attempt))
+                    continue
+                policy.record(resp.status_code)
+                if resp.status_code not in RETRY_STATUSES or attempt + 1 == attempts:
+                    return resp
+                UPSTREAM_RETRIES.inc(policy.school, str(resp.status_code))
+                await resp.aclose()
+                await asyncio.sleep(policy.retry_delay(attempt, resp.headers.get('Retry-After')))
+
+        async def aclose(self):
+            # The inner transport is shared, see _shared_transport
+            pass
+
+    return PolicyTransport()
+
+def create_async_session(verify=True, school=None):
+    import httpx
+
+    async def record_response(resp):
+        await resp.aread()
+        record_upstream_response(school, resp.request.method, resp.status_code, len(resp.content))
+
+    transport = _shared_transport(verify)
+    timeout = 30
+    if school:
+        policy = upstream_policy(school)
+        transport = policy_transport(transport, policy)
+        timeout = httpx.Timeout(policy.read_timeout, connect=policy.connect_timeout)
+    return httpx.AsyncClient(transport=transport, follow_redirects=True, timeout=timeout,
+                             event_hooks={'response': [record_response]})
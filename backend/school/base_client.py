@@ -1,3 +1,4 @@
+import asyncio
 from abc import ABC, abstractmethod
 from typing import List, Dict, TypedDict
 from datetime import datetime
@@ -15,12 +16,69 @@ class BaseAcademicSystemClient(ABC):
     def authenticate(self):
         pass
 
+    @abstractmethod
+    def login(self):
+        """
+        Authenticate and load the per-session state (current semester etc.).
+        Called on construction and again when a pooled session has expired.
+        """
+        pass
+
+    def is_session_alive(self) -> bool:
+        """
+        Cheaply check whether the session cookies are still accepted upstream.
+        Clients that can't tell return False so the pool logs in again.
+        """
+        return False
+
+    def reset(self):
+        self.courses = []
+        self.exams = []
+
+    def list_semesters(self):
+        """
+        (semester id, name) of the semesters a student can ask for. Names
+        look like "2024-2025-1" so their dates can be estimated, see
+        school.semesters.
+        """
+        return [(self.current_semester, self.current_semester)]
+
+    def course_snapshot(self):
+        """The raw course data left by fetch_courses, for caching per semester."""
+        return self.semester, self.courses
+
+    def restore_course_snapshot(self, snapshot):
+        """Load a course_snapshot() so process_course_data can run without fetching."""
+        self.semester, self.courses = snapshot
+
+    # Async counterparts used by the ASGI server. By default they run the
+    # blocking versions in a worker thread; clients override them with
+    # native httpx implementations.
+    async def alogin(self):
+        await asyncio.to_thread(self.login)
+
+    async def ais_session_alive(self) -> bool:
+        return await asyncio.to_thread(self.is_session_alive)
+
+    async def afetch_courses(self, semester=None):
+        return await asyncio.to_thread(self.fetch_courses, semester)
+
+    async def alist_semesters(self):
+        return await asyncio.to_thread(self.list_semesters)
+
+    async def afetch_exams(self):
+        return await asyncio.to_thread(self.fetch_exams)
+
     @abstractmethod
     def fetch_current_semester(self):
         pass
 
     @abstractmethod
-    def fetch_courses(self):
+    def fetch_courses(self, semester=None):
+        """
+        Fetch the raw course data of ``semester`` (the current one by
+        default) and remember it as ``self.semester``.
+        """
         pass
 
     @abstractmethod
@@ -32,9 +90,11 @@ class BaseAcademicSystemClient(ABC):
         pass
 
     @abstractmethod
-    def process_course_data(self) -> List[CourseInfo]:
+    def process_course_data(self, date_range=None) -> List[CourseInfo]:
         """
-        Process and standardize course data.
+        Process and standardize course data. With a ``date_range`` (a
+        (start, end) pair of dates, either may be None) only classes on
+        those days are expanded.
 
         Returns:
             List[CourseInfo]: A list of CourseInfo dictionaries, where each dictionary
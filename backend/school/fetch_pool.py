@@ -0,0 +1,46 @@
+import contextvars
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+_worker_state = threading.local()
+
+def _mark_worker():
+    _worker_state.in_pool = True
+
+_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("UPSTREAM_FETCH_WORKERS", default=32)),
+    thread_name_prefix="upstream-fetch",
+    initializer=_mark_worker,
+)
+
+def run_concurrently(*calls):
+    """
+    Run independent zero-argument callables in parallel and return their
+    results in order. The first call runs on the calling thread.
+
+    Nested calls made from inside a pool worker run sequentially, so a busy
+    pool can never deadlock on tasks waiting for their own subtasks.
+    """
+    if len(calls) <= 1 or getattr(_worker_state, "in_pool", False):
+        return [call() for call in calls]
+
+    # Each task runs in a copy of the caller's context so it still adds to
+    # the request's metrics trace
+    futures = [_executor.submit(contextvars.copy_context().run, call) for call in calls[1:]]
+    results = []
+    error = None
+    try:
+        results.append(calls[0]())
+    except Exception as e:
+        error = e
+    # Always wait for every task so none of them is still touching the
+    # client after we return.
+    for future in futures:
+        try:
+            results.append(future.result())
+        except Exception as e:
+            error = error or e
+    if error is not None:
+        raise error
+    return results
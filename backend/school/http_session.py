@@ -0,0 +1,54 @@
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from metrics import record_upstream_response, UPSTREAM_RETRIES
+from .upstream_policy import RETRY_STATUSES, upstream_policy
+
+# One adapter (and therefore one urllib3 connection pool per host) shared by
+# every client session, so keep-alive connections to the campus servers are
+# reused across logins. Cookies stay per-session.
+_shared_adapter = HTTPAdapter(pool_connections=8, pool_maxsize=32)
+
+class PolicySession(requests.Session):
+    """A requests session whose requests all go through ``policy``."""
+
+    def __init__(self, policy):
+        super().__init__()
+        self.policy = policy
+
+    def request(self, method, url, *args, idempotent=False, **kwargs):
+        policy = self.policy
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = policy.timeout
+        attempts = policy.attempts(method, idempotent)
+        for attempt in range(attempts):
+            wait = policy.admit()
+            if wait:
+                time.sleep(wait)
+            try:
+                resp = super().request(method, url, *args, **kwargs)
+            except Exception as e:
+                policy.record()
+                if attempt + 1 == attempts or not isinstance(e, (requests.ConnectionError, requests.Timeout)):
+                    raise
+                UPSTREAM_RETRIES.inc(policy.school, 'error')
+                time.sleep(policy.retry_delay(attempt))
+                continue
+            policy.record(resp.status_code)
+            if resp.status_code not in RETRY_STATUSES or attempt + 1 == attempts:
+                return resp
+            UPSTREAM_RETRIES.inc(policy.school, str(resp.status_code))
+            resp.close()
+            time.sleep(policy.retry_delay(attempt, resp.headers.get('Retry-After')))
+
+def create_session(school=None):
+    # Timeouts, rate limit, retries and circuit breaker of the school, see upstream_policy
+    session = PolicySession(upstream_policy(school)) if school else requests.Session()
+    session.mount('https://', _shared_adapter)
+    session.mount('http://', _shared_adapter)
+
+    def record_response(resp, *args, **kwargs):
+        record_upstream_response(school, resp.request.method, resp.status_code, len(resp.content))
+
+    session.hooks['response'].append(record_response)
+    return session
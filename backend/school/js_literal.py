@@ -0,0 +1,144 @@
+"""
+Extract data embedded in portal pages as JavaScript literals, such as
+``var studentExamInfoVms = [...];``, without touching the rest of the page.
+
+The variable is located with one precompiled search and the literal right
+after it is decoded in place: first with the C JSON decoder, which is enough
+when the page embeds plain JSON, otherwise with a tokenizer that also takes
+single-quoted strings, JS-only escapes (``\\'``, ``\\xNN``, ``\\v``), unquoted
+keys, ``undefined`` and trailing commas.
+Either way nothing before or after the literal is scanned again and string
+contents are never rewritten.
+"""
+import json
+import re
+from functools import lru_cache
+
+_json_decoder = json.JSONDecoder()
+
+_TOKEN = re.compile(r"""
+    \s*(?:
+        (?P<punct>[\[\]{},:])
+      | "(?P<dq>(?:[^"\\]|\\.)*)"
+      | '(?P<sq>(?:[^'\\]|\\.)*)'
+      | (?P<num>-?(?:\d+(?:\.\d*)?|\.\d+)(?:[eE][+-]?\d+)?)
+      | (?P<ident>[A-Za-z_$][\w$]*)
+    )""", re.S | re.X)
+
+_JS_ESCAPE = re.compile(r"\\(u[0-9a-fA-F]{4}|x[0-9a-fA-F]{2}|.)", re.S)
+# A backslash before a line break continues the string on the next line
+_SIMPLE_ESCAPES = {'n': '\n', 't': '\t', 'r': '\r', 'b': '\b', 'f': '\f', 'v': '\v', '0': '\0', '\n': ''}
+_SURROGATE = re.compile('[\ud800-\udfff]')
+_IDENTIFIERS = {'true': True, 'false': False, 'null': None, 'undefined': None}
+
+
+def _unescape(match):
+    escape = match.group(1)
+    if len(escape) > 1:
+        return chr(int(escape[1:], 16))
+    return _SIMPLE_ESCAPES.get(escape, escape)
+
+
+def _js_string(content):
+    # Both quote styles take JS escapes (\', \xNN, \v...), which JSON's don't cover
+    if '\\' not in content:
+        return content
+    value = _JS_ESCAPE.sub(_unescape, content)
+    if _SURROGATE.search(value):
+        # Join \uD83D\uDE00-style pairs into one character
+        value = value.encode('utf-16', 'surrogatepass').decode('utf-16', 'replace')
+    return value
+
+
+def _token(text, pos):
+    match = _TOKEN.match(text, pos)
+    if match is None:
+        raise ValueError(f"Unexpected character in JS literal at {pos}")
+    return match
+
+
+def _parse_value(text, pos):
+    """Returns (value, end) for the literal starting at ``pos``."""
+    match = _token(text, pos)
+    kind, end = match.lastgroup, match.end()
+    if kind in ('dq', 'sq'):
+        return _js_string(match.group(kind)), end
+    if kind == 'num':
+        number = match.group('num')
+        return (float(number) if any(c in number for c in '.eE') else int(number)), end
+    if kind == 'ident':
+        name = match.group('ident')
+        if name not in _IDENTIFIERS:
+            raise ValueError(f"Unsupported identifier {name!r} in JS literal")
+        return _IDENTIFIERS[name], end
+
+    punct = match.group('punct')
+    if punct == '[':
+        items = []
+        while True:
+            match = _token(text, end)
+            if match.group('punct') == ']':
+                return items, match.end()
+            value, end = _parse_value(text, end)
+            items.append(value)
+            match = _token(text, end)
+            end = match.end()
+            if match.group('punct') == ']':
+                return items, end
+            if match.group('punct') != ',':
+                raise ValueError(f"Expected ',' or ']' in JS literal at {match.start()}")
+    if punct == '{':
+        obj = {}
+        while True:
+            match = _token(text, end)
+            kind, end = match.lastgroup, match.end()
+            if match.group('punct') == '}':
+                return obj, end
+            if kind in ('dq', 'sq'):
+                key = _js_string(match.group(kind))
+            elif kind in ('ident', 'num'):
+                key = match.group(kind)
+            else:
+                raise ValueError(f"Expected a key in JS literal at {match.start()}")
+            match = _token(text, end)
+            if match.group('punct') != ':':
+                raise ValueError(f"Expected ':' in JS literal at {match.start()}")
+            obj[key], end = _parse_value(text, match.end())
+            match = _token(text, end)
+            end = match.end()
+            if match.group('punct') == '}':
+                return obj, end
+            if match.group('punct') != ',':
+                raise ValueError(f"Expected ',' or '}}' in JS literal at {match.start()}")
+    raise ValueError(f"Unexpected {punct!r} in JS literal at {match.start()}")
+
+
+def parse_js_literal(text, pos=0):
+    """Decode the JavaScript object/array literal at ``pos``; returns (value, end)."""
+    try:
+        return _json_decoder.raw_decode(text, pos)
+    except ValueError:
+        return _parse_value(text, pos)
+
+
+_VAR_BEFORE = re.compile(r"(?:^|[^\w$])var\s+$")
+
+
+@lru_cache(maxsize=32)
+def _assignment_pattern(name):
+    # Starts with the literal name so the search can skip ahead with a
+    # substring scan; the "var" in front is checked on a short window
+    return re.compile(rf"{re.escape(name)}\s*=\s*")
+
+
+def extract_js_literal(text, name):
+    """The value assigned by ``var name = ...`` in ``text``, or None if there is none."""
+    pattern = _assignment_pattern(name)
+    pos = 0
+    while True:
+        match = pattern.search(text, pos)
+        if match is None:
+            return None
+        if _VAR_BEFORE.search(text, max(0, match.start() - 32), match.start()):
+            return parse_js_literal(text, match.end())[0]
+        pos = match.end()
@@ -0,0 +1,116 @@
+import asyncio
+import os
+import threading
+import time
+from timetable_store import timetable_store
+
+
+class SchoolMetadataCache:
+    """
+    Per-school values that are the same for every student, such as the
+    current semester or the date of its first week.
+
+    Entries are keyed by (school, name). Loading happens under a per-key lock
+    so a cold start triggers one upstream call per school, not one per user.
+    When the current semester changes, everything else cached for that
+    school is dropped.
+
+    With a ``store`` (a TimetableStore) loaded values are written through
+    and a miss looks there before calling the loader, so a fresh instance
+    doesn't ask upstream again for what the last one already knew.
+    """
+
+    def __init__(self, ttl=6 * 3600, store=None):
+        self.ttl = ttl
+        self.store = store
+        self._values = {}
+        self._locks = {}
+        self._async_locks = {}
+        self._lock = threading.Lock()
+
+    def get(self, school, name):
+        entry = self._values.get((school, name))
+        if entry is None or entry[1] <= time.time():
+            return None
+        return entry[0]
+
+    def set(self, school, name, value, ttl=None):
+        self._values[(school, name)] = (value, time.time() + (ttl or self.ttl))
+
+    def _restore(self, school, name):
+        stored = self.store.load_school_metadata(school, name)
+        if stored is None:
+            return None
+        value, expires = stored
+        self._values[(school, name)] = (value, expires)
+        return value
+
+    def _persist(self, school, name):
+        value, expires = self._values[(school, name)]
+        self.store.save_school_metadata(school, name, value, expires)
+
+    def get_or_load(self, school, name, loader, ttl=None):
+        value = self.get(school, name)
+        if value is not None:
+            return value
+
+        with self._lock:
+            lock = self._locks.setdefault((school, name), threading.Lock())
+        with lock:
+            value = self.get(school, name)
+            if value is not None:
+                return value
+            if self.store is not None:
+                value = self._restore(school, name)
+                if value is not None:
+                    return value
+            previous = self._values.get((school, name))
+            value = loader()
+            if value is None:
+                return None
+            if name == 'current_semester' and previous is not None and previous[0] != value:
+                self.invalidate(school)
+            self.set(school, name, value, ttl)
+            if self.store is not None:
+                self._persist(school, name)
+            return value
+
+    async def aget_or_load(self, school, name, loader, ttl=None):
+        """get_or_load for coroutine loaders, coalescing on an asyncio lock."""
+        value = self.get(school, name)
+        if value is not None:
+            return value
+
+        # The ASGI server runs a single event loop, so one lock per key is enough
+        lock = self._async_locks.setdefault((school, name), asyncio.Lock())
+        async with lock:
+            value = self.get(school, name)
+            if value is not None:
+                return value
+            # SQLite blocks, keep it off the event loop
+            if self.store is not None:
+                value = await asyncio.to_thread(self._restore, school, name)
+                if value is not None:
+                    return value
+            previous = self._values.get((school, name))
+            value = await loader()
+            if value is None:
+                return None
+            if name == 'current_semester' and previous is not None and previous[0] != value:
+                await asyncio.to_thread(self.invalidate, school)
+            self.set(school, name, value, ttl)
+            if self.store is not None:
+                await asyncio.to_thread(self._persist, school, name)
+            return value
+
+    def invalidate(self, school, name=None):
+        with self._lock:
+            for key in list(self._values):
+                if key[0] == school and (name is None or key[1] == name):
+                    del self._values[key]
+        if self.store is not None:
+            self.store.delete_school_metadata(school, name)
+
+
+school_metadata = SchoolMetadataCache(ttl=int(os.getenv("SCHOOL_METADATA_TTL", default=6 * 3600)),
+                                      store=timetable_store)
@@ -1,51 +1,174 @@
+import asyncio
+import os
 import requests
 import hashlib
+import html
 import re
-from bs4 import BeautifulSoup
-from datetime import datetime, timedelta
+from datetime import date, datetime, time
 from ..base_client import BaseAcademicSystemClient
-from .encrypt import encrypt_password
+from ..http_session import create_session
+from ..async_http import create_async_session
+from ..fetch_pool import run_concurrently
+from ..metadata_cache import school_metadata
+from ..occurrences import CourseOccurrence, week_indexes, week_offset
+from ..semesters import academic_year_semesters
+from ..upstream_policy import UpstreamError, UpstreamUnavailable
+from metrics import timed
 from http.cookies import SimpleCookie
+from urllib.parse import urlsplit
+
+_SHARED_SLOTS = {
+    1: (time(8, 0), time(8, 40)),
+    2: (time(8, 50), time(9, 30)),
+    3: (time(9, 50), time(10, 30)),
+    4: (time(10, 40), time(11, 20)),
+    5: (time(11, 30), time(12, 10)),
+    11: (time(19, 30), time(20, 10)),
+    12: (time(20, 15), time(20, 55)),
+    13: (time(21, 0), time(21, 40)),
+}
+
+# Start/end time of each class period; afternoons start later in summer
+CLASS_TIME_MAP = {
+    "winter": {
+        **_SHARED_SLOTS,
+        6: (time(14, 0), time(14, 40)),
+        7: (time(14, 50), time(15, 30)),
+        8: (time(15, 40), time(16, 20)),
+        9: (time(16, 30), time(17, 10)),
+        10: (time(17, 20), time(18, 0)),
+    },
+    "summer": {
+        **_SHARED_SLOTS,
+        6: (time(14, 30), time(15, 10)),
+        7: (time(15, 20), time(16, 0)),
+        8: (time(16, 10), time(16, 50)),
+        9: (time(17, 0), time(17, 40)),
+        10: (time(17, 50), time(18, 30)),
+    },
+}
+
+# The two hidden inputs of the CAS login form, whatever the attribute order
+_HIDDEN_INPUTS = {
+    name: re.compile(rf'<input\b[^>]*?(?<![\w-])id\s*=\s*["\']{name}["\'][^>]*>', re.I)
+    for name in ('pwdEncryptSalt', 'execution')
+}
+_VALUE_ATTR = re.compile(r'(?<![\w-])value\s*=\s*(?:"([^"]*)"|\'([^\']*)\')', re.I)
+
+# The first week of a semester never moves once it is published
+FIRST_WEEK_DATE_TTL = 30 * 24 * 3600
 
 class NWAFUAcademicSystemClient(BaseAcademicSystemClient):
-    BASE_URL = "https://authserver.nwafu.edu.cn"
-    EHALL_URL = "https://newehall.nwafu.edu.cn"
+    SCHOOL = "nwafu"
+    # Overridable so the benchmarks can point the client at a local mock
+    BASE_URL = os.getenv("NWAFU_AUTH_URL", default="https://authserver.nwafu.edu.cn")
+    EHALL_URL = os.getenv("NWAFU_EHALL_URL", default="https://newehall.nwafu.edu.cn")
     JWAPP_URL = f"{EHALL_URL}/jwapp/sys"
+    APP_CONFIG_URL = f"{JWAPP_URL}/funauthapp/api/getAppConfig/wdkbby-5959167891382285.do"
+
+    TASK_URL = f'{EHALL_URL}/taskcenterapp/sys/taskCenter/taskNew/getMyProcessCount.do'
+    LOGIN_HEADERS = {
+        "Content-Type": "application/x-www-form-urlencoded"
+    }
+    # Every POST except the login is a read-only query and may be retried,
+    # see upstream_policy
+    IDEMPOTENT = {'idempotent': True}
 
-    def __init__(self, username, password):
+    def __init__(self, username, password, autologin=True):
         self.username = username
         self.password = password
-        self.session = requests.Session()
+        self.session = create_session(self.SCHOOL)
         self.session.verify = False
-        self.is_authenticated = self.authenticate()
-        self.current_semester = self.fetch_current_semester() if self.is_authenticated else None
-        self.first_week_date = self.fetch_first_week_date() if self.is_authenticated and self.current_semester else None
+        self.http = None
+        self.semester = None
         self.exams = []
         self.courses = []
-        self.class_time_map = self.create_class_time_map()
+        self.class_time_map = CLASS_TIME_MAP
+        if autologin:
+            self.login()
 
-    def authenticate(self):
-        salt, execution = self.get_salt_and_execution()
-        enc_passwd = encrypt_password(self.password, salt)
-        payload = {
+    def login(self):
+        self.session.cookies.clear()
+        self.app_config_loaded = False
+        self.is_authenticated = self.authenticate()
+        self.current_semester = self.load_current_semester() if self.is_authenticated else None
+        # Loaded together with the course lists in fetch_courses
+        self.first_week_date = None
+
+    def load_current_semester(self):
+        return school_metadata.get_or_load(self.SCHOOL, 'current_semester', self.fetch_current_semester)
+
+    def load_first_week_date(self):
+        return school_metadata.get_or_load(self.SCHOOL, ('first_week_date', self.semester),
+                                           self.fetch_first_week_date, ttl=FIRST_WEEK_DATE_TTL)
+
+    async def alogin(self):
+        self.http = create_async_session(verify=False, school=self.SCHOOL)
+        self.app_config_loaded = False
+        self.is_authenticated = await self.aauthenticate()
+        self.current_semester = await self.aload_current_semester() if self.is_authenticated else None
+        self.first_week_date = None
+
+    async def aload_current_semester(self):
+        return await school_metadata.aget_or_load(self.SCHOOL, 'current_semester', self.afetch_current_semester)
+
+    async def aload_first_week_date(self):
+        return await school_metadata.aget_or_load(self.SCHOOL, ('first_week_date', self.semester),
+                                                  self.afetch_first_week_date, ttl=FIRST_WEEK_DATE_TTL)
+
+    def is_session_alive(self):
+        # Once the CAS ticket is gone the task center redirects to authserver.
+        try:
+            resp = self.session.post(self.TASK_URL, allow_redirects=False, idempotent=True)
+        except (requests.RequestException, UpstreamUnavailable):
+            return False
+        return resp.status_code == 200
+
+    async def ais_session_alive(self):
+        try:
+            resp = await self.http.post(self.TASK_URL, follow_redirects=False, extensions=self.IDEMPOTENT)
+        except Exception:
+            return False
+        return resp.status_code == 200
+
+    def login_payload(self, salt, execution):
+        # pycryptodome is only loaded once someone actually logs in
+        from .encrypt import encrypt_password
+
+        return {
             "username": self.username,
-            "password": enc_passwd,
+            "password": encrypt_password(self.password, salt),
             "_eventId": "submit",
             "cllt": "userNameLogin",
             "execution": execution,
         }
-        headers = {
-            "Content-Type": "application/x-www-form-urlencoded"
-        }
-        resp = self.session.post(f'{self.BASE_URL}/authserver/login', data=payload, headers=headers, allow_redirects=True)
-        self.copy_cookies_to_new_domain("authserver.nwafu.edu.cn", "newehall.nwafu.edu.cn")
-        task_url = f'{self.EHALL_URL}/taskcenterapp/sys/taskCenter/taskNew/getMyProcessCount.do'
-        resp = self.session.post(task_url)
+
+    @timed('login')
+    def authenticate(self):
+        salt, execution = self.get_salt_and_execution()
+        resp = self.session.post(f'{self.BASE_URL}/authserver/login', data=self.login_payload(salt, execution),
+                                 headers=self.LOGIN_HEADERS, allow_redirects=True)
+        self.copy_cookies_to_new_domain(urlsplit(self.BASE_URL).hostname, urlsplit(self.EHALL_URL).hostname)
+        # Without a session the task center redirects to the login page, which
+        # would answer 200 if followed
+        resp = self.session.post(self.TASK_URL, allow_redirects=False, idempotent=True)
+        return resp.status_code == 200
+
+    @timed('login')
+    async def aauthenticate(self):
+        resp = await self.http.get(self.login_page_url())
+        salt, execution = self.parse_salt_and_execution(resp.text)
+        await self.http.post(f'{self.BASE_URL}/authserver/login', data=self.login_payload(salt, execution),
+                             headers=self.LOGIN_HEADERS)
+        self.copy_cookies_to_new_domain(urlsplit(self.BASE_URL).hostname, urlsplit(self.EHALL_URL).hostname, self.http.cookies)
+        resp = await self.http.post(self.TASK_URL, follow_redirects=False, extensions=self.IDEMPOTENT)
         return resp.status_code == 200
 
-    def copy_cookies_to_new_domain(self, old_domain, new_domain):
+    def copy_cookies_to_new_domain(self, old_domain, new_domain, cookies=None):
+        # Works on both a requests and an httpx cookie jar
+        cookies = self.session.cookies if cookies is None else cookies
         new_cookies = SimpleCookie()
-        for cookie in self.session.cookies:
+        for cookie in getattr(cookies, 'jar', cookies):
             if old_domain in cookie.domain:
                 new_cookie = SimpleCookie()
                 new_cookie[cookie.name] = cookie.value
@@ -54,21 +177,71 @@ class NWAFUAcademicSystemClient(BaseAcademicSystemClient):
                 new_cookies.update(new_cookie)
         
         for key, morsel in new_cookies.items():
-            self.session.cookies.set(key, morsel.value, domain=new_domain, path='/')
+            cookies.set(key, morsel.value, domain=new_domain, path='/')
 
-    def get_salt_and_execution(self):
-        url = f'{self.BASE_URL}/authserver/login?service={self.EHALL_URL}%2Flogin%3Fservice%3D{self.EHALL_URL}%2Fywtb-portal%2FLite%2Findex.html%3Fbrowser%3Dno%23%2FcusHall'
-        resp = self.session.get(url)
+    def login_page_url(self):
+        return f'{self.BASE_URL}/authserver/login?service={self.EHALL_URL}%2Flogin%3Fservice%3D{self.EHALL_URL}%2Fywtb-portal%2FLite%2Findex.html%3Fbrowser%3Dno%23%2FcusHall'
+
+    @staticmethod
+    def hidden_input(page, input_id):
         #  <input type="hidden" id="pwdEncryptSalt" value="66R9pzYqIdbUfGfG"/>
-        soup = BeautifulSoup(resp.text, "html.parser")
-        return soup.find("input", {"id": "pwdEncryptSalt"})["value"], soup.find("input", {"id": "execution"})["value"]
+        tag = _HIDDEN_INPUTS[input_id].search(page)
+        value = _VALUE_ATTR.search(tag.group(0)) if tag else None
+        if value is None:
+            raise UpstreamError(f"Login page has no {input_id} input")
+        return html.unescape(value.group(1) if value.group(1) is not None else value.group(2))
+
+    @staticmethod
+    def parse_salt_and_execution(page):
+        return (NWAFUAcademicSystemClient.hidden_input(page, 'pwdEncryptSalt'),
+                NWAFUAcademicSystemClient.hidden_input(page, 'execution'))
+
+    def get_salt_and_execution(self):
+        resp = self.session.get(self.login_page_url())
+        return self.parse_salt_and_execution(resp.text)
+
+    def load_app_config(self):
+        # The wdkbby app only answers once its config has been requested in
+        # this session; doing it once per login is enough.
+        if not self.app_config_loaded:
+            self.session.get(self.APP_CONFIG_URL)
+            self.app_config_loaded = True
 
+    async def aload_app_config(self):
+        if not self.app_config_loaded:
+            await self.http.get(self.APP_CONFIG_URL)
+            self.app_config_loaded = True
+
+    @timed('semester')
     def fetch_current_semester(self):
-        weu_url = f"{self.JWAPP_URL}/funauthapp/api/getAppConfig/wdkbby-5959167891382285.do"
-        resp = self.session.get(weu_url)
+        self.load_app_config()
+        url = f"{self.JWAPP_URL}/wdkbby/modules/jshkcb/dqxnxq.do"
+        resp = self.session.post(url, idempotent=True)
+        return self.parse_current_semester(self.query_rows(resp, "dqxnxq"))
+
+    @timed('semester')
+    async def afetch_current_semester(self):
+        await self.aload_app_config()
         url = f"{self.JWAPP_URL}/wdkbby/modules/jshkcb/dqxnxq.do"
-        resp = self.session.post(url)
-        return resp.json()["datas"]["dqxnxq"]["rows"][0]["DM"]
+        resp = await self.http.post(url, extensions=self.IDEMPOTENT)
+        return self.parse_current_semester(self.query_rows(resp, "dqxnxq"))
+
+    @staticmethod
+    def query_rows(resp, name):
+        """The rows of an ehall query, or UpstreamError if the answer is anything else."""
+        try:
+            rows = resp.json()["datas"][name]["rows"]
+        except (ValueError, KeyError, TypeError) as e:
+            raise UpstreamError(f"Unexpected {name} response (HTTP {resp.status_code})") from e
+        if not isinstance(rows, list):
+            raise UpstreamError(f"Unexpected {name} response (HTTP {resp.status_code})")
+        return rows
+
+    @staticmethod
+    def parse_current_semester(rows):
+        if not rows or not rows[0].get("DM"):
+            raise UpstreamError("No current semester in dqxnxq response")
+        return rows[0]["DM"]
     
     def fetch_exams(self):
         pass
@@ -76,126 +249,156 @@ class NWAFUAcademicSystemClient(BaseAcademicSystemClient):
     def process_exam_data(self):
         pass
 
-    def fetch_first_week_date(self):
-        weu_url = f"{self.JWAPP_URL}/funauthapp/api/getAppConfig/wdkbby-5959167891382285.do"
-        resp = self.session.get(weu_url)
-        url = f"{self.JWAPP_URL}/wdkbby/modules/xskcb/cxxljc.do"
+    def first_week_payload(self):
         """
         XN: 2024-2025
         XQ: 1
         """
-        payload = {
-            "XN": self.current_semester[:9],
-            "XQ": self.current_semester[-1:],
+        return {
+            "XN": self.semester[:9],
+            "XQ": self.semester[-1:],
         }
-        resp = self.session.post(url, data=payload)
-        first_week_date = resp.json()["datas"]["cxxljc"]["rows"][0]["XQKSRQ"]
+
+    @staticmethod
+    def parse_first_week_date(rows):
+        if not rows or not rows[0].get("XQKSRQ"):
+            raise UpstreamError("No first week date in cxxljc response")
         # XQKSRQ: "2024-09-09 00:00:00"
-        return datetime.strptime(first_week_date, "%Y-%m-%d %H:%M:%S").timestamp()
+        return datetime.strptime(rows[0]["XQKSRQ"], "%Y-%m-%d %H:%M:%S").timestamp()
 
-    def fetch_courses(self):
-        url = f"{self.JWAPP_URL}/wdkbby/modules/xskcb/xsdkkc.do"
-        payload = {
-            "XNXQDM": self.current_semester,
+    @timed('first_week')
+    def fetch_first_week_date(self):
+        self.load_app_config()
+        url = f"{self.JWAPP_URL}/wdkbby/modules/xskcb/cxxljc.do"
+        resp = self.session.post(url, data=self.first_week_payload(), idempotent=True)
+        return self.parse_first_week_date(self.query_rows(resp, "cxxljc"))
+
+    @timed('first_week')
+    async def afetch_first_week_date(self):
+        await self.aload_app_config()
+        url = f"{self.JWAPP_URL}/wdkbby/modules/xskcb/cxxljc.do"
+        resp = await self.http.post(url, data=self.first_week_payload(), extensions=self.IDEMPOTENT)
+        return self.parse_first_week_date(self.query_rows(resp, "cxxljc"))
+
+    def course_payload(self):
+        return {
+            "XNXQDM": self.semester,
             "*order": "-SQSJ",
             "querySetting": "[{\"name\":\"BYBZ\",\"builder\":\"notEqual\",\"linkOpt\":\"AND\",\"value\":\"1\"}]",
         }
-        resp = self.session.post(url, data=payload)
-        self.courses = resp.json()["datas"]["xsdkkc"]["rows"]
 
+    def list_semesters(self):
+        # There is no semester list to query; semesters are named after the
+        # academic year, so offer the years around the current one
+        if not self.current_semester:
+            return super().list_semesters()
+        year = int(self.current_semester[:4])
+        return academic_year_semesters(year - 4, year)
+
+    def course_snapshot(self):
+        return self.semester, self.courses, self.first_week_date
+
+    def restore_course_snapshot(self, snapshot):
+        self.semester, self.courses, self.first_week_date = snapshot
+
+    @timed('courses')
+    def fetch_courses(self, semester=None):
+        # Pick up a semester rollover even on a long-lived pooled session
+        self.current_semester = self.load_current_semester() or self.current_semester
+        self.semester = semester or self.current_semester
+        url = f"{self.JWAPP_URL}/wdkbby/modules/xskcb/xsdkkc.do"
         zhkb_url = f"{self.JWAPP_URL}/wdkbby/modules/xskcb/cxxszhxqkb.do"
-        resp = self.session.post(zhkb_url, data=payload)
-        self.courses.extend(resp.json()["datas"]["cxxszhxqkb"]["rows"])
-
-    def create_class_time_map(self):
-        winter_map = {
-            1: ("08:00", "08:40"),
-            2: ("08:50", "09:30"),
-            3: ("09:50", "10:30"),
-            4: ("10:40", "11:20"),
-            5: ("11:30", "12:10"),
-            6: ("14:00", "14:40"),
-            7: ("14:50", "15:30"),
-            8: ("15:40", "16:20"),
-            9: ("16:30", "17:10"),
-            10: ("17:20", "18:00"),
-            11: ("19:30", "20:10"),
-            12: ("20:15", "20:55"),
-            13: ("21:00", "21:40")
-        }
+        payload = self.course_payload()
+        self.load_app_config()
 
-        summer_map = {
-            1: ("08:00", "08:40"),
-            2: ("08:50", "09:30"),
-            3: ("09:50", "10:30"),
-            4: ("10:40", "11:20"),
-            5: ("11:30", "12:10"),
-            6: ("14:30", "15:10"),
-            7: ("15:20", "16:00"),
-            8: ("16:10", "16:50"),
-            9: ("17:00", "17:40"),
-            10: ("17:50", "18:30"),
-            11: ("19:30", "20:10"),
-            12: ("20:15", "20:55"),
-            13: ("21:00", "21:40")
-        }
+        calls = [
+            lambda: self.query_rows(self.session.post(url, data=payload, idempotent=True), "xsdkkc"),
+            lambda: self.query_rows(self.session.post(zhkb_url, data=payload, idempotent=True), "cxxszhxqkb"),
+        ]
+        self.first_week_date = school_metadata.get(self.SCHOOL, ('first_week_date', self.semester))
+        if self.first_week_date is None:
+            calls.append(self.load_first_week_date)
+        results = run_concurrently(*calls)
 
-        return {"winter": winter_map, "summer": summer_map}
-    
-    def calculate_date(self, week, day_of_week):
-        """
-        Calculate the date based on the week number and day of the week.
-        
-        :param week: int, the week number (1-based)
-        :param day_of_week: int, the day of the week (1 for Monday, 7 for Sunday)
-        :return: datetime object representing the calculated date
-        """
+        self.courses = results[0] + results[1]
+        if self.first_week_date is None:
+            self.first_week_date = results[2]
+        return True
+
+    @timed('courses')
+    async def afetch_courses(self, semester=None):
+        self.current_semester = await self.aload_current_semester() or self.current_semester
+        self.semester = semester or self.current_semester
+        url = f"{self.JWAPP_URL}/wdkbby/modules/xskcb/xsdkkc.do"
+        zhkb_url = f"{self.JWAPP_URL}/wdkbby/modules/xskcb/cxxszhxqkb.do"
+        payload = self.course_payload()
+        await self.aload_app_config()
+
+        async def rows(query_url, name):
+            resp = await self.http.post(query_url, data=payload, extensions=self.IDEMPOTENT)
+            return self.query_rows(resp, name)
+
+        calls = [rows(url, "xsdkkc"), rows(zhkb_url, "cxxszhxqkb")]
+        self.first_week_date = school_metadata.get(self.SCHOOL, ('first_week_date', self.semester))
+        if self.first_week_date is None:
+            calls.append(self.aload_first_week_date())
+        results = await asyncio.gather(*calls)
+
+        self.courses = results[0] + results[1]
+        if self.first_week_date is None:
+            self.first_week_date = results[2]
+        return True
+
+    @timed('parse_courses')
+    def process_course_data(self, date_range=None):
+        self.semester = self.semester or self.current_semester
+        if self.first_week_date is None and self.semester:
+            self.first_week_date = self.load_first_week_date()
+        if not self.courses:
+            return []
         if not self.first_week_date:
             raise ValueError("First week date is not set")
-        
-        # Convert first_week_date from timestamp to datetime
-        first_week_datetime = datetime.fromtimestamp(self.first_week_date)
-        
-        # Calculate the number of days to add
-        days_to_add = (week - 1) * 7 + (day_of_week - 1)
-        
-        # Calculate the target date
-        target_date = first_week_datetime + timedelta(days=days_to_add)
-        
-        return target_date
 
-    def process_course_data(self):
+        # Determine if it's winter or summer based on the semester
+        season = "winter" if int(self.semester[-1:]) == 1 else "summer"
+        periods = self.class_time_map[season]
+        first_day = datetime.fromtimestamp(self.first_week_date).date().toordinal()
+        first, last = (None, None) if date_range is None else date_range
+        first = first.toordinal() if first else None
+        last = last.toordinal() if last else None
+
         result = []
         for course in self.courses:
-            # Determine if it's winter or summer based on the semester
-            season = "winter" if int(self.current_semester[-1:]) == 1 else "summer"
-            start_number = course["KSJC"]
-            end_number = course["JSJC"]
-            
-            start_time = self.class_time_map[season][start_number][0]
-            end_time = self.class_time_map[season][end_number][1]
-            
-            SKZC = course["SKZC"]
-            week_numbers = [i for i in range(1, len(SKZC)+1) if SKZC[i-1] == "1"]
-            for week_number in week_numbers:
-                # Use get() method with a default value to avoid KeyError
-                day_of_week = course.get("XSKXQ") or course.get("SKXQ")
-                if day_of_week is None:
-                    print(f"Warning: Missing day of week for course {course.get('KCM', 'Unknown')}")
-                    continue
-                
-                date = self.calculate_date(week_number, int(day_of_week))
-                course_info = {
-                    "lessonId": course["XNXQDM"] + course["KCH"],
-                    "courseName": course["KCM"],
-                    "personName": course.get("XSKJSXM", course.get("SKJS")),
-                    "roomZh": course.get("JASDM", "未知地点"),
-                    "startTime": start_time,
-                    "endTime": end_time,
-                }
-                # Convert date to string format and use it for parsing
-                date_str = date.strftime("%Y-%m-%d")
-                course_info["start"] = datetime.strptime(f"{date_str} {course_info['startTime']}", "%Y-%m-%d %H:%M")
-                course_info["end"] = datetime.strptime(f"{date_str} {course_info['endTime']}", "%Y-%m-%d %H:%M")
-                result.append(course_info)
+            day_of_week = course.get("XSKXQ") or course.get("SKXQ")
+            if day_of_week is None:
+                print(f"Warning: Missing day of week for course {course.get('KCM', 'Unknown')}")
+                continue
+
+            if course.get("KSJC") not in periods or course.get("JSJC") not in periods or not course.get("SKZC"):
+                print(f"Warning: Incomplete schedule for course {course.get('KCM', 'Unknown')}")
+                continue
+
+            start_time = periods[course["KSJC"]][0]
+            end_time = periods[course["JSJC"]][1]
+            # Every occurrence is the first one plus whole weeks
+            day = date.fromordinal(first_day + int(day_of_week) - 1)
+            first_start = datetime.combine(day, start_time)
+            first_end = datetime.combine(day, end_time)
+            lesson_id = course.get("XNXQDM", self.semester) + course.get("KCH", "")
+            course_name = course.get("KCM", "Unknown Course")
+            person_name = course.get("XSKJSXM", course.get("SKJS"))
+            room = course.get("JASDM", "未知地点")
+
+            weeks = week_indexes(course["SKZC"])
+            if first is not None or last is not None:
+                # Week i falls on day.toordinal() + 7 * i, so the range
+                # turns into bounds on the week index
+                base = day.toordinal()
+                low = -((base - first) // 7) if first is not None else 0
+                high = (last - base) // 7 if last is not None else len(course["SKZC"])
+                weeks = [index for index in weeks if low <= index <= high]
+            for index in weeks:
+                offset = week_offset(index)
+                result.append(CourseOccurrence(lesson_id, course_name, person_name, room, start_time, end_time,
+                                               first_start + offset, first_end + offset))
         return result
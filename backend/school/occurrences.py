@@ -0,0 +1,101 @@
+"""
+Bulk expansion of weekly course slots into dated occurrences.
+
+A course that meets on the same weekday and period in many weeks is
+expanded by decoding its week bitmap with integer bit operations and adding
+whole-week offsets to the first occurrence, instead of building a date for
+every week from scratch.
+"""
+import re
+from collections.abc import MutableMapping
+from datetime import timedelta
+
+_BITMAP = re.compile(r"[01]*")
+_NOT_ONE = re.compile(r"[^1]")
+
+# timedelta(weeks=i) for the weeks any semester can have
+_WEEK_OFFSETS = [timedelta(weeks=i) for i in range(64)]
+
+
+class CourseOccurrence(MutableMapping):
+    """
+    One class meeting, the CourseInfo fields in a __slots__ record.
+
+    It is read and annotated like the course dicts the rest of the code
+    expects (``course['start']``, ``course.get('uid')``, ``dict(course)``),
+    at a fraction of a dict's memory. Besides the CourseInfo fields it holds
+    the period times, the 'uid', 'sequence' and 'lastModified' annotations
+    added by timetable_diff and the 'seriesSequence' and 'seriesModified'
+    ones of recurrence.track_series.
+    """
+    __slots__ = ('lessonId', 'courseName', 'personName', 'roomZh', 'startTime', 'endTime', 'start', 'end',
+                 'uid', 'sequence', 'lastModified', 'seriesSequence', 'seriesModified')
+
+    def __init__(self, lessonId, courseName, personName, roomZh, startTime, endTime, start, end):
+        self.lessonId = lessonId
+        self.courseName = courseName
+        self.personName = personName
+        self.roomZh = roomZh
+        self.startTime = startTime
+        self.endTime = endTime
+        self.start = start
+        self.end = end
+
+    def __getitem__(self, key):
+        if key in _FIELDS:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                pass
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key not in _FIELDS:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __delitem__(self, key):
+        if key in _FIELDS:
+            try:
+                return delattr(self, key)
+            except AttributeError:
+                pass
+        raise KeyError(key)
+
+    def __iter__(self):
+        return (name for name in self.__slots__ if hasattr(self, name))
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __contains__(self, key):
+        return key in _FIELDS and hasattr(self, key)
+
+    def get(self, key, default=None):
+        return getattr(self, key, default) if key in _FIELDS else default
+
+    def __repr__(self):
+        return f"CourseOccurrence({dict(self)!r})"
+
+
+_FIELDS = frozenset(CourseOccurrence.__slots__)
+
+
+def week_indexes(bitmap):
+    """0-based positions of the '1's in a week bitmap: '0110' -> [1, 2]."""
+    if not _BITMAP.fullmatch(bitmap):
+        bitmap = _NOT_ONE.sub("0", bitmap)
+    if not bitmap:
+        return []
+    # Reversed, so week 1 is the lowest bit
+    mask = int(bitmap[::-1], 2)
+    indexes = []
+    while mask:
+        low = mask & -mask
+        indexes.append(low.bit_length() - 1)
+        mask ^= low
+    return indexes
+
+
+def week_offset(index):
+    return _WEEK_OFFSETS[index] if index < len(_WEEK_OFFSETS) else timedelta(weeks=index)
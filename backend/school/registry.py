@@ -0,0 +1,140 @@
+"""
+Which academic-system client serves which school.
+
+Adapters are declared as "module:Class" paths and only imported the first
+time their school is asked for, so a cold start pays for the schools its
+requests actually use; requests, pycryptodome and the NWAFU encryption
+code are not loaded at all before that. Adding a school doesn't slow down
+any other.
+
+Besides the built-in schools, adapters can be declared
+- by installed packages, under the ``coursesync.schools`` entry point group:
+      [project.entry-points."coursesync.schools"]
+      abcu = "abcu_calendar.client:ABCUAcademicSystemClient"
+- with SCHOOL_ADAPTERS="abcu=abcu_calendar.client:ABCUAcademicSystemClient,..."
+  (which also overrides a built-in path).
+"""
+import importlib
+import os
+import threading
+
+ENTRY_POINT_GROUP = 'coursesync.schools'
+
+BUILTIN_ADAPTERS = {
+    'xauat': 'school.xauat.xauat_client:XAUATAcademicSystemClient',
+    'nwafu': 'school.nwafu.nwafu_client:NWAFUAcademicSystemClient',
+    # Add other schools and their clients here
+}
+
+
+def parse_adapters(value):
+    """'a=pkg.mod:Class,b=...' -> {'a': 'pkg.mod:Class', ...}"""
+    adapters = {}
+    for item in (value or "").split(','):
+        name, sep, path = item.partition('=')
+        if not item.strip():
+            continue
+        if not sep or ':' not in path:
+            raise ValueError(f"Invalid school adapter {item.strip()!r}, expected name=module:Class")
+        adapters[name.strip().lower()] = path.strip()
+    return adapters
+
+
+def import_adapter(path):
+    module_name, _, attribute = path.partition(':')
+    target = importlib.import_module(module_name.strip())
+    for name in attribute.strip().split('.'):
+        target = getattr(target, name)
+    return target
+
+
+class SchoolRegistry:
+    def __init__(self, adapters=None, entry_point_group=ENTRY_POINT_GROUP):
+        self._paths = dict(adapters or {})
+        self._classes = {}
+        self._entry_point_group = entry_point_group
+        # Installed packages are only scanned when a name isn't known otherwise
+        self._discovered = entry_point_group is None
+        self._lock = threading.Lock()
+
+    def register(self, school, adapter):
+        """Declare ``adapter``, a "module:Class" path or the class itself, for ``school``."""
+        school = school.lower()
+        with self._lock:
+            self._classes.pop(school, None)
+            if isinstance(adapter, str):
+                self._paths[school] = adapter
+            else:
+                self._paths[school] = f"{adapter.__module__}:{adapter.__qualname__}"
+                self._classes[school] = adapter
+
+    def _discover(self):
+        with self._lock:
+            if self._discovered:
+                return
+            self._discovered = True
+            try:
+                from importlib.metadata import entry_points
+                declared = entry_points(group=self._entry_point_group)
+            except Exception as e:
+                print(f"Failed to read {self._entry_point_group} entry points: {e}")
+                return
+            for entry_point in declared:
+                # The built-in and configured adapters win over installed ones
+                self._paths.setdefault(entry_point.name.lower(), entry_point.value)
+
+    def __contains__(self, school):
+        school = school.lower()
+        if school not in self._paths:
+            self._discover()
+        return school in self._paths
+
+    def names(self):
+        self._discover()
+        return sorted(self._paths)
+
+    def load(self, school):
+        """The client class of ``school``, importing it on first use."""
+        school = school.lower()
+        client_class = self._classes.get(school)
+        if client_class is not None:
+            return client_class
+        if school not in self:
+            raise ValueError(f"Unsupported school: {school}")
+
+        path = self._paths[school]
+        # Module imports are serialized by the import lock, so a concurrent
+        # first use of the same school at worst repeats the getattr.
+        client_class = import_adapter(path)
+        from .base_client import BaseAcademicSystemClient
+        if not (isinstance(client_class, type) and issubclass(client_class, BaseAcademicSystemClient)):
+            raise TypeError(f"School adapter {path} is not a BaseAcademicSystemClient")
+        with self._lock:
+            self._classes[school] = client_class
+        return client_class
+
+    def preload(self, schools=None):
+        """Import the adapters of ``schools`` (all of them by default) ahead of the first request."""
+        for school in schools if schools is not None else self.names():
+            try:
+                self.load(school)
+            except Exception as e:
+                print(f"Failed to load school adapter {school}: {e}")
+
+
+def default_registry():
+    adapters = dict(BUILTIN_ADAPTERS)
+    try:
+        adapters.update(parse_adapters(os.getenv("SCHOOL_ADAPTERS")))
+    except ValueError as e:
+        print(f"Failed to parse SCHOOL_ADAPTERS: {e}")
+    registry = SchoolRegistry(adapters)
+    # Long-running servers can pay the imports at startup instead,
+    # e.g. SCHOOL_PRELOAD=all or SCHOOL_PRELOAD=xauat,nwafu
+    preload = os.getenv("SCHOOL_PRELOAD", default="")
+    if preload:
+        registry.preload(None if preload == 'all' else [s.strip() for s in preload.split(',') if s.strip()])
+    return registry
+
+
+school_registry = default_registry()
@@ -0,0 +1,53 @@
+"""
+Semester names and the stretch of the calendar they cover.
+
+Neither academic system tells us when a semester ends, so spans are
+estimated from the academic year in the name ("2024-2025-1" is the autumn
+semester of 2024-2025). The estimates overlap generously; they only decide
+which semesters to fetch for a date range, the occurrences themselves are
+filtered on their real dates.
+"""
+import re
+from datetime import date
+
+_NAME = re.compile(r"(\d{4})\s*-\s*(\d{4})\D*?([12])(?!\d)")
+
+
+def semester_span(name):
+    """(first, last) date a semester can have classes on, or None if the name isn't recognized."""
+    match = _NAME.search(name or "")
+    if match is None:
+        return None
+    first_year, second_year, term = int(match.group(1)), int(match.group(2)), match.group(3)
+    if term == "1":
+        return date(first_year, 8, 1), date(second_year, 2, 28)
+    return date(second_year, 2, 1), date(second_year, 8, 31)
+
+
+def overlaps(span, date_range):
+    start, end = date_range
+    return (end is None or span[0] <= end) and (start is None or span[1] >= start)
+
+
+def semesters_in_range(semesters, date_range):
+    """
+    The ids of ``semesters`` (a list of (id, name)) that may have classes
+    inside ``date_range``, a (start, end) pair of dates where either end may
+    be None.
+    """
+    selected = []
+    for semester_id, name in semesters:
+        span = semester_span(name)
+        if span is not None and overlaps(span, date_range):
+            selected.append(semester_id)
+    return selected
+
+
+def academic_year_semesters(first_year, last_year):
+    """(id, name) of both semesters of every academic year from first_year to last_year, as NWAFU names them."""
+    return [(f"{year}-{year + 1}-{term}",) * 2 for year in range(first_year, last_year + 1) for term in (1, 2)]
+
+
+def in_range(day, date_range):
+    start, end = date_range
+    return (start is None or day >= start) and (end is None or day <= end)
@@ -0,0 +1,190 @@
+"""
+Per-school limits on how we talk to the academic systems.
+
+Every request a client makes goes through its school's UpstreamPolicy:
+connect/read timeouts, a token bucket that caps the request rate, jittered
+retries for idempotent calls (GETs and the read-only query POSTs marked
+``idempotent=True``), and a circuit breaker. After enough consecutive
+failures the breaker opens and requests to that school fail immediately
+with UpstreamUnavailable, so a slow campus can't tie up the workers every
+other school needs; the app keeps serving cached calendars meanwhile.
+
+Settings come from UPSTREAM_<NAME>, overridable per school with
+UPSTREAM_<NAME>_<SCHOOL>, e.g. UPSTREAM_RATE_NWAFU=5.
+
+This module only holds the bookkeeping and imports neither requests nor
+httpx; http_session and async_http apply it to their sessions.
+"""
+import os
+import random
+import threading
+import time
+from metrics import UPSTREAM_REJECTED
+
+IDEMPOTENT_METHODS = frozenset(('GET', 'HEAD', 'OPTIONS'))
+RETRY_STATUSES = frozenset((429, 502, 503, 504))
+
+
+class UpstreamUnavailable(ConnectionError):
+    """A request was refused locally because the school is unhealthy or over its rate."""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class UpstreamError(Exception):
+    """The academic system answered, but not with what we asked for."""
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, max_wait):
+        """
+        Take a token and return how long to wait before using it, or None
+        if that would be longer than ``max_wait`` (nothing is taken then).
+        """
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            wait = (1 - self._tokens) / self.rate if self._tokens < 1 else 0.0
+            if wait > max_wait:
+                return None
+            self._tokens -= 1
+            return wait
+
+
+class CircuitBreaker:
+    """
+    Closed until ``threshold`` consecutive failures, then open for
+    ``reset_timeout`` seconds; after that one trial request is let through
+    (half-open) and its outcome closes or reopens the breaker.
+    """
+
+    def __init__(self, threshold=5, reset_timeout=30):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        # When the half-open trial request was let through
+        self._trial = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        return 'half_open' if time.monotonic() - self.opened_at >= self.reset_timeout else 'open'
+
+    def retry_after(self):
+        if self.opened_at is None:
+            return 0
+        return max(0, self.reset_timeout - (time.monotonic() - self.opened_at))
+
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            now = time.monotonic()
+            if now - self.opened_at < self.reset_timeout:
+                return False
+            # A trial that never reported back (cancelled, say) doesn't block forever
+            if self._trial is not None and now - self._trial < self.reset_timeout:
+                return False
+            self._trial = now
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial is not None or self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+            self._trial = None
+
+
+def _setting(name, school, default):
+    value = os.getenv(f"UPSTREAM_{name}_{school.upper()}") or os.getenv(f"UPSTREAM_{name}")
+    return float(value) if value else default
+
+
+class UpstreamPolicy:
+    def __init__(self, school):
+        self.school = school
+        self.connect_timeout = _setting("CONNECT_TIMEOUT", school, 5.0)
+        self.read_timeout = _setting("READ_TIMEOUT", school, 20.0)
+        self.retries = int(_setting("RETRIES", school, 2))
+        self.backoff = _setting("BACKOFF", school, 0.5)
+        # Longest a request may queue for a token before it is refused
+        self.max_wait = _setting("MAX_QUEUE_WAIT", school, 10.0)
+        self.bucket = TokenBucket(_setting("RATE", school, 50.0), _setting("BURST", school, 100.0))
+        self.breaker = CircuitBreaker(int(_setting("BREAKER_THRESHOLD", school, 5)),
+                                      _setting("BREAKER_RESET", school, 30.0))
+
+    @property
+    def timeout(self):
+        return (self.connect_timeout, self.read_timeout)
+
+    def attempts(self, method, idempotent=False):
+        return self.retries + 1 if idempotent or method.upper() in IDEMPOTENT_METHODS else 1
+
+    def admit(self):
+        """Returns how long to wait before sending, or raises UpstreamUnavailable."""
+        wait = self.bucket.reserve(self.max_wait)
+        if wait is None:
+            UPSTREAM_REJECTED.inc(self.school, 'rate_limited')
+            raise UpstreamUnavailable(f"Too many requests queued for {self.school}", retry_after=self.max_wait)
+        if not self.breaker.allow():
+            UPSTREAM_REJECTED.inc(self.school, 'circuit_open')
+            raise UpstreamUnavailable(f"{self.school} is unavailable, not retrying yet",
+                                      retry_after=self.breaker.retry_after())
+        return wait
+
+    def record(self, status=None):
+        """Feed a response status (None for a connection error or timeout) to the breaker."""
+        if status is None or status >= 500:
+            self.breaker.record_failure()
+        elif status != 429:
+            self.breaker.record_success()
+
+    def retry_delay(self, attempt, retry_after=None):
+        # Full jitter, so clients that failed together don't retry together
+        delay = random.uniform(0, self.backoff * 2 ** attempt)
+        if retry_after:
+            try:
+                delay = max(delay, min(float(retry_after), self.read_timeout))
+            except ValueError:
+                pass
+        return delay
+
+
+_policies = {}
+_lock = threading.Lock()
+
+
+def open_circuits():
+    """How many schools are currently failing fast."""
+    return sum(1 for policy in list(_policies.values()) if policy.breaker.state != 'closed')
+
+
+def upstream_policy(school):
+    """The shared UpstreamPolicy of ``school``."""
+    with _lock:
+        policy = _policies.get(school)
+        if policy is None:
+            policy = _policies[school] = UpstreamPolicy(school)
+        return policy
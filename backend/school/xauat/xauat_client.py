@@ -1,83 +1,228 @@
+import os
 import requests
 import hashlib
 import re
-import json
-from bs4 import BeautifulSoup
 from datetime import datetime
 from ..base_client import BaseAcademicSystemClient
+from ..http_session import create_session
+from ..async_http import create_async_session
+from ..metadata_cache import school_metadata
+from ..js_literal import extract_js_literal
+from ..upstream_policy import UpstreamError, UpstreamUnavailable
+from metrics import timed
+
+_SEMESTER_OPTION = re.compile(r'<option[^>]*?value="([^"]+)"[^>]*>([^<]+)</option>')
+
 
 class XAUATAcademicSystemClient(BaseAcademicSystemClient):
-    BASE_URL = "https://swjw.xauat.edu.cn/student"
+    SCHOOL = "xauat"
+    # Overridable so the benchmarks can point the client at a local mock
+    BASE_URL = os.getenv("XAUAT_BASE_URL", default="https://swjw.xauat.edu.cn/student")
 
-    def __init__(self, username, password):
+    def __init__(self, username, password, autologin=True):
         self.username = username
         self.password = password
-        self.session = requests.Session()
-        self.is_authenticated = self.authenticate()
-        self.current_semester = self.fetch_current_semester() if self.is_authenticated else None
+        self.session = create_session(self.SCHOOL)
+        self.http = None
+        self.semester = None
         self.courses = []
+        self.course_details = None
         self.exams = []
+        if autologin:
+            self.login()
+
+    def login(self):
+        self.session.cookies.clear()
+        self.is_authenticated = self.authenticate()
+        self.current_semester = self.load_current_semester() if self.is_authenticated else None
+
+    def load_current_semester(self):
+        return school_metadata.get_or_load(self.SCHOOL, 'current_semester', self.fetch_current_semester)
+
+    async def alogin(self):
+        self.http = create_async_session(school=self.SCHOOL)
+        self.is_authenticated = await self.aauthenticate()
+        self.current_semester = await self.aload_current_semester() if self.is_authenticated else None
+
+    async def aload_current_semester(self):
+        return await school_metadata.aget_or_load(self.SCHOOL, 'current_semester', self.afetch_current_semester)
+
+    def is_session_alive(self):
+        # An expired session is redirected to the login page instead of
+        # getting the course table.
+        try:
+            resp = self.session.get(f"{self.BASE_URL}/for-std/course-table", allow_redirects=False)
+        except (requests.RequestException, UpstreamUnavailable):
+            return False
+        return resp.status_code == 200
+
+    async def ais_session_alive(self):
+        try:
+            resp = await self.http.get(f"{self.BASE_URL}/for-std/course-table", follow_redirects=False)
+        except Exception:
+            return False
+        return resp.status_code == 200
+
+    def reset(self):
+        super().reset()
+        self.course_details = None
 
+    def login_payload(self, salt):
+        enc_passwd = hashlib.sha1(f"{salt}-{self.password}".encode('utf-8')).hexdigest()
+        return {'username': self.username, 'password': enc_passwd, 'captcha': 'false'}
+
+    @staticmethod
+    def json_payload(resp, name):
+        """The JSON object of a ``name`` response, or UpstreamError for anything else (a maintenance page, say)."""
+        try:
+            data = resp.json()
+        except ValueError as e:
+            raise UpstreamError(f"Unexpected {name} response (HTTP {resp.status_code})") from e
+        if not isinstance(data, dict):
+            raise UpstreamError(f"Unexpected {name} response (HTTP {resp.status_code})")
+        return data
+
+    @timed('login')
     def authenticate(self):
         salt = self.session.get(f"{self.BASE_URL}/login-salt").text
-        enc_passwd = hashlib.sha1(f"{salt}-{self.password}".encode('utf-8')).hexdigest()
-        payload = {'username': self.username, 'password': enc_passwd, 'captcha': 'false'}
-        resp = self.session.post(f"{self.BASE_URL}/login", json=payload)
-        return resp.json().get('result', False)
+        resp = self.session.post(f"{self.BASE_URL}/login", json=self.login_payload(salt))
+        return self.json_payload(resp, 'login').get('result', False)
+
+    @timed('login')
+    async def aauthenticate(self):
+        salt = (await self.http.get(f"{self.BASE_URL}/login-salt")).text
+        resp = await self.http.post(f"{self.BASE_URL}/login", json=self.login_payload(salt))
+        return self.json_payload(resp, 'login').get('result', False)
+
+    @staticmethod
+    def parse_current_semester(html):
+        match = re.search('selected" value="(.*?)"', html)
+        return match.group(1) if match else None
 
+    @staticmethod
+    def parse_semesters(html):
+        # 学期下拉框: <option value="301">2024-2025-1</option>
+        return [(value, name.strip()) for value, name in _SEMESTER_OPTION.findall(html)]
+
+    def list_semesters(self):
+        return school_metadata.get_or_load(self.SCHOOL, 'semesters', self.fetch_semesters) or super().list_semesters()
+
+    async def alist_semesters(self):
+        return await school_metadata.aget_or_load(self.SCHOOL, 'semesters', self.afetch_semesters) or super().list_semesters()
+
+    @timed('semester')
+    def fetch_semesters(self):
+        return self.parse_semesters(self.session.get(f"{self.BASE_URL}/for-std/course-table").text)
+
+    @timed('semester')
+    async def afetch_semesters(self):
+        return self.parse_semesters((await self.http.get(f"{self.BASE_URL}/for-std/course-table")).text)
+
+    @timed('semester')
     def fetch_current_semester(self):
         resp = self.session.get(f"{self.BASE_URL}/for-std/course-table").text
-        match = re.search('selected" value="(.*?)"', resp)
-        return match.group(1) if match else None
+        return self.parse_current_semester(resp)
+
+    @timed('semester')
+    async def afetch_current_semester(self):
+        resp = await self.http.get(f"{self.BASE_URL}/for-std/course-table")
+        return self.parse_current_semester(resp.text)
 
-    def fetch_courses(self):
-        if not self.is_authenticated or not self.current_semester:
+    def course_data_url(self):
+        return f'{self.BASE_URL}/for-std/course-table/get-data?bizTypeId=2&semesterId={self.semester}&dataId='
+
+    @timed('courses')
+    def fetch_courses(self, semester=None):
+        # Pick up a semester rollover even on a long-lived pooled session
+        if self.is_authenticated:
+            self.current_semester = self.load_current_semester() or self.current_semester
+        self.semester = semester or self.current_semester
+        # Nothing from an earlier fetch may pass for this semester's courses
+        self.courses, self.course_details = [], {}
+        if not self.is_authenticated or not self.semester:
+            return False
+        try:
+            resp = self.json_payload(self.session.get(self.course_data_url()), 'course list')
+            self.courses = resp['lessonIds']
+        except UpstreamError:
+            raise
+        except Exception as e:
+            print(f"Failed to fetch course list: {e}")
+            return False
+        # The schedule details depend on the lesson ids, so they are fetched
+        # right here and the exam page can load in parallel with both calls.
+        # A semester without lessons is stored as {} like any other.
+        self.course_details = self.fetch_course_details() or {}
+        return True
+
+    @timed('courses')
+    async def afetch_courses(self, semester=None):
+        if self.is_authenticated:
+            self.current_semester = await self.aload_current_semester() or self.current_semester
+        self.semester = semester or self.current_semester
+        # Nothing from an earlier fetch may pass for this semester's courses
+        self.courses, self.course_details = [], {}
+        if not self.is_authenticated or not self.semester:
             return False
-        url = f'{self.BASE_URL}/for-std/course-table/get-data?bizTypeId=2&semesterId={self.current_semester}&dataId='
         try:
-            resp = self.session.get(url).json()
+            resp = self.json_payload(await self.http.get(self.course_data_url()), 'course list')
             self.courses = resp['lessonIds']
-            return True
+        except UpstreamError:
+            raise
         except Exception as e:
             print(f"Failed to fetch course list: {e}")
             return False
+        self.course_details = await self.afetch_course_details() or {}
+        return True
 
+    @timed('exams')
     def fetch_exams(self):
         url = f"{self.BASE_URL}/for-std/exam-arrange"
         try:
-            resp = self.session.get(url).text
-            # 使用更精确的正则表达式匹配
-            match = re.search(r'var\s+studentExamInfoVms\s*=\s*(\[[\s\S]*?\]);', resp)
-            if not match:
-                return False
-            
-            # 清理JSON字符串 - 替换单引号为双引号
-            json_str = match.group(1).replace("'", '"')
-            # 处理JavaScript中的undefined值
-            json_str = re.sub(r':\s*undefined\b', ': null', json_str)
-            # 处理末尾的逗号
-            json_str = re.sub(r',(\s*[}\]])', r'\1', json_str)
-            
-            exam_data = json.loads(json_str)
-            self.exams = []
-            
-            for exam in exam_data:
-                course_name = exam['course']['nameZh']
-                exam_time = exam['examGroup']['examTime']['dateTimeString']
-                room = exam['examPlace']['room']['nameZh'] if exam['examPlace'].get('room') else "未知地点"
-                seat_no = exam['seatNo'] if exam['seatNo'] else "未知座位号"
-                self.exams.append({
-                    'course': course_name,
-                    'time': exam_time,
-                    'room': room,
-                    'seat_no': seat_no,
-                })
-            return True
-        
+            exams = self.parse_exams(self.session.get(url).text)
+        except Exception as e:
+            print(f"Failed to fetch exam schedule: {e}")
+            return False
+        if exams is None:
+            return False
+        self.exams = exams
+        return True
+
+    @timed('exams')
+    async def afetch_exams(self):
+        url = f"{self.BASE_URL}/for-std/exam-arrange"
+        try:
+            exams = self.parse_exams((await self.http.get(url)).text)
         except Exception as e:
             print(f"Failed to fetch exam schedule: {e}")
             return False
+        if exams is None:
+            return False
+        self.exams = exams
+        return True
+
+    @staticmethod
+    def parse_exams(resp):
+        # 考试安排以 JS 字面量嵌在页面中，只解析这一段，不改写字符串内容
+        exam_data = extract_js_literal(resp, 'studentExamInfoVms')
+        if exam_data is None:
+            return None
+
+        exams = []
+        for exam in exam_data:
+            course_name = exam['course']['nameZh']
+            exam_time = exam['examGroup']['examTime']['dateTimeString']
+            room = exam['examPlace']['room']['nameZh'] if exam['examPlace'].get('room') else "未知地点"
+            seat_no = exam['seatNo'] if exam['seatNo'] else "未知座位号"
+            exams.append({
+                'course': course_name,
+                'time': exam_time,
+                'room': room,
+                'seat_no': seat_no,
+            })
+        return exams
 
+    @timed('parse_exams')
     def process_exam_data(self):
         for exam in self.exams:
             date, time_range = exam['time'].split(' ')
@@ -89,19 +234,41 @@ class XAUATAcademicSystemClient(BaseAcademicSystemClient):
         if not self.courses:
             return None
         url = f"{self.BASE_URL}/ws/schedule-table/datum"
-        resp = self.session.post(url, json={"studentId": "null", 'lessonIds': self.courses})
-        return resp.json().get('result')
+        # A read-only query, so the upstream policy may retry it
+        resp = self.session.post(url, json={"studentId": "null", 'lessonIds': self.courses}, idempotent=True)
+        return self.json_payload(resp, 'schedule').get('result')
 
-    def process_course_data(self):
-        if not self.fetch_courses():
-            return []
-        data = self.fetch_course_details()
+    async def afetch_course_details(self):
+        if not self.courses:
+            return None
+        url = f"{self.BASE_URL}/ws/schedule-table/datum"
+        resp = await self.http.post(url, json={"studentId": "null", 'lessonIds': self.courses},
+                                    extensions={'idempotent': True})
+        return self.json_payload(resp, 'schedule').get('result')
+
+    def course_snapshot(self):
+        return self.semester, self.courses, self.course_details
+
+    def restore_course_snapshot(self, snapshot):
+        self.semester, self.courses, self.course_details = snapshot
+
+    @timed('parse_courses')
+    def process_course_data(self, date_range=None):
+        # Only parses what fetch_courses (or a restored snapshot) left behind
+        data = self.course_details
         if not data:
             return []
         
+        # schedule['date'] is an ISO date, so the range is checked on the
+        # strings before anything is built for a schedule
+        first, last = (None, None) if date_range is None else date_range
+        first = first.isoformat() if first else ""
+        last = last.isoformat() if last else "9999"
         course_dict = {lesson['id']: lesson['courseName'] for lesson in data['lessonList']}
         result = []
         for schedule in data['scheduleList']:
+            if not first <= schedule['date'] <= last:
+                continue
             schedule_info = {
                 'lessonId': schedule['lessonId'],
                 'courseName': course_dict.get(schedule['lessonId'], "Unknown Course"),
@@ -0,0 +1,104 @@
+import hmac
+import os
+import threading
+import time
+
+
+class PooledClient:
+    __slots__ = ('client', 'last_used', 'last_verified')
+
+    def __init__(self, client, now):
+        self.client = client
+        self.last_used = now
+        self.last_verified = now
+
+
+class SessionPool:
+    """
+    Keeps authenticated academic-system clients around between requests.
+
+    Clients are leased out exclusively: concurrent requests for the same user
+    never share a client, the second one simply logs in on its own and both
+    are returned to the pool afterwards (up to ``max_idle_per_user``).
+    """
+
+    def __init__(self, idle_timeout=1200, liveness_interval=60, max_idle_per_user=2, max_clients=512):
+        self.idle_timeout = idle_timeout
+        self.liveness_interval = liveness_interval
+        self.max_idle_per_user = max_idle_per_user
+        self.max_clients = max_clients
+        self._idle = {}
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def checkout(self, school, username, password, create_client):
+        pooled = self._take(school, username, password)
+        if pooled is None:
+            return create_client()
+
+        client = pooled.client
+        if time.time() - pooled.last_verified > self.liveness_interval and not client.is_session_alive():
+            client.login()
+        client.reset()
+        return client
+
+    async def acheckout(self, school, username, password, acreate_client):
+        """checkout for the ASGI server; ``acreate_client`` is a coroutine function."""
+        pooled = self._take(school, username, password)
+        if pooled is None:
+            return await acreate_client()
+
+        client = pooled.client
+        if time.time() - pooled.last_verified > self.liveness_interval and not await client.ais_session_alive():
+            await client.alogin()
+        client.reset()
+        return client
+
+    def checkin(self, school, client):
+        if not client.is_authenticated:
+            return
+        now = time.time()
+        key = (school, client.username)
+        with self._lock:
+            self._purge(now)
+            entries = self._idle.setdefault(key, [])
+            if len(entries) >= self.max_idle_per_user or self._count >= self.max_clients:
+                return
+            entries.append(PooledClient(client, now))
+            self._count += 1
+
+    def clear(self):
+        with self._lock:
+            self._idle.clear()
+            self._count = 0
+
+    def _take(self, school, username, password):
+        now = time.time()
+        with self._lock:
+            self._purge(now)
+            entries = self._idle.get((school, username))
+            if not entries:
+                return None
+            for i in range(len(entries) - 1, -1, -1):
+                if hmac.compare_digest(entries[i].client.password.encode('utf-8'), password.encode('utf-8')):
+                    self._count -= 1
+                    pooled = entries.pop(i)
+                    if not entries:
+                        del self._idle[(school, username)]
+                    return pooled
+        return None
+
+    def _purge(self, now):
+        for key in list(self._idle):
+            entries = [e for e in self._idle[key] if now - e.last_used < self.idle_timeout]
+            self._count -= len(self._idle[key]) - len(entries)
+            if entries:
+                self._idle[key] = entries
+            else:
+                del self._idle[key]
+
+
+session_pool = SessionPool(
+    idle_timeout=int(os.getenv("SESSION_POOL_IDLE_TIMEOUT", default=1200)),
+    liveness_interval=int(os.getenv("SESSION_POOL_LIVENESS_INTERVAL", default=60)),
+)
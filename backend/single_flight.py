@@ -0,0 +1,106 @@
+import asyncio
+import threading
+import time
+from metrics import FLIGHT_CALLS, FLIGHT_ERRORS, FLIGHT_SECONDS
+
+
+class TooManyWaiters(Exception):
+    pass
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error', 'followers')
+
+    def __init__(self, done=None):
+        self.done = done or threading.Event()
+        self.result = None
+        self.error = None
+        self.followers = 0
+
+
+class SingleFlight:
+    """
+    Collapses concurrent calls with the same key into one execution.
+
+    The first caller (the leader) runs the function; callers arriving while
+    it is in flight wait for it and get the same result or exception. At most
+    ``max_followers`` callers may wait on one key, further ones get
+    TooManyWaiters. Leaders, followers and rejections are counted and the
+    leaders' durations recorded in /metrics; not per key, which would be a
+    series per subscriber.
+
+    ``ado`` is the same for coroutine functions on an event loop; async and
+    threaded calls are tracked separately but share the metrics.
+    """
+
+    def __init__(self, max_followers=32):
+        self.max_followers = max_followers
+        self._calls = {}
+        self._async_calls = {}
+        self._lock = threading.Lock()
+
+    def _join(self, calls, key, new_call):
+        """Returns (call, leader) for a caller arriving at ``key``."""
+        with self._lock:
+            call = calls.get(key)
+            if call is not None:
+                if call.followers >= self.max_followers:
+                    FLIGHT_CALLS.inc('rejected')
+                    raise TooManyWaiters(f"{call.followers} requests already waiting")
+                call.followers += 1
+                FLIGHT_CALLS.inc('follower')
+                return call, False
+            call = calls[key] = new_call()
+            FLIGHT_CALLS.inc('leader')
+            return call, True
+
+    def _land(self, calls, key, call, elapsed):
+        with self._lock:
+            del calls[key]
+        FLIGHT_SECONDS.observe(elapsed)
+        if call.error is not None:
+            FLIGHT_ERRORS.inc()
+
+    def do(self, key, fn):
+        call, leader = self._join(self._calls, key, _Call)
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        started = time.perf_counter()
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            self._land(self._calls, key, call, time.perf_counter() - started)
+            call.done.set()
+
+    async def ado(self, key, fn):
+        call, leader = self._join(self._async_calls, key, lambda: _Call(asyncio.Event()))
+
+        if not leader:
+            await call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        started = time.perf_counter()
+        try:
+            call.result = await fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            self._land(self._async_calls, key, call, time.perf_counter() - started)
+            call.done.set()
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._calls) + len(self._async_calls)
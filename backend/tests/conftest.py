@@ -0,0 +1,9 @@
+import os
+import sys
+
+# The backend modules are imported as top-level modules, as the servers do
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Nothing under test may pick up a real store or vault from the environment
+for name in ('TIMETABLE_DB', 'CREDENTIAL_VAULT_DB', 'CREDENTIAL_VAULT_KEY', 'CREDENTIAL_VAULT_KEY_FILE'):
+    os.environ.pop(name, None)
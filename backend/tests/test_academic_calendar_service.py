@@ -0,0 +1,110 @@
+import json
+from collections import Counter
+from datetime import date, datetime
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+from academic_calendar_service import AcademicCalendarService
+from school.metadata_cache import school_metadata
+from school.xauat.xauat_client import XAUATAcademicSystemClient
+
+SEMESTER_PAGE = ('<select><option value="301">2024-2025-1</option>'
+                 '<option selected" value="302">2024-2025-2</option></select>')
+EXAM_PAGE = """<script>var studentExamInfoVms = [{
+    course: {nameZh: '高等数学'}, examGroup: {examTime: {dateTimeString: '2025-06-30 14:00~16:00'}},
+    examPlace: {room: {nameZh: '教2-202'}}, seatNo: 7}];</script>"""
+
+
+def schedule(dates):
+    return {
+        'lessonList': [{'id': 1, 'courseName': "高等数学"}],
+        'scheduleList': [{'lessonId': 1, 'date': day, 'startTime': 800, 'endTime': 940,
+                          'room': {'nameZh': "教1-101"}, 'personName': "张三"} for day in dates],
+    }
+
+
+class Response:
+    def __init__(self, data):
+        self.data = data
+
+    @property
+    def text(self):
+        return self.data
+
+    def json(self):
+        return json.loads(self.data) if isinstance(self.data, str) else self.data
+
+
+class FakeSession:
+    """Just the XAUAT endpoints fetch_courses and fetch_exams use; 301 has no lessons."""
+
+    def __init__(self):
+        self.calls = Counter()
+
+    def get(self, url, **kwargs):
+        path = urlsplit(url).path
+        self.calls[path] += 1
+        if path.endswith('/course-table/get-data'):
+            semester = parse_qs(urlsplit(url).query)['semesterId'][0]
+            return Response({'lessonIds': [1] if semester == '302' else []})
+        if path.endswith('/course-table'):
+            return Response(SEMESTER_PAGE)
+        if path.endswith('/exam-arrange'):
+            return Response(EXAM_PAGE)
+        raise AssertionError(f"unexpected GET {url}")
+
+    def post(self, url, json=None, **kwargs):
+        path = urlsplit(url).path
+        self.calls[path] += 1
+        assert path.endswith('/ws/schedule-table/datum') and json['lessonIds'] == [1]
+        return Response({'result': schedule(['2025-03-03', '2025-03-10', '2025-06-30'])})
+
+
+@pytest.fixture
+def service(request):
+    school_metadata.invalidate('xauat')
+    client = XAUATAcademicSystemClient('student', 'pw', autologin=False)
+    client.session = FakeSession()
+    client.is_authenticated = True
+    client.current_semester = '302'
+    return AcademicCalendarService('xauat', f"student-{request.node.name}", 'pw', client=client, pooled=False)
+
+
+def test_select_semesters(service):
+    listed = lambda: [('301', '2024-2025-1'), ('302', '2024-2025-2')]
+    assert service.select_semesters(None, None, listed) == [None]
+    assert service.select_semesters(['301', '302'], None, listed) == ['301', None]
+    assert service.select_semesters(None, (date(2024, 10, 1), date(2024, 11, 1)), listed) == ['301']
+    assert service.select_semesters(None, (date(2025, 4, 1), None), listed) == [None]
+    # Outside every semester we can date: nothing to fetch
+    assert service.select_semesters(None, (date(2030, 1, 1), None), listed) == []
+
+
+def test_empty_semester_is_not_replaced_by_the_current_one(service):
+    timetable = service.load_timetable(semesters=['301', '302'])
+    assert [course['start'] for course in timetable.courses] == [
+        datetime(2025, 3, 3, 8), datetime(2025, 3, 10, 8), datetime(2025, 6, 30, 8)]
+    assert len({course['uid'] for course in timetable.courses}) == 3
+    calls = service.client.session.calls
+    assert calls['/student/for-std/course-table/get-data'] == 2
+    assert calls['/student/ws/schedule-table/datum'] == 1
+
+
+def test_date_range_filters_classes_and_exams(service):
+    timetable = service.load_timetable(date_range=(date(2025, 3, 5), date(2025, 6, 29)))
+    assert [course['start'] for course in timetable.courses] == [datetime(2025, 3, 10, 8)]
+    assert timetable.exams == []
+
+    timetable = service.load_timetable(date_range=(date(2025, 6, 30), None))
+    assert [course['start'] for course in timetable.courses] == [datetime(2025, 6, 30, 8)]
+    assert [exam['course'] for exam in timetable.exams] == ["高等数学"]
+
+
+def test_process_course_data_never_fetches(service):
+    client = service.client
+    client.restore_course_snapshot(('301', [], {}))
+    assert client.process_course_data() == []
+    client.restore_course_snapshot(('301', [], None))
+    assert client.process_course_data() == []
+    assert not client.session.calls
@@ -0,0 +1,76 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import app as flask_app
+from refresh_scheduler import Subscription
+from school.nwafu.nwafu_client import NWAFUAcademicSystemClient
+from school.xauat.xauat_client import XAUATAcademicSystemClient
+
+MAINTENANCE_PAGE = "<html><body><h1>系统维护中</h1></body></html>".encode()
+
+
+class MaintenanceHandler(BaseHTTPRequestHandler):
+    """Answers everything with a maintenance page, as the schools do during upgrades."""
+
+    def reply(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        self.rfile.read(length)
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(MAINTENANCE_PAGE)))
+        self.end_headers()
+        self.wfile.write(MAINTENANCE_PAGE)
+
+    do_GET = do_POST = reply
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def maintenance(monkeypatch):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), MaintenanceHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    url = f"http://127.0.0.1:{server.server_port}"
+    monkeypatch.setattr(XAUATAcademicSystemClient, 'BASE_URL', f"{url}/student")
+    monkeypatch.setattr(NWAFUAcademicSystemClient, 'BASE_URL', url)
+    monkeypatch.setattr(NWAFUAcademicSystemClient, 'EHALL_URL', url)
+    yield url
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def client():
+    return flask_app.app.test_client()
+
+
+@pytest.mark.parametrize('school', ['xauat', 'nwafu'])
+def test_maintenance_page_is_unavailable_not_bad_request(maintenance, client, request, school):
+    resp = client.get('/class', query_string={'school': school, 'username': request.node.name,
+                                              'password': 'pw'})
+    assert resp.status_code == 503
+    assert resp.get_data(as_text=True) == "教务系统暂时不可用"
+
+
+def test_unknown_school_is_bad_request(client):
+    resp = client.get('/class', query_string={'school': 'nowhere', 'username': 'u', 'password': 'pw'})
+    assert resp.status_code == 400
+    assert "Unsupported school" in resp.get_data(as_text=True)
+
+
+def test_bad_query_is_bad_request(client):
+    resp = client.get('/class', query_string={'username': 'u', 'password': 'pw', 'mode': 'weekly'})
+    assert resp.status_code == 400
+
+
+def test_failed_background_login_drops_the_cached_render(monkeypatch):
+    key = flask_app.make_cache_key('xauat', 'refresh-user', {})
+    flask_app.calendar_cache.put(key, 'old-password', b'BEGIN:VCALENDAR\r\nEND:VCALENDAR\r\n')
+    monkeypatch.setattr(flask_app, 'render_calendar', lambda *args, **kwargs: None)
+    subscription = Subscription(key, 'xauat', 'refresh-user', 'old-password', {}, 0)
+    assert flask_app.refresh_subscription(subscription) is False
+    assert flask_app.calendar_cache.get(key, 'old-password', allow_stale=True) is None
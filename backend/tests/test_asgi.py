@@ -0,0 +1,94 @@
+import asyncio
+from datetime import datetime, timedelta
+from urllib.parse import urlencode
+
+import pytest
+
+import asgi
+from academic_calendar_service import AcademicCalendarService, Timetable
+
+START = datetime(2025, 3, 3, 8, 0)
+
+
+class FakeService:
+    """Stands in for a logged-in service; 'wrong' is the wrong password."""
+    created = []
+
+    def __init__(self, password):
+        self.password = password
+
+    @classmethod
+    async def acreate(cls, school, username, password):
+        cls.created.append((school, username))
+        return cls(password)
+
+    async def aload_timetable(self, semesters=None, date_range=None):
+        if self.password == 'wrong':
+            return None
+        courses = [{'lessonId': '1', 'courseName': "高等数学", 'personName': "张三", 'roomZh': "教1-101",
+                    'start': START + timedelta(weeks=week), 'end': START + timedelta(weeks=week, minutes=100)}
+                   for week in range(4)]
+        return Timetable(courses, [], 'revision-1', '302')
+
+
+@pytest.fixture(autouse=True)
+def fake_service(monkeypatch):
+    FakeService.created = []
+    monkeypatch.setattr(AcademicCalendarService, 'acreate', FakeService.acreate)
+
+
+def call(path, query=None, headers=None, method='GET'):
+    """Runs one request through the ASGI app, returns (status, headers, body)."""
+    scope = {
+        'type': 'http', 'method': method, 'path': path,
+        'query_string': urlencode(query or {}).encode(),
+        'headers': [(name.encode(), value.encode()) for name, value in (headers or {}).items()],
+    }
+    sent = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b''}
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(asgi.app(scope, receive, send))
+    start, body = sent
+    return start['status'], {name.decode(): value.decode() for name, value in start['headers']}, body['body']
+
+
+def test_class_round_trip_with_conditional_request(request):
+    query = {'username': request.node.name, 'password': 'pw'}
+    status, headers, body = call('/class', query)
+    assert status == 200
+    assert headers['content-type'].startswith('text/calendar')
+    assert headers['content-length'] == str(len(body))
+    assert body.startswith(b'BEGIN:VCALENDAR') and body.count(b'BEGIN:VEVENT') == 4
+
+    status, headers, body = call('/class', query, {'if-none-match': headers['etag']})
+    assert status == 304
+    assert body == b''
+    # The second request was answered from the cache
+    assert len(FakeService.created) == 1
+
+    # Another password doesn't unlock the cached render
+    status, _, _ = call('/class', dict(query, password='wrong'))
+    assert status == 401
+
+
+def test_head_has_headers_but_no_body(request):
+    query = {'username': request.node.name, 'password': 'pw', 'mode': 'rrule'}
+    status, get_headers, body = call('/class', query)
+    status, headers, head_body = call('/class', query, method='HEAD')
+    assert status == 200
+    assert head_body == b''
+    assert headers['etag'] == get_headers['etag']
+    assert headers['content-length'] == str(len(body))
+
+
+def test_bad_requests():
+    assert call('/class', {'username': 'u', 'password': 'pw', 'mode': 'weekly'})[0] == 400
+    assert call('/class', {'username': 'u'})[0] == 400
+    assert call('/class', method='POST')[0] == 405
+    assert call('/nowhere')[0] == 404
+    assert not FakeService.created
@@ -0,0 +1,112 @@
+import io
+import json
+import tarfile
+
+import pytest
+
+import batch_export
+from batch_export import read_credentials
+
+
+@pytest.fixture
+def students(tmp_path):
+    path = tmp_path / 'students.csv'
+    rows = [f"{'nwafu' if i % 2 else 'xauat'},stu{i},pw" for i in range(6)]
+    path.write_text("school,username,password\n" + "\n".join(rows + ["mit,x,y"]) + "\n", encoding='utf-8')
+    return str(path)
+
+
+@pytest.fixture
+def exported(monkeypatch):
+    """Renders each student without an upstream; usernames in ``failing`` raise."""
+    calls = []
+    failing = set()
+
+    def export_one(credential, options, throttle, combined):
+        calls.append(credential.key)
+        if credential.username in failing:
+            raise ConnectionError("upstream down")
+        event = f"BEGIN:VEVENT\r\nUID:{credential.key}\r\nEND:VEVENT\r\n".encode()
+        return event if combined else b"BEGIN:VCALENDAR\r\n" + event + b"END:VCALENDAR\r\n"
+
+    monkeypatch.setattr(batch_export, 'export_one', export_one)
+    return calls, failing
+
+
+def run(students, *args):
+    return batch_export.main([students, '--default-rate', '0', '--workers', '2', *args])
+
+
+def progress_lines(path):
+    with open(path, encoding='utf-8') as f:
+        return f.read().splitlines()
+
+
+def test_read_credentials_from_csv_and_json_lines():
+    csv_rows = list(read_credentials(io.StringIO("username,password\nalice,pw\n,missing\n"), 'xauat'))
+    assert [(c.school, c.username, c.password) for c in csv_rows] == [('xauat', 'alice', 'pw')]
+    json_rows = list(read_credentials(io.StringIO('{"school": "NWAFU", "username": "bob", "passwd": "pw"}\n\n'),
+                                      'xauat'))
+    assert [c.key for c in json_rows] == ['nwafu/bob']
+
+
+def test_failures_are_reported_and_retried_on_resume(tmp_path, students, exported):
+    calls, failing = exported
+    out = str(tmp_path / 'out')
+    failing.add('stu2')
+    assert run(students, '--out-dir', out) == 1
+    errors = [json.loads(line) for line in progress_lines(out + '.errors.jsonl')]
+    assert sorted(error['username'] for error in errors) == ['stu2', 'x']
+    assert (tmp_path / 'out' / 'nwafu' / 'stu1.ics').exists()
+
+    failing.clear()
+    calls.clear()
+    assert run(students, '--out-dir', out, '--resume') == 1
+    # Only the failed student is exported again; 'mit' is still unsupported
+    assert calls == ['xauat/stu2']
+    assert (tmp_path / 'out' / 'xauat' / 'stu2.ics').exists()
+
+
+def test_tarball_resume_cuts_back_to_the_last_complete_member(tmp_path, students, exported):
+    calls, _ = exported
+    tar_path = str(tmp_path / 'cohort.tar')
+    run(students, '--tar', tar_path)
+    progress = tar_path + '.progress.jsonl'
+
+    # A crash after the second student: its progress line is half written
+    # and the tarball has a partial member at the end
+    lines = progress_lines(progress)
+    with open(progress, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(lines[:2]) + '\n' + lines[2][:10])
+    with open(tar_path, 'ab') as f:
+        f.write(b'partial member' * 100)
+
+    calls.clear()
+    run(students, '--tar', tar_path, '--resume')
+    assert len(calls) == 4
+    with tarfile.open(tar_path) as tar:
+        names = tar.getnames()
+        assert sorted(names) == sorted(f"{'nwafu' if i % 2 else 'xauat'}/stu{i}.ics" for i in range(6))
+        assert tar.extractfile('xauat/stu0.ics').read().startswith(b'BEGIN:VCALENDAR')
+
+
+def test_combined_feed_resume_keeps_one_header_and_footer(tmp_path, students, exported):
+    feed = tmp_path / 'cohort.ics'
+    run(students, '--combined', str(feed))
+    progress = str(feed) + '.progress.jsonl'
+    with open(progress, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(progress_lines(progress)[:3]) + '\n')
+
+    run(students, '--combined', str(feed), '--resume')
+    body = feed.read_bytes()
+    assert body.startswith(b'BEGIN:VCALENDAR') and body.endswith(b'END:VCALENDAR\r\n')
+    assert body.count(b'BEGIN:VCALENDAR') == body.count(b'END:VCALENDAR') == 1
+    uids = [line for line in body.split(b'\r\n') if line.startswith(b'UID:')]
+    assert len(uids) == len(set(uids)) == 6
+
+
+def test_compressed_tarball_cannot_be_resumed(tmp_path, students, exported):
+    tar_path = str(tmp_path / 'cohort.tar.gz')
+    run(students, '--tar', tar_path)
+    with pytest.raises(SystemExit):
+        run(students, '--tar', tar_path, '--resume')
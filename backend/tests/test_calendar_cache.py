@@ -0,0 +1,141 @@
+import time
+from email.utils import formatdate
+
+from calendar_cache import CalendarCache, make_cache_key
+from timetable_store import TimetableStore
+
+KEY = make_cache_key('xauat', 'student', {'mode': 'expanded'})
+BODY = b'BEGIN:VCALENDAR\r\nEND:VCALENDAR\r\n'
+
+
+def test_get_checks_the_password():
+    cache = CalendarCache()
+    cache.put(KEY, 'secret', BODY)
+    assert cache.get(KEY, 'secret').body == BODY
+    assert cache.get(KEY, 'other') is None
+
+
+def test_unchanged_body_keeps_etag_and_last_modified():
+    cache = CalendarCache()
+    first = cache.put(KEY, 'pw', BODY)
+    time.sleep(0.01)
+    second = cache.put(KEY, 'pw', BODY)
+    assert second.etag == first.etag
+    assert second.last_modified == first.last_modified
+    third = cache.put(KEY, 'pw', BODY + b'X')
+    assert third.etag != first.etag
+
+
+def test_conditional_requests():
+    entry = CalendarCache().put(KEY, 'pw', BODY)
+    assert entry.is_not_modified(if_none_match=entry.etag)
+    assert entry.is_not_modified(if_none_match=f'"other", W/{entry.etag}')
+    assert entry.is_not_modified(if_none_match=entry.variant_etag('gzip'))
+    assert entry.is_not_modified(if_none_match='*')
+    assert not entry.is_not_modified(if_none_match='"other"')
+    assert entry.is_not_modified(if_modified_since=formatdate(entry.last_modified + 1, usegmt=True))
+    assert not entry.is_not_modified(if_modified_since=formatdate(entry.last_modified - 10, usegmt=True))
+    assert not entry.is_not_modified(if_modified_since='not a date')
+    # If-None-Match wins over If-Modified-Since
+    assert not entry.is_not_modified('"other"', formatdate(entry.last_modified + 1, usegmt=True))
+
+
+def test_encodings_get_their_own_etag():
+    entry = CalendarCache().put(KEY, 'pw', BODY)
+    assert entry.variant_etag() == entry.etag
+    assert entry.variant_etag('br') != entry.variant_etag('gzip') != entry.etag
+
+
+def test_max_age_is_the_freshness_left():
+    cache = CalendarCache(ttl=600)
+    entry = cache.put(KEY, 'pw', BODY)
+    assert entry.headers(now=entry.created)['Cache-Control'] == 'private, max-age=600'
+    assert entry.headers(now=entry.created + 100)['Cache-Control'] == 'private, max-age=500'
+    # A stale render served during a refresh must not be kept by clients
+    assert entry.headers(now=entry.created + 900)['Cache-Control'] == 'private, max-age=0'
+
+
+def test_stale_entries_only_when_allowed():
+    cache = CalendarCache(ttl=0.05, max_stale=60)
+    cache.put(KEY, 'pw', BODY)
+    time.sleep(0.1)
+    assert cache.get(KEY, 'pw') is None
+    assert cache.get(KEY, 'pw', allow_stale=True).body == BODY
+    assert cache.get(KEY, 'other', allow_stale=True) is None
+
+
+def test_entries_past_max_stale_are_dropped():
+    cache = CalendarCache(ttl=0.01, max_stale=0.01)
+    cache.put(KEY, 'pw', BODY)
+    time.sleep(0.05)
+    assert cache.get(KEY, 'pw', allow_stale=True) is None
+    assert len(cache) == 0
+
+
+class RacingLock:
+    """Runs ``interleave`` just before the lock's second acquisition."""
+
+    def __init__(self, lock, interleave):
+        self.lock = lock
+        self.interleave = interleave
+        self.acquired = 0
+
+    def __enter__(self):
+        self.acquired += 1
+        if self.acquired == 2:
+            self.interleave()
+        return self.lock.__enter__()
+
+    def __exit__(self, *exc_info):
+        return self.lock.__exit__(*exc_info)
+
+
+def test_over_stale_read_does_not_drop_a_newer_entry():
+    cache = CalendarCache(ttl=0.01, max_stale=0.01)
+    old = cache.put(KEY, 'pw', BODY)
+    time.sleep(0.05)
+
+    def put_fresh_entry():
+        cache.ttl = 600
+        cache.put(KEY, 'pw', BODY + b'new')
+
+    # A put lands between get's read of the entry and its staleness check
+    cache._lock = RacingLock(cache._lock, put_fresh_entry)
+    assert cache.get(KEY, 'pw', allow_stale=True) is None
+    new = cache._entries[KEY]
+    assert new is not old and new.body == BODY + b'new'
+    assert cache.total_bytes == new.size
+
+
+def test_size_bound_evicts_least_recently_used():
+    cache = CalendarCache(max_entries=2)
+    keys = [make_cache_key('xauat', f'user{i}') for i in range(3)]
+    for key in keys[:2]:
+        cache.put(key, 'pw', BODY)
+    cache.get(keys[0], 'pw')
+    cache.put(keys[2], 'pw', BODY)
+    assert cache.get(keys[1], 'pw') is None
+    assert cache.get(keys[0], 'pw') is not None
+    assert cache.total_bytes == sum(entry.size for entry in cache._entries.values())
+
+
+def test_encoded_body_is_compressed_once_and_counted():
+    import gzip
+
+    cache = CalendarCache()
+    body = BODY * 200
+    entry = cache.put(KEY, 'pw', body)
+    encoded = cache.encoded_body(KEY, entry, 'gzip')
+    assert gzip.decompress(encoded) == body
+    assert cache.encoded_body(KEY, entry, 'gzip') is encoded
+    assert cache.total_bytes == len(body) + len(encoded)
+
+
+def test_invalidate_also_drops_the_stored_render(tmp_path):
+    store = TimetableStore(str(tmp_path / 'timetables.db'))
+    cache = CalendarCache(store=store, secret=b'server-secret')
+    cache.put(KEY, 'pw', BODY)
+    assert CalendarCache(store=store, secret=b'server-secret').get(KEY, 'pw').body == BODY
+    cache.invalidate(KEY)
+    assert cache.get(KEY, 'pw', allow_stale=True) is None
+    assert CalendarCache(store=store, secret=b'server-secret').get(KEY, 'pw', allow_stale=True) is None
@@ -0,0 +1,87 @@
+import json
+from datetime import datetime, timedelta
+
+from calendar_generator import CALENDAR_FORMATS, CalendarGenerator
+from school.occurrences import CourseOccurrence
+
+START = datetime(2025, 3, 3, 8, 0)
+MODIFIED = datetime(2025, 2, 1, 12, 0)
+
+
+def make_courses(weeks=(0, 1, 3)):
+    courses = []
+    for week in weeks:
+        start = START + timedelta(weeks=week)
+        course = CourseOccurrence('1', "高等数学", "张三", "教1-101", '08:00', '09:40', start,
+                                  start + timedelta(minutes=100))
+        course['uid'] = f"course-1-{start.isoformat()}"
+        course['sequence'] = 0
+        course['lastModified'] = MODIFIED
+        courses.append(course)
+    return courses
+
+
+def make_exams():
+    start = datetime(2025, 6, 30, 14, 0)
+    return [{'course': "高等数学", 'time': "2025-06-30 14:00~16:00", 'room': "教2-202", 'seat_no': "7",
+             'start': start, 'end': start + timedelta(hours=2), 'uid': 'exam-1', 'sequence': 1,
+             'lastModified': MODIFIED}]
+
+
+def properties(component):
+    return {prop[0]: prop[3:] for prop in component[1]}
+
+
+def test_jcal_has_the_events_of_the_ics():
+    courses, exams = make_courses(), make_exams()
+    document = json.loads(CalendarGenerator.create_calendar(courses, exams, calendar_format='jcal'))
+    name, calendar_properties, events = document
+    assert name == 'vcalendar'
+    assert ['x-wr-calname', {}, 'unknown', '课程表'] in calendar_properties
+
+    ics = CalendarGenerator.create_calendar(courses, exams)
+    ics_uids = [line[4:].decode() for line in ics.split(b'\r\n') if line.startswith(b'UID:')]
+    assert [properties(event)['uid'] for event in events] == [[uid] for uid in ics_uids]
+
+    exam = properties(events[0])
+    assert exam['dtstart'] == ['2025-06-30T14:00:00']
+    assert exam['sequence'] == [1]
+    assert exam['last-modified'] == ['2025-02-01T12:00:00']
+    [alarm] = events[0][2]
+    assert alarm[0] == 'valarm' and ['trigger', {}, 'duration', '-PT30M'] in alarm[1]
+
+
+def test_jcal_series_carry_rrule_and_exdate():
+    document = json.loads(CalendarGenerator.create_calendar(make_courses(), [], recurrence='rrule',
+                                                            calendar_format='jcal'))
+    [series] = document[2]
+    series = properties(series)
+    assert series['rrule'] == [{'freq': 'WEEKLY', 'count': 4}]
+    assert series['exdate'] == ['2025-03-17T08:00:00']
+    assert series['dtstart'] == ['2025-03-03T08:00:00']
+
+
+def test_json_timetable_lists_each_slot_once():
+    timetable = json.loads(CalendarGenerator.create_calendar(make_courses(), make_exams(), calendar_format='json'))
+    assert timetable['courses'] == [{
+        'id': '1', 'name': "高等数学", 'teacher': "张三", 'room': "教1-101",
+        'times': [['2025-03-03T08:00', '2025-03-03T09:40'], ['2025-03-10T08:00', '2025-03-10T09:40'],
+                  ['2025-03-24T08:00', '2025-03-24T09:40']],
+    }]
+    assert timetable['exams'] == [{'course': "高等数学", 'start': '2025-06-30T14:00', 'end': '2025-06-30T16:00',
+                                   'time': "2025-06-30 14:00~16:00", 'room': "教2-202", 'seat': "7"}]
+
+
+def test_formats_apply_the_event_filter():
+    later = lambda event: event['start'] > START + timedelta(weeks=2)
+    timetable = json.loads(CalendarGenerator.create_calendar(make_courses(), make_exams(), later,
+                                                             calendar_format='json'))
+    assert [times[0] for times in timetable['courses'][0]['times']] == ['2025-03-24T08:00']
+    document = json.loads(CalendarGenerator.create_calendar(make_courses(), [], later, calendar_format='jcal'))
+    assert len(document[2]) == 1
+
+
+def test_every_format_has_a_content_type():
+    assert CALENDAR_FORMATS['jcal'][0].startswith('application/calendar+json')
+    assert CALENDAR_FORMATS['json'][0].startswith('application/json')
+    assert CALENDAR_FORMATS['ics'][0].startswith('text/calendar')
@@ -0,0 +1,92 @@
+import gzip
+
+import pytest
+
+import app as flask_app
+import compression
+from calendar_cache import make_cache_key
+from compression import compress, negotiate, parse_accept_encoding
+
+BIG = 4096
+
+
+class FakeBrotli:
+    @staticmethod
+    def compress(body, quality):
+        return b'br:' + body
+
+
+@pytest.fixture
+def without_brotli(monkeypatch):
+    monkeypatch.setattr(compression, '_brotli', False)
+
+
+@pytest.fixture
+def with_brotli(monkeypatch):
+    monkeypatch.setattr(compression, '_brotli', FakeBrotli)
+
+
+def test_parse_accept_encoding():
+    assert parse_accept_encoding('gzip, BR;q=0.8, deflate;q=bad, ') == {'gzip': 1.0, 'br': 0.8, 'deflate': 0.0}
+    assert parse_accept_encoding(None) == {}
+
+
+@pytest.mark.parametrize('header, expected', [
+    (None, None),
+    ('', None),
+    ('identity', None),
+    ('gzip', 'gzip'),
+    ('gzip;q=0', None),
+    ('*', 'gzip'),
+    ('*;q=0.5, gzip;q=0', None),
+    ('br', None),
+])
+def test_negotiate_gzip_only(without_brotli, header, expected):
+    assert negotiate(header, BIG) == expected
+
+
+@pytest.mark.parametrize('header, expected', [
+    ('gzip, br', 'br'),
+    ('gzip, br;q=0.5', 'gzip'),
+    ('*', 'br'),
+    ('br;q=0, *', 'gzip'),
+])
+def test_negotiate_prefers_brotli_when_installed(with_brotli, header, expected):
+    assert negotiate(header, BIG) == expected
+
+
+def test_small_bodies_are_not_compressed(without_brotli):
+    assert negotiate('gzip', compression.MIN_SIZE - 1) is None
+    assert negotiate('gzip', compression.MIN_SIZE) == 'gzip'
+
+
+def test_gzip_is_deterministic():
+    body = b'BEGIN:VEVENT\r\n' * 200
+    assert compress(body, 'gzip') == compress(body, 'gzip')
+    assert gzip.decompress(compress(body, 'gzip')) == body
+    with pytest.raises(ValueError):
+        compress(body, 'deflate')
+
+
+def test_response_is_compressed_once_and_validated_across_encodings(without_brotli, request):
+    key = make_cache_key('xauat', request.node.name, {})
+    body = b'BEGIN:VCALENDAR\r\n' + b'BEGIN:VEVENT\r\nEND:VEVENT\r\n' * 200 + b'END:VCALENDAR\r\n'
+    entry = flask_app.calendar_cache.put(key, 'pw', body)
+
+    status, headers, sent = flask_app.calendar_response_parts(key, entry, {}, {'accept-encoding': 'gzip'})
+    assert status == 200
+    assert headers['Content-Encoding'] == 'gzip' and headers['Vary'] == 'Accept-Encoding'
+    assert gzip.decompress(sent) == body
+    assert headers['ETag'] != entry.etag
+    assert flask_app.calendar_response_parts(key, entry, {}, {'accept-encoding': 'gzip'})[2] is sent
+
+    status, plain_headers, plain = flask_app.calendar_response_parts(key, entry, {}, {})
+    assert plain == body and 'Content-Encoding' not in plain_headers
+    assert plain_headers['ETag'] == entry.etag
+
+    # Either ETag validates the other representation
+    for etag in (headers['ETag'], plain_headers['ETag']):
+        for accept in ('gzip', ''):
+            status, _, sent = flask_app.calendar_response_parts(
+                key, entry, {}, {'accept-encoding': accept, 'if-none-match': etag})
+            assert (status, sent) == (304, b'')
@@ -0,0 +1,112 @@
+import base64
+import os
+import sqlite3
+import stat
+import tempfile
+import threading
+
+import pytest
+
+import credential_vault
+from credential_vault import (CredentialVault, VaultConfigError, create_key_file, in_temp_dir, load_vault_key,
+                              open_default_vault)
+
+KEY = bytes(range(32))
+
+
+@pytest.fixture
+def vault(tmp_path):
+    return CredentialVault(str(tmp_path / 'vault.db'), KEY)
+
+
+def test_round_trip(vault):
+    token = vault.create('XAUAT', 'student', 'p@ss', {'mode': 'rrule'})
+    subscription = vault.lookup(token)
+    assert subscription.school == 'xauat'
+    assert subscription.options == {'mode': 'rrule'}
+    assert subscription.subscriber_id.startswith('token-')
+    assert vault.credentials(token) == ('student', 'p@ss')
+
+
+def test_unknown_and_revoked_tokens(vault):
+    token = vault.create('xauat', 'student', 'pw')
+    assert vault.lookup('nope') is None and vault.credentials('nope') is None
+    assert vault.revoke(token)
+    assert not vault.revoke(token)
+    assert vault.lookup(token) is None
+
+
+def test_rows_hold_neither_token_nor_credentials(vault):
+    token = vault.create('xauat', 'student', 'hunter2')
+    dump = b''.join(bytes(str(value), 'utf-8') if not isinstance(value, bytes) else value
+                    for row in sqlite3.connect(vault.path).execute("SELECT * FROM subscriptions")
+                    for value in row)
+    for secret in (token.encode(), b'student', b'hunter2'):
+        assert secret not in dump
+
+
+def test_wrong_key_does_not_decrypt(tmp_path, vault):
+    token = vault.create('xauat', 'student', 'pw')
+    other = CredentialVault(vault.path, bytes(32))
+    assert other.lookup(token) is not None
+    assert other.credentials(token) is None
+
+
+def test_key_must_be_32_bytes(tmp_path):
+    with pytest.raises(ValueError):
+        CredentialVault(str(tmp_path / 'vault.db'), b'short')
+
+
+def test_key_file_is_created_once(tmp_path):
+    key_path = str(tmp_path / 'vault.key')
+    keys = []
+    threads = [threading.Thread(target=lambda: keys.append(create_key_file(key_path))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(set(keys)) == 1 and len(keys[0]) == 32
+    assert stat.S_IMODE(os.stat(key_path).st_mode) == 0o600
+    assert os.listdir(tmp_path) == ['vault.key']
+
+
+def test_configured_key(monkeypatch, tmp_path):
+    monkeypatch.setenv('CREDENTIAL_VAULT_KEY', base64.urlsafe_b64encode(KEY).decode().rstrip('='))
+    assert load_vault_key(str(tmp_path / 'vault.db')) == KEY
+
+
+def test_key_file_must_be_configured_and_apart_from_the_vault(monkeypatch, tmp_path):
+    vault_path = str(tmp_path / 'vault.db')
+    with pytest.raises(VaultConfigError):
+        load_vault_key(vault_path)
+    monkeypatch.setenv('CREDENTIAL_VAULT_KEY_FILE', str(tmp_path / 'vault.key'))
+    with pytest.raises(VaultConfigError):
+        load_vault_key(vault_path)
+
+
+def test_vault_is_off_unless_configured():
+    assert open_default_vault() is None
+
+
+def test_temp_dir_detection():
+    assert in_temp_dir(os.path.join(tempfile.gettempdir(), 'coursesync', 'vault.db'))
+    assert not in_temp_dir('/var/lib/coursesync/vault.db')
+
+
+def test_vault_in_temp_dir_is_refused(monkeypatch):
+    monkeypatch.setenv('CREDENTIAL_VAULT_DB', os.path.join(tempfile.gettempdir(), 'vault.db'))
+    monkeypatch.setenv('CREDENTIAL_VAULT_KEY', base64.urlsafe_b64encode(KEY).decode())
+    with pytest.raises(VaultConfigError):
+        open_default_vault()
+
+
+def test_default_vault_is_private(monkeypatch, tmp_path):
+    monkeypatch.setattr(credential_vault, 'in_temp_dir', lambda path: False)
+    monkeypatch.setenv('CREDENTIAL_VAULT_DB', str(tmp_path / 'data' / 'vault.db'))
+    monkeypatch.setenv('CREDENTIAL_VAULT_KEY_FILE', str(tmp_path / 'keys' / 'vault.key'))
+    os.makedirs(tmp_path / 'data')
+    os.makedirs(tmp_path / 'keys')
+    vault = open_default_vault()
+    token = vault.create('xauat', 'student', 'pw')
+    assert vault.credentials(token) == ('student', 'pw')
+    assert stat.S_IMODE(os.stat(vault.path).st_mode) == 0o600
@@ -0,0 +1,66 @@
+import contextvars
+import threading
+import time
+
+import pytest
+
+from school.fetch_pool import run_concurrently
+
+request_id = contextvars.ContextVar('request_id', default=None)
+
+
+def test_results_keep_the_call_order():
+    def slow(value, delay):
+        def call():
+            time.sleep(delay)
+            return value
+        return call
+
+    assert run_concurrently(slow('a', 0.05), slow('b', 0.02), slow('c', 0)) == ['a', 'b', 'c']
+    assert run_concurrently() == []
+    assert run_concurrently(lambda: 1) == [1]
+
+
+def test_calls_run_in_parallel_and_the_first_on_the_caller():
+    barrier = threading.Barrier(3, timeout=5)
+    def call():
+        barrier.wait()
+        return threading.current_thread()
+
+    threads = run_concurrently(call, call, call)
+    assert threads[0] is threading.current_thread()
+    assert len(set(threads)) == 3
+
+
+def test_first_error_is_raised_after_every_call_finished():
+    finished = []
+    def fail(message, delay=0):
+        def call():
+            time.sleep(delay)
+            finished.append(message)
+            raise RuntimeError(message)
+        return call
+
+    def ok():
+        time.sleep(0.05)
+        finished.append('ok')
+
+    with pytest.raises(RuntimeError, match='first'):
+        run_concurrently(fail('first', 0.02), ok, fail('second'))
+    assert sorted(finished) == ['first', 'ok', 'second']
+
+
+def test_nested_calls_run_sequentially_on_the_worker():
+    def nested():
+        worker = threading.current_thread()
+        return run_concurrently(threading.current_thread, threading.current_thread) == [worker, worker]
+
+    assert run_concurrently(lambda: None, nested) == [None, True]
+
+
+def test_calls_see_the_callers_context():
+    request_id.set('r1')
+    try:
+        assert run_concurrently(request_id.get, request_id.get) == ['r1', 'r1']
+    finally:
+        request_id.set(None)
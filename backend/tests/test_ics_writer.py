@@ -0,0 +1,84 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import ics_writer
+from calendar_generator import CalendarGenerator
+from school.occurrences import CourseOccurrence
+
+FIRST_WEEK = datetime(2024, 9, 9, 8, 0)
+MODIFIED = datetime(2024, 9, 1, 12, 30, tzinfo=timezone.utc)
+
+
+def make_courses(weeks=range(16), revisions=True):
+    courses = []
+    for lesson, (name, teacher, room, day) in enumerate([
+        ("高等数学", "张三", "教1-101", 0),
+        ("Data, Structures; & Algorithms", "Li\\Si", "Lab 3\nNorth", 2),
+        ("一门名字非常非常非常非常非常非常非常非常长的课程，用来检查折行是否在多字节字符中间断开", "王五", "未知地点", 4),
+    ], start=1):
+        for week in weeks:
+            if lesson == 2 and week % 3 == 1:
+                continue
+            start = FIRST_WEEK + timedelta(weeks=week, days=day)
+            course = CourseOccurrence(str(lesson), name, teacher, room, '08:00', '09:40', start,
+                                      start + timedelta(minutes=100))
+            if revisions:
+                course['uid'] = f"course-{lesson}-{start.isoformat()}"
+                course['sequence'] = week % 2
+                course['lastModified'] = MODIFIED
+            courses.append(course)
+    return courses
+
+
+def make_exams():
+    start = datetime(2025, 1, 6, 14, 0)
+    return [{
+        'course': "高等数学", 'time': "2025-01-06 14:00~16:00", 'room': "教2-202", 'seat_no': "17",
+        'start': start, 'end': start + timedelta(hours=2),
+        'uid': "exam-1", 'sequence': 3, 'lastModified': MODIFIED,
+    }]
+
+
+@pytest.mark.parametrize('recurrence', ['expanded', 'rrule'])
+@pytest.mark.parametrize('revisions', [True, False])
+def test_fast_serializer_matches_icalendar(recurrence, revisions):
+    courses = make_courses(revisions=revisions)
+    exams = make_exams() if revisions else []
+    fast = b''.join(CalendarGenerator.stream_calendar(courses, exams, recurrence=recurrence))
+    expected = CalendarGenerator.create_icalendar(courses, exams, recurrence=recurrence, count=False)
+    assert ics_writer.calendars_equivalent(fast, expected)
+
+
+def test_rrule_calendar_has_exdates_and_fewer_events():
+    courses = make_courses()
+    expanded = b''.join(CalendarGenerator.stream_calendar(courses, [], recurrence='expanded'))
+    compressed = b''.join(CalendarGenerator.stream_calendar(courses, [], recurrence='rrule'))
+    assert compressed.count(b'BEGIN:VEVENT') < expanded.count(b'BEGIN:VEVENT')
+    assert b'RRULE:FREQ=WEEKLY;COUNT=' in compressed
+    assert b'EXDATE' in compressed or b'RDATE' in compressed
+
+
+def test_rrule_uids_do_not_depend_on_the_filter():
+    courses = make_courses()
+    def uids(data):
+        return sorted(line for line in data.split(b'\r\n') if line.startswith(b'UID:'))
+    everything = uids(b''.join(CalendarGenerator.stream_calendar(courses, [], recurrence='rrule')))
+    later = b''.join(CalendarGenerator.stream_calendar(
+        courses, [], lambda course: course['start'] > FIRST_WEEK + timedelta(weeks=5), 'rrule'))
+    assert uids(later) == everything
+    assert b'DTSTART:20240909' not in later
+
+
+def test_lines_are_folded_at_75_octets():
+    data = b''.join(CalendarGenerator.stream_calendar(make_courses(weeks=[0]), []))
+    for line in data.split(b'\r\n'):
+        assert len(line) <= 75
+        line.decode('utf-8')
+
+
+def test_equivalence_notices_a_changed_property():
+    courses = make_courses(weeks=[0, 1])
+    fast = b''.join(CalendarGenerator.stream_calendar(courses, []))
+    expected = CalendarGenerator.create_icalendar(courses, [], count=False)
+    assert not ics_writer.calendars_equivalent(fast.replace(b'SEQUENCE:1', b'SEQUENCE:2'), expected)
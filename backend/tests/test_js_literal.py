@@ -0,0 +1,56 @@
+import pytest
+
+from school.js_literal import extract_js_literal, parse_js_literal
+
+
+def test_plain_json_literal():
+    page = '<script>var studentExamInfoVms = [{"course": {"nameZh": "数学"}, "seatNo": 3}];</script>'
+    assert extract_js_literal(page, 'studentExamInfoVms') == [{'course': {'nameZh': '数学'}, 'seatNo': 3}]
+
+
+def test_js_only_syntax():
+    page = "var data = {name: '课程', 'room': \"A\", list: [1, 2.5, -3e2,], missing: undefined, ok: true,};"
+    assert extract_js_literal(page, 'data') == {
+        'name': '课程', 'room': 'A', 'list': [1, 2.5, -300.0], 'missing': None, 'ok': True,
+    }
+
+
+@pytest.mark.parametrize('quote', ['"', "'"])
+@pytest.mark.parametrize('escaped, expected', [
+    (r"it\'s", "it's"),
+    (r'say \"hi\"', 'say "hi"'),
+    (r"\x41\x42", "AB"),
+    (r"a\vb", "a\vb"),
+    (r"课程", "课程"),
+    (r"\uD83D\uDE00", "\U0001F600"),
+    (r"\u8bfe\u7a0b", "课程"),
+    (r"tab\tnew\nline", "tab\tnew\nline"),
+    ("split\\\nline", "splitline"),
+    (r"back\\slash", "back\\slash"),
+    (r"\0", "\0"),
+])
+def test_string_escapes_in_both_quote_styles(quote, escaped, expected):
+    page = f"var s = [{quote}{escaped}{quote}, {{k: 1}}];"
+    assert extract_js_literal(page, 's') == [expected, {'k': 1}]
+
+
+def test_only_var_assignments_count():
+    page = "obj.data = [1]; mydata = [2]; var data = [3];"
+    assert extract_js_literal(page, 'data') == [3]
+
+
+def test_missing_variable():
+    assert extract_js_literal("var other = [];", 'data') is None
+
+
+def test_parse_returns_end_of_literal():
+    text = "x = [1, 'a'] ; rest"
+    value, end = parse_js_literal(text, 4)
+    assert value == [1, 'a']
+    assert text[end:].startswith(' ;')
+
+
+@pytest.mark.parametrize('text', ["[1, 2", "{a 1}", "[1 2]", "[@]"])
+def test_malformed_literals_raise(text):
+    with pytest.raises(ValueError):
+        parse_js_literal(text)
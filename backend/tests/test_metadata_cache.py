@@ -0,0 +1,119 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import timetable_store
+from school import metadata_cache
+from school.metadata_cache import SchoolMetadataCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = time.time()
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(metadata_cache, 'time', clock)
+    monkeypatch.setattr(timetable_store, 'time', clock)
+    return clock
+
+
+def test_values_expire_after_their_ttl(clock):
+    cache = SchoolMetadataCache(ttl=60)
+    loads = []
+    def loader():
+        loads.append(1)
+        return f"value-{len(loads)}"
+
+    assert cache.get_or_load('xauat', 'current_semester', loader) == 'value-1'
+    clock.now += 59
+    assert cache.get_or_load('xauat', 'current_semester', loader) == 'value-1'
+    clock.now += 1
+    assert cache.get('xauat', 'current_semester') is None
+    assert cache.get_or_load('xauat', 'current_semester', loader) == 'value-2'
+    # A per-entry ttl overrides the default
+    cache.get_or_load('xauat', 'first_week', lambda: 'monday', ttl=10)
+    clock.now += 10
+    assert cache.get('xauat', 'first_week') is None
+
+
+def test_failed_loads_are_not_cached(clock):
+    cache = SchoolMetadataCache()
+    assert cache.get_or_load('xauat', 'current_semester', lambda: None) is None
+    assert cache.get_or_load('xauat', 'current_semester', lambda: '302') == '302'
+
+
+def test_concurrent_misses_load_once(clock):
+    cache = SchoolMetadataCache()
+    loads = []
+    started = threading.Barrier(4, timeout=5)
+    def loader():
+        loads.append(1)
+        time.sleep(0.05)
+        return '302'
+    def get():
+        started.wait()
+        return cache.get_or_load('xauat', 'current_semester', loader)
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        results = list(executor.map(lambda _: get(), range(4)))
+    assert results == ['302'] * 4
+    assert len(loads) == 1
+
+
+def test_new_semester_drops_the_schools_other_values(clock):
+    cache = SchoolMetadataCache(ttl=60)
+    cache.get_or_load('xauat', 'current_semester', lambda: '301')
+    cache.set('xauat', ('semester_start', '301'), '2024-09-09', ttl=3600)
+    cache.set('nwafu', 'current_semester', '2024-2025-1', ttl=3600)
+    clock.now += 60
+    assert cache.get_or_load('xauat', 'current_semester', lambda: '302') == '302'
+    assert cache.get('xauat', ('semester_start', '301')) is None
+    assert cache.get('nwafu', 'current_semester') == '2024-2025-1'
+
+
+def test_invalidate_one_name_or_the_whole_school(clock):
+    cache = SchoolMetadataCache()
+    cache.set('xauat', 'a', 1)
+    cache.set('xauat', 'b', 2)
+    cache.invalidate('xauat', 'a')
+    assert cache.get('xauat', 'a') is None and cache.get('xauat', 'b') == 2
+    cache.invalidate('xauat')
+    assert cache.get('xauat', 'b') is None
+
+
+def test_store_is_written_through_and_read_on_a_miss(tmp_path, clock):
+    store = timetable_store.TimetableStore(str(tmp_path / 'timetables.db'))
+    SchoolMetadataCache(ttl=60, store=store).get_or_load('xauat', 'current_semester', lambda: '302')
+
+    fresh = SchoolMetadataCache(ttl=60, store=store)
+    assert fresh.get_or_load('xauat', 'current_semester', lambda: pytest.fail("asked upstream")) == '302'
+    # The stored expiry still counts
+    clock.now += 60
+    assert SchoolMetadataCache(store=store).get_or_load('xauat', 'current_semester', lambda: '303') == '303'
+
+    fresh.invalidate('xauat')
+    assert SchoolMetadataCache(store=store).get_or_load('xauat', 'current_semester', lambda: '304') == '304'
+
+
+def test_async_loads_coalesce(clock):
+    cache = SchoolMetadataCache()
+    loads = []
+    async def loader():
+        loads.append(1)
+        await asyncio.sleep(0.01)
+        return '302'
+
+    async def main():
+        return await asyncio.gather(*(cache.aget_or_load('xauat', 'current_semester', loader) for _ in range(5)))
+
+    assert asyncio.run(main()) == ['302'] * 5
+    assert len(loads) == 1
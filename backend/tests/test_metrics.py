@@ -0,0 +1,94 @@
+import asyncio
+import re
+
+import pytest
+
+from metrics import Registry, STAGE_ERRORS, STAGE_SECONDS, current_trace, stage, start_trace, timed
+
+
+def test_counter_family_and_label_escaping():
+    registry = Registry()
+    counter = registry.counter("test_requests_total", "Requests.", ("school", "status"))
+    counter.inc('xauat', '200')
+    counter.inc('xauat', '200', amount=2)
+    counter.inc('a"b\\c\nd', '503')
+    assert registry.render().splitlines() == [
+        "# HELP test_requests_total Requests.",
+        "# TYPE test_requests_total counter",
+        'test_requests_total{school="a\\"b\\\\c\\nd",status="503"} 1',
+        'test_requests_total{school="xauat",status="200"} 3',
+    ]
+
+
+def test_histogram_family_is_cumulative():
+    registry = Registry()
+    histogram = registry.histogram("test_seconds", "Durations.", ("school",), buckets=(0.1, 1))
+    for value in (0.05, 0.5, 0.5, 3):
+        histogram.observe(value, 'xauat')
+    assert registry.render().splitlines() == [
+        "# HELP test_seconds Durations.",
+        "# TYPE test_seconds histogram",
+        'test_seconds_bucket{school="xauat",le="0.1"} 1',
+        'test_seconds_bucket{school="xauat",le="1.0"} 3',
+        'test_seconds_bucket{school="xauat",le="+Inf"} 4',
+        'test_seconds_sum{school="xauat"} 4.05',
+        'test_seconds_count{school="xauat"} 4',
+    ]
+    assert histogram.count('xauat') == 4
+
+
+def test_gauge_is_read_at_scrape_time_and_a_failing_one_is_skipped():
+    registry = Registry()
+    values = [1]
+    registry.gauge("test_entries", "Entries.", lambda: values[-1])
+    registry.gauge("test_broken", "Broken.", lambda: 1 / 0)
+    values.append(7)
+    assert registry.render() == "# HELP test_entries Entries.\n# TYPE test_entries gauge\ntest_entries 7\n"
+
+
+def test_stages_go_to_the_histogram_and_the_trace():
+    trace = start_trace('test-school')
+    seconds, errors = STAGE_SECONDS.count('test-school', 'parse'), STAGE_ERRORS.value('test-school', 'parse')
+    with stage('parse'):
+        pass
+    with pytest.raises(ValueError):
+        with stage('parse'):
+            raise ValueError("bad page")
+    assert STAGE_SECONDS.count('test-school', 'parse') == seconds + 2
+    assert STAGE_ERRORS.value('test-school', 'parse') == errors + 1
+    assert current_trace() is trace
+    assert set(trace.stages) == {'parse'}
+    assert re.fullmatch(r"parse;dur=\d+\.\d, total;dur=\d+\.\d", trace.server_timing())
+
+
+def test_timed_labels_with_the_class_school():
+    class Client:
+        SCHOOL = 'test-timed'
+
+        @timed('login')
+        def login(self):
+            return 'sync'
+
+        @timed('login')
+        async def alogin(self):
+            return 'async'
+
+    assert Client().login() == 'sync'
+    assert asyncio.run(Client().alogin()) == 'async'
+    assert STAGE_SECONDS.count('test-timed', 'login') == 2
+
+
+def test_metrics_endpoint_lists_every_family():
+    import app
+    body = app.app.test_client().get('/metrics').get_data(as_text=True)
+    families = set(re.findall(r"^# TYPE (\S+) (\w+)$", body, re.MULTILINE))
+    assert {
+        ('coursesync_requests_total', 'counter'),
+        ('coursesync_request_seconds', 'histogram'),
+        ('coursesync_stage_seconds', 'histogram'),
+        ('coursesync_upstream_responses_total', 'counter'),
+        ('coursesync_calendar_cache_lookups_total', 'counter'),
+        ('coursesync_single_flight_calls_total', 'counter'),
+        ('coursesync_calendar_cache_entries', 'gauge'),
+        ('coursesync_builds_in_flight', 'gauge'),
+    } <= families
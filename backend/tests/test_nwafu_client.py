@@ -0,0 +1,31 @@
+import pytest
+
+from school.nwafu.nwafu_client import NWAFUAcademicSystemClient
+from school.upstream_policy import UpstreamError
+
+
+def login_page(salt_input, execution_input='<input type="hidden" name="execution" id="execution" value="e1s1"/>'):
+    return f"<html><form>{salt_input}{execution_input}</form></html>"
+
+
+@pytest.mark.parametrize('salt_input', [
+    '<input type="hidden" id="pwdEncryptSalt" value="66R9pzYqIdbUfGfG"/>',
+    '<input id="pwdEncryptSalt" type="hidden" value=\'66R9pzYqIdbUfGfG\'>',
+    '<input value="66R9pzYqIdbUfGfG" id="pwdEncryptSalt" type="hidden">',
+    '<INPUT TYPE="hidden" ID="pwdEncryptSalt" VALUE = "66R9pzYqIdbUfGfG">',
+    '<input data-value="wrong" id="pwdEncryptSalt" value="66R9pzYqIdbUfGfG">',
+    '<input id="pwdEncryptSalt" x-value="wrong" data-old-value=\'wrong\' value="66R9pzYqIdbUfGfG">',
+])
+def test_hidden_input_value(salt_input):
+    assert NWAFUAcademicSystemClient.parse_salt_and_execution(login_page(salt_input)) == ("66R9pzYqIdbUfGfG", "e1s1")
+
+
+def test_hidden_input_unescapes_entities():
+    page = login_page('<input id="pwdEncryptSalt" value="a&amp;b&#x3c;"/>')
+    assert NWAFUAcademicSystemClient.hidden_input(page, 'pwdEncryptSalt') == "a&b<"
+
+
+def test_hidden_input_without_value():
+    page = login_page('<input id="pwdEncryptSalt" data-value="wrong"/>')
+    with pytest.raises(UpstreamError):
+        NWAFUAcademicSystemClient.hidden_input(page, 'pwdEncryptSalt')
@@ -0,0 +1,75 @@
+import copy
+import pickle
+from datetime import datetime, timedelta
+
+import pytest
+
+from school.occurrences import CourseOccurrence, week_indexes, week_offset
+
+START = datetime(2025, 3, 3, 8, 0)
+
+
+def make_course():
+    return CourseOccurrence('1', "高等数学", "张三", "教1-101", '08:00', '09:40', START, START + timedelta(minutes=100))
+
+
+@pytest.mark.parametrize('bitmap, expected', [
+    ('', []),
+    ('0000', []),
+    ('1', [0]),
+    ('0110', [1, 2]),
+    ('1' * 20, list(range(20))),
+    ('0' * 63 + '1', [63]),
+    ('0' * 70 + '1', [70]),
+    # Anything but '1' counts as no class that week
+    ('01x1 1', [1, 3, 5]),
+])
+def test_week_indexes(bitmap, expected):
+    assert week_indexes(bitmap) == expected
+
+
+def test_week_offset_beyond_the_table():
+    assert week_offset(3) == timedelta(weeks=3)
+    assert week_offset(100) == timedelta(weeks=100)
+
+
+def test_reads_like_a_course_dict():
+    course = make_course()
+    assert course['courseName'] == "高等数学"
+    assert course.get('uid') is None and course.get('nope', 1) == 1
+    assert 'uid' not in course and 'start' in course and 'nope' not in course
+    assert len(course) == 8
+    assert dict(course) == {
+        'lessonId': '1', 'courseName': "高等数学", 'personName': "张三", 'roomZh': "教1-101",
+        'startTime': '08:00', 'endTime': '09:40', 'start': START, 'end': START + timedelta(minutes=100),
+    }
+    with pytest.raises(KeyError):
+        course['uid']
+    with pytest.raises(KeyError):
+        course['nope']
+
+
+def test_annotations_are_added_and_removed_like_dict_keys():
+    course = make_course()
+    course['uid'] = 'course-1'
+    course['seriesSequence'] = 2
+    assert course['uid'] == 'course-1' and len(course) == 10
+    assert list(course)[-2:] == ['uid', 'seriesSequence']
+    del course['uid']
+    assert 'uid' not in course
+    with pytest.raises(KeyError):
+        del course['uid']
+    # Fixed fields only, so a typo can't slip through
+    with pytest.raises(KeyError):
+        course['lastmodified'] = None
+    with pytest.raises(AttributeError):
+        course.__dict__
+
+
+def test_copies_and_pickles():
+    course = make_course()
+    course['sequence'] = 1
+    for clone in (copy.copy(course), copy.deepcopy(course), pickle.loads(pickle.dumps(course))):
+        assert dict(clone) == dict(course)
+        clone['sequence'] = 2
+        assert course['sequence'] == 1
@@ -0,0 +1,121 @@
+from datetime import datetime, timedelta, timezone
+
+from recurrence import compress_occurrences, track_series
+
+FIRST = datetime(2024, 9, 9, 8, 0)
+NOW = datetime(2024, 10, 1, tzinfo=timezone.utc)
+EARLIER = datetime(2024, 9, 1, tzinfo=timezone.utc)
+
+
+def occurrences(weeks, lesson='1', day=0, room='教1-101', sequence=0):
+    courses = []
+    for week in weeks:
+        start = FIRST + timedelta(weeks=week, days=day)
+        courses.append({
+            'lessonId': lesson, 'courseName': f"课程{lesson}", 'personName': "教师", 'roomZh': room,
+            'start': start, 'end': start + timedelta(minutes=100),
+            'uid': f"course-{lesson}-{start.isoformat()}", 'sequence': sequence, 'lastModified': EARLIER,
+        })
+    return courses
+
+
+def test_weekly_series_with_gaps_becomes_rrule_and_exdates():
+    [series] = compress_occurrences(occurrences([0, 1, 2, 4, 5, 6, 7]))
+    assert series['start'] == FIRST
+    assert series['count'] == 8
+    assert series['exdates'] == [FIRST + timedelta(weeks=3)]
+    assert series['rdates'] == []
+
+
+def test_irregular_weeks_are_listed_as_rdates():
+    [series] = compress_occurrences(occurrences([0, 5, 11]))
+    assert series['count'] == 1
+    assert series['rdates'] == [FIRST + timedelta(weeks=5), FIRST + timedelta(weeks=11)]
+
+
+def test_slots_and_rooms_make_separate_series():
+    courses = occurrences(range(4)) + occurrences(range(4), day=2) + occurrences(range(4), room="教2-202")
+    result = compress_occurrences(courses)
+    assert len(result) == 3
+    assert all(series['count'] == 4 for series in result)
+    assert [series['start'] for series in result] == sorted(series['start'] for series in result)
+
+
+def test_series_takes_the_newest_occurrence_revision():
+    courses = occurrences(range(4))
+    courses[2]['sequence'] = 3
+    courses[2]['lastModified'] = NOW
+    [series] = compress_occurrences(courses)
+    assert series['sequence'] == 3
+    assert series['lastModified'] == NOW
+
+
+def test_dropped_week_bumps_the_series_sequence():
+    courses = occurrences(range(8))
+    state = track_series({}, courses, EARLIER)
+    [series] = compress_occurrences(courses)
+    assert series['sequence'] == 0
+
+    # Week 3 is cancelled: the other occurrences keep SEQUENCE 0
+    courses = occurrences([0, 1, 2, 4, 5, 6, 7])
+    state = track_series(state, courses, NOW)
+    [series] = compress_occurrences(courses)
+    assert series['exdates'] == [FIRST + timedelta(weeks=3)]
+    assert series['sequence'] == 1
+    assert series['lastModified'] == NOW
+
+    # Fetching the same timetable again changes nothing
+    courses = occurrences([0, 1, 2, 4, 5, 6, 7])
+    state = track_series(state, courses, NOW + timedelta(days=1))
+    [series] = compress_occurrences(courses)
+    assert series['sequence'] == 1
+    assert series['lastModified'] == NOW
+
+
+def test_sequence_never_goes_below_an_occurrence():
+    state = track_series({}, occurrences(range(4)), EARLIER)
+    courses = occurrences(range(5), sequence=4)
+    track_series(state, courses, NOW)
+    [series] = compress_occurrences(courses)
+    assert series['sequence'] == 4
+
+
+def test_filtered_subset_keeps_the_bumped_sequence():
+    state = track_series({}, occurrences(range(8)), EARLIER)
+    courses = occurrences([0, 1, 2, 4, 5, 6, 7])
+    track_series(state, courses, NOW)
+    [series] = compress_occurrences(courses, lambda course: course['start'] > FIRST + timedelta(weeks=4))
+    assert series['sequence'] == 1
+
+
+def test_series_keeps_its_uid_across_weeks():
+    courses = occurrences(range(8))
+    [series] = compress_occurrences(courses)
+    uid = series['uid']
+    # mode=rrule&filter=future: a week later the first week has passed
+    for week in range(1, 7):
+        [series] = compress_occurrences(courses, lambda course: course['start'] >= FIRST + timedelta(weeks=week))
+        assert series['start'] == FIRST + timedelta(weeks=week)
+        assert series['uid'] == uid
+    # Week 0 is cancelled
+    [series] = compress_occurrences(occurrences(range(1, 8)))
+    assert series['uid'] == uid
+
+
+def test_filtered_out_series_is_dropped_and_others_keep_their_uids():
+    courses = occurrences(range(4)) + occurrences(range(4), room="教2-202")
+    uids = {series['roomZh']: series['uid'] for series in compress_occurrences(courses)}
+    assert len(set(uids.values())) == 2
+    [series] = compress_occurrences(courses, lambda course: course['roomZh'] == "教2-202")
+    assert series['uid'] == uids["教2-202"]
+
+
+def test_tracked_series_state_is_keyed_by_the_stable_uid():
+    state = track_series({}, occurrences(range(8)), EARLIER)
+    courses = occurrences(range(1, 8))
+    state = track_series(state, courses, NOW)
+    [uid] = state
+    [series] = compress_occurrences(courses)
+    assert series['uid'] == uid
+    # Cancelling week 0 changed the series' dates, not its identity
+    assert series['sequence'] == 1
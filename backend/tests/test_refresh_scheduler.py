@@ -0,0 +1,106 @@
+import threading
+import time
+
+import pytest
+
+from refresh_scheduler import RefreshScheduler
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("timed out")
+        time.sleep(0.005)
+
+
+@pytest.fixture
+def make_scheduler():
+    schedulers = []
+    def make(refresh, **kwargs):
+        kwargs.setdefault('tick', 0.01)
+        kwargs.setdefault('jitter', 0)
+        scheduler = RefreshScheduler(refresh, **kwargs)
+        schedulers.append(scheduler)
+        return scheduler
+    yield make
+    for scheduler in schedulers:
+        scheduler.stop()
+
+
+def test_due_subscription_is_refreshed_and_rescheduled(make_scheduler):
+    refreshed = []
+    scheduler = make_scheduler(lambda sub: refreshed.append(sub.key), interval=0.05)
+    sub = scheduler.touch('k', 'xauat', 'alice', 'pw', {'mode': 'rrule'})
+    wait_for(lambda: len(refreshed) >= 2)
+    assert set(refreshed) == {'k'}
+    assert sub.failures == 0
+    assert sub.next_refresh > sub.last_refreshed
+
+
+def test_poll_does_not_reschedule_unless_refreshed(make_scheduler):
+    scheduler = make_scheduler(lambda sub: None, interval=1000)
+    sub = scheduler.touch('k', 'xauat', 'alice', 'pw')
+    scheduled = sub.next_refresh
+    assert scheduler.touch('k', 'xauat', 'alice', 'new') is sub
+    assert sub.next_refresh == scheduled
+    assert sub.password == 'new'
+    scheduler.touch('k', 'xauat', 'alice', 'new', refreshed=True)
+    assert sub.next_refresh > scheduled
+
+
+def test_refresh_async_runs_now(make_scheduler):
+    done = threading.Event()
+    scheduler = make_scheduler(lambda sub: done.set(), interval=1000)
+    assert not scheduler.refresh_async('unknown')
+    scheduler.touch('k', 'xauat', 'alice', 'pw')
+    assert scheduler.refresh_async('k')
+    assert done.wait(5)
+
+
+def test_idle_subscriptions_expire(make_scheduler):
+    scheduler = make_scheduler(lambda sub: None, interval=1000, idle_timeout=0.05)
+    scheduler.touch('k', 'xauat', 'alice', 'pw')
+    assert len(scheduler) == 1
+    wait_for(lambda: len(scheduler) == 0)
+
+
+def test_invalid_subscription_is_dropped(make_scheduler):
+    scheduler = make_scheduler(lambda sub: False, interval=1000)
+    scheduler.touch('k', 'xauat', 'alice', 'pw')
+    scheduler.refresh_async('k')
+    wait_for(lambda: len(scheduler) == 0)
+
+
+def test_failures_back_off(make_scheduler):
+    calls = []
+    def refresh(sub):
+        calls.append(time.time())
+        raise ConnectionError("upstream down")
+    scheduler = make_scheduler(refresh, interval=1000, tick=1)
+    sub = scheduler.touch('k', 'xauat', 'alice', 'pw')
+    scheduler.refresh_async('k')
+    wait_for(lambda: sub.failures == 1 and not sub.refreshing)
+    # tick * 2 ** failures
+    assert sub.next_refresh == pytest.approx(calls[0] + 2, abs=0.5)
+    assert len(scheduler) == 1
+
+
+def test_per_school_concurrency(make_scheduler):
+    release = threading.Event()
+    started = []
+    def refresh(sub):
+        started.append(sub.key)
+        release.wait(5)
+    scheduler = make_scheduler(refresh, interval=1000, per_school_concurrency=1)
+    for key in ('a', 'b'):
+        scheduler.touch(key, 'xauat', key, 'pw')
+    scheduler.touch('c', 'nwafu', 'c', 'pw')
+    assert scheduler.refresh_async('a')
+    assert not scheduler.refresh_async('a')
+    assert not scheduler.refresh_async('b')
+    assert scheduler.refresh_async('c')
+    release.set()
+    wait_for(lambda: sorted(started) == ['a', 'c'])
+    # b was left due and goes out once a slot is free
+    wait_for(lambda: 'b' in started)
@@ -0,0 +1,93 @@
+import os
+import sys
+import textwrap
+
+import pytest
+
+from bench.startup import probe
+from school.registry import SchoolRegistry, parse_adapters
+
+ADAPTER = """
+from school.base_client import BaseAcademicSystemClient
+
+class DemoClient(BaseAcademicSystemClient):
+    pass
+
+NotAClient = object
+"""
+
+
+@pytest.fixture
+def adapter_module(tmp_path, monkeypatch):
+    """A throwaway adapter module, importable but not imported yet."""
+    name = 'demo_adapter'
+    (tmp_path / f"{name}.py").write_text(textwrap.dedent(ADAPTER), encoding='utf-8')
+    monkeypatch.syspath_prepend(str(tmp_path))
+    yield name
+    sys.modules.pop(name, None)
+
+
+def test_adapter_is_imported_on_first_load(adapter_module):
+    registry = SchoolRegistry({'demo': f"{adapter_module}:DemoClient"}, entry_point_group=None)
+    assert 'DEMO' in registry
+    assert adapter_module not in sys.modules
+    client_class = registry.load('Demo')
+    assert client_class.__name__ == 'DemoClient'
+    assert adapter_module in sys.modules
+    assert registry.load('demo') is client_class
+
+
+def test_unknown_school_is_a_value_error():
+    registry = SchoolRegistry({}, entry_point_group=None)
+    assert 'nowhere' not in registry
+    with pytest.raises(ValueError, match="Unsupported school: nowhere"):
+        registry.load('nowhere')
+
+
+def test_adapter_must_be_a_client(adapter_module):
+    registry = SchoolRegistry({'demo': f"{adapter_module}:NotAClient"}, entry_point_group=None)
+    with pytest.raises(TypeError):
+        registry.load('demo')
+
+
+def test_register_a_class_or_a_path(adapter_module):
+    registry = SchoolRegistry({}, entry_point_group=None)
+    registry.register('Demo', f"{adapter_module}:DemoClient")
+    client_class = registry.load('demo')
+    other = SchoolRegistry({}, entry_point_group=None)
+    other.register('demo', client_class)
+    assert other.load('demo') is client_class
+    assert other.names() == ['demo']
+
+
+def test_entry_points_are_only_scanned_for_unknown_names(monkeypatch, adapter_module):
+    scans = []
+
+    class EntryPoint:
+        name, value = 'Demo', f"{adapter_module}:DemoClient"
+
+    def entry_points(group):
+        scans.append(group)
+        return [EntryPoint]
+
+    monkeypatch.setattr('importlib.metadata.entry_points', entry_points)
+    registry = SchoolRegistry({'xauat': 'school.xauat.xauat_client:XAUATAcademicSystemClient'})
+    assert 'xauat' in registry
+    assert scans == []
+    assert 'demo' in registry
+    assert registry.load('demo').__name__ == 'DemoClient'
+    assert 'other' not in registry
+    assert scans == ['coursesync.schools']
+
+
+def test_parse_adapters():
+    assert parse_adapters(" ABCU = abcu.client:Client , ") == {'abcu': 'abcu.client:Client'}
+    assert parse_adapters(None) == {}
+    with pytest.raises(ValueError):
+        parse_adapters("abcu=abcu.client")
+
+
+def test_servers_start_without_loading_a_school():
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE='1', SCHOOL_PRELOAD='')
+    for module in ('app', 'asgi'):
+        assert probe(module, [], env)['heavy'] == []
@@ -0,0 +1,34 @@
+from datetime import date
+
+from school.semesters import academic_year_semesters, in_range, semester_span, semesters_in_range
+
+SEMESTERS = [('301', '2024-2025-1'), ('302', '2024-2025-2'), ('321', '2025-2026-1'), ('x', '暑期小学期')]
+
+
+def test_semester_span():
+    assert semester_span('2024-2025-1') == (date(2024, 8, 1), date(2025, 2, 28))
+    assert semester_span('2024-2025学年第2学期') == (date(2025, 2, 1), date(2025, 8, 31))
+    assert semester_span('暑期小学期') is None
+    assert semester_span(None) is None
+
+
+def test_semesters_in_range():
+    assert semesters_in_range(SEMESTERS, (date(2024, 10, 1), date(2024, 12, 31))) == ['301']
+    # The spans overlap in February, so both semesters are fetched
+    assert semesters_in_range(SEMESTERS, (date(2025, 2, 10), date(2025, 2, 20))) == ['301', '302']
+    assert semesters_in_range(SEMESTERS, (date(2025, 9, 1), None)) == ['321']
+    assert semesters_in_range(SEMESTERS, (None, date(2024, 7, 1))) == []
+    assert semesters_in_range(SEMESTERS, (None, None)) == ['301', '302', '321']
+
+
+def test_in_range_is_inclusive_and_open_ended():
+    assert in_range(date(2024, 9, 1), (date(2024, 9, 1), date(2024, 9, 1)))
+    assert not in_range(date(2024, 9, 2), (None, date(2024, 9, 1)))
+    assert in_range(date(2030, 1, 1), (date(2024, 9, 1), None))
+
+
+def test_academic_year_semesters():
+    assert academic_year_semesters(2024, 2025) == [
+        ('2024-2025-1', '2024-2025-1'), ('2024-2025-2', '2024-2025-2'),
+        ('2025-2026-1', '2025-2026-1'), ('2025-2026-2', '2025-2026-2'),
+    ]
@@ -0,0 +1,106 @@
+import pytest
+
+import session_pool as pool_module
+from session_pool import SessionPool
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+class FakeClient:
+    def __init__(self, username, password, alive=True):
+        self.username = username
+        self.password = password
+        self.is_authenticated = True
+        self.alive = alive
+        self.logins = 0
+        self.resets = 0
+
+    def is_session_alive(self):
+        return self.alive
+
+    def login(self):
+        self.logins += 1
+        self.alive = True
+
+    def reset(self):
+        self.resets += 1
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(pool_module, 'time', clock)
+    return clock
+
+
+@pytest.fixture
+def pool(clock):
+    return SessionPool(idle_timeout=100, liveness_interval=10, max_idle_per_user=2, max_clients=3)
+
+
+def checkout(pool, username='alice', password='pw'):
+    return pool.checkout('xauat', username, password, lambda: FakeClient(username, password))
+
+
+def test_checked_in_client_is_reused_and_reset(pool):
+    client = checkout(pool)
+    pool.checkin('xauat', client)
+    assert checkout(pool) is client
+    assert client.resets == 1
+    # Leased out exclusively: the next request logs in on its own
+    assert checkout(pool) is not client
+
+
+def test_wrong_password_or_other_school_gets_a_new_client(pool):
+    client = checkout(pool)
+    pool.checkin('xauat', client)
+    assert checkout(pool, password='other') is not client
+    assert pool.checkout('nwafu', 'alice', 'pw', lambda: None) is None
+    assert checkout(pool) is client
+
+
+def test_unauthenticated_client_is_not_pooled(pool):
+    client = checkout(pool)
+    client.is_authenticated = False
+    pool.checkin('xauat', client)
+    assert checkout(pool) is not client
+
+
+def test_idle_clients_are_evicted(pool, clock):
+    client = checkout(pool)
+    pool.checkin('xauat', client)
+    clock.now += 100
+    assert checkout(pool) is not client
+    assert pool._count == 0
+
+
+def test_stale_session_logs_in_again(pool, clock):
+    client = checkout(pool)
+    pool.checkin('xauat', client)
+    clock.now += 5
+    assert checkout(pool).logins == 0
+    pool.checkin('xauat', client)
+    client.alive = False
+    clock.now += 11
+    assert checkout(pool) is client
+    assert client.logins == 1
+
+
+def test_pool_limits(pool):
+    clients = [checkout(pool) for _ in range(3)]
+    for client in clients:
+        pool.checkin('xauat', client)
+    # At most two idle clients per user
+    assert pool._count == 2
+    pool.checkin('xauat', checkout(pool, username='bob'))
+    carol = checkout(pool, username='carol')
+    pool.checkin('xauat', carol)
+    # At most three in all
+    assert pool._count == 3
+    assert checkout(pool, username='carol') is not carol
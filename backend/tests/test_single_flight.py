@@ -0,0 +1,122 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from metrics import FLIGHT_CALLS, FLIGHT_ERRORS
+from single_flight import SingleFlight, TooManyWaiters
+
+
+def wait_for_followers(flight, calls, key, count):
+    deadline = time.monotonic() + 5
+    while True:
+        with flight._lock:
+            call = calls.get(key)
+            if call is not None and call.followers >= count:
+                return
+        assert time.monotonic() < deadline, "followers never arrived"
+        time.sleep(0.005)
+
+
+def run_leader_and_followers(flight, fn, followers):
+    """Starts a blocked leader, lets ``followers`` join it, then releases it."""
+    release = threading.Event()
+    def blocking():
+        release.wait(5)
+        return fn()
+
+    with ThreadPoolExecutor(max_workers=followers + 1) as executor:
+        futures = [executor.submit(flight.do, 'key', blocking)]
+        wait_for_followers(flight, flight._calls, 'key', 0)
+        futures += [executor.submit(flight.do, 'key', blocking) for _ in range(followers)]
+        wait_for_followers(flight, flight._calls, 'key', followers)
+        release.set()
+        outcomes = []
+        for future in futures:
+            try:
+                outcomes.append(future.result())
+            except Exception as e:
+                outcomes.append(e)
+    return outcomes
+
+
+def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight()
+    runs = []
+    leaders, followers = FLIGHT_CALLS.value('leader'), FLIGHT_CALLS.value('follower')
+    outcomes = run_leader_and_followers(flight, lambda: runs.append(1) or object(), 3)
+    assert len(runs) == 1
+    assert all(outcome is outcomes[0] for outcome in outcomes)
+    assert FLIGHT_CALLS.value('leader') == leaders + 1
+    assert FLIGHT_CALLS.value('follower') == followers + 3
+    assert flight.in_flight() == 0
+
+
+def test_every_caller_gets_the_leaders_error():
+    flight = SingleFlight()
+    errors = FLIGHT_ERRORS.value()
+    def fail():
+        raise ConnectionError("upstream down")
+    outcomes = run_leader_and_followers(flight, fail, 2)
+    assert len(outcomes) == 3
+    assert all(outcome is outcomes[0] and isinstance(outcome, ConnectionError) for outcome in outcomes)
+    assert FLIGHT_ERRORS.value() == errors + 1
+    # A failed flight isn't remembered
+    assert flight.do('key', lambda: 'ok') == 'ok'
+
+
+def test_followers_are_bounded():
+    flight = SingleFlight(max_followers=1)
+    release = threading.Event()
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        leader = executor.submit(flight.do, 'key', lambda: release.wait(5))
+        wait_for_followers(flight, flight._calls, 'key', 0)
+        follower = executor.submit(flight.do, 'key', lambda: None)
+        wait_for_followers(flight, flight._calls, 'key', 1)
+        with pytest.raises(TooManyWaiters):
+            flight.do('key', lambda: None)
+        # Other keys are not affected
+        assert flight.do('other', lambda: 'ok') == 'ok'
+        release.set()
+        assert leader.result() is True and follower.result() is True
+
+
+def test_calls_after_landing_run_again():
+    flight = SingleFlight()
+    runs = []
+    for _ in range(2):
+        flight.do('key', lambda: runs.append(1))
+    assert len(runs) == 2
+
+
+def test_async_calls_coalesce():
+    flight = SingleFlight()
+    runs = []
+
+    async def render():
+        runs.append(1)
+        await asyncio.sleep(0.01)
+        return len(runs)
+
+    async def main():
+        return await asyncio.gather(*(flight.ado('key', render) for _ in range(5)))
+
+    assert asyncio.run(main()) == [1] * 5
+    assert len(runs) == 1
+    assert flight.in_flight() == 0
+
+
+def test_async_error_reaches_every_caller():
+    flight = SingleFlight()
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise ValueError("bad")
+
+    async def main():
+        return await asyncio.gather(*(flight.ado('key', fail) for _ in range(3)), return_exceptions=True)
+
+    errors = asyncio.run(main())
+    assert all(isinstance(error, ValueError) and error is errors[0] for error in errors)
@@ -0,0 +1,122 @@
+from datetime import datetime, timedelta, timezone
+
+from timetable_diff import TimetableHistory, diff_timetable
+
+FIRST = datetime(2024, 9, 9, 8, 0)
+NOW = datetime(2024, 10, 1, tzinfo=timezone.utc)
+
+
+def course(lesson, week, room="教1-101", hour=8):
+    start = FIRST.replace(hour=hour) + timedelta(weeks=week)
+    return {'lessonId': lesson, 'courseName': f"课程{lesson}", 'personName': "教师", 'roomZh': room,
+            'start': start, 'end': start + timedelta(minutes=100)}
+
+
+def exam(name, day=0):
+    start = datetime(2025, 1, 6, 14, 0) + timedelta(days=day)
+    return {'course': name, 'time': "", 'room': "教2-202", 'seat_no': "1",
+            'start': start, 'end': start + timedelta(hours=2)}
+
+
+def test_first_fetch_adds_everything():
+    courses, exams = [course('1', week) for week in range(3)], [exam("数学")]
+    state, diff = diff_timetable({}, courses, exams, NOW)
+    assert len(diff.added) == 4 and not (diff.removed or diff.moved or diff.changed)
+    assert len({event['uid'] for event in courses + exams}) == 4
+    assert all(event['sequence'] == 0 and event['lastModified'] == NOW for event in courses + exams)
+    assert set(state) == {event['uid'] for event in courses + exams}
+
+
+def test_unchanged_fetch_keeps_uids_and_sequences():
+    first = [course('1', week) for week in range(3)]
+    state, _ = diff_timetable({}, first, [], NOW)
+    again = [course('1', week) for week in range(3)]
+    _, diff = diff_timetable(state, again, [], NOW + timedelta(days=1))
+    assert not diff
+    assert [event['uid'] for event in again] == [event['uid'] for event in first]
+    assert all(event['lastModified'] == NOW for event in again)
+
+
+def test_rescheduled_class_keeps_its_uid_with_a_new_sequence():
+    first = [course('1', week) for week in range(3)]
+    state, _ = diff_timetable({}, first, [], NOW)
+    later = NOW + timedelta(days=1)
+    moved = [course('1', 0), course('1', 1, hour=14), course('1', 2)]
+    _, diff = diff_timetable(state, moved, [], later)
+    assert diff.moved == [first[1]['uid']]
+    assert moved[1]['uid'] == first[1]['uid']
+    assert moved[1]['sequence'] == 1 and moved[1]['lastModified'] == later
+    assert moved[0]['sequence'] == 0
+
+
+def test_room_change_counts_as_changed():
+    first = [course('1', 0)]
+    state, _ = diff_timetable({}, first, [], NOW)
+    changed = [course('1', 0, room="教3-303")]
+    _, diff = diff_timetable(state, changed, [], NOW)
+    assert diff.changed == [first[0]['uid']] and changed[0]['sequence'] == 1
+
+
+def test_removed_and_added_lessons():
+    state, _ = diff_timetable({}, [course('1', 0), course('2', 0)], [], NOW)
+    removed_uid = next(uid for uid, tracked in state.items() if tracked.group == ('course', '2'))
+    fresh = [course('1', 0), course('3', 0)]
+    _, diff = diff_timetable(state, fresh, [], NOW)
+    assert diff.removed == [removed_uid]
+    assert diff.added == [fresh[1]['uid']]
+
+
+def test_history_revision_only_changes_with_the_timetable():
+    history = TimetableHistory()
+    key = ('xauat', 'user')
+    _, revision = history.apply(key, [course('1', 0)], [])
+    _, same = history.apply(key, [course('1', 0)], [])
+    diff, changed = history.apply(key, [course('1', 0), course('1', 1)], [])
+    assert same == revision
+    assert changed != revision and len(diff.added) == 1
+    assert history.last_diff(key) is diff
+
+
+def test_history_survives_a_restart(tmp_path):
+    from timetable_store import TimetableStore
+
+    store = TimetableStore(str(tmp_path / 'timetables.db'))
+    key = ('xauat', 'user')
+    first = [course('1', week) for week in range(4)]
+    _, revision = TimetableHistory(store=store).apply(key, first, [], 'semester')
+
+    restarted = TimetableHistory(store=store)
+    again = [course('1', week) for week in range(4)]
+    diff, same = restarted.apply(key, again, [], 'semester')
+    assert not diff and same == revision
+    assert [event['uid'] for event in again] == [event['uid'] for event in first]
+
+    # The series snapshot is persisted too: a cancelled week still bumps it
+    dropped = [course('1', week) for week in (0, 1, 3)]
+    TimetableHistory(store=store).apply(key, dropped, [], 'semester')
+    assert all(event['seriesSequence'] == 1 for event in dropped)
+
+
+def test_store_keeps_only_the_diff_state(tmp_path):
+    import sqlite3
+    from timetable_store import SCHEMA_VERSION, TimetableStore
+
+    path = str(tmp_path / 'timetables.db')
+    # A database from before the courses and exams columns were dropped
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE timetables (school TEXT, user_hash TEXT, semester TEXT, courses TEXT, "
+                 "exams TEXT, state TEXT, revision TEXT, updated_at REAL)")
+    conn.execute("PRAGMA user_version = 4")
+    conn.commit()
+    conn.close()
+
+    store = TimetableStore(path)
+    key = ('xauat', 'user')
+    TimetableHistory(store=store).apply(key, [course('1', week) for week in range(2)], [], 'semester')
+    conn = sqlite3.connect(path)
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(timetables)")]
+    assert columns == ['school', 'user_hash', 'semester', 'state', 'revision', 'updated_at']
+    conn.close()
+    state, revision = store.load_timetable_state(*key)
+    assert len(state['events']) == 2 and revision
@@ -0,0 +1,117 @@
+import pytest
+
+from school import upstream_policy as policy_module
+from school.upstream_policy import CircuitBreaker, TokenBucket, UpstreamPolicy, UpstreamUnavailable
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(policy_module.time, 'monotonic', clock)
+    return clock
+
+
+def test_bucket_allows_a_burst_then_paces(clock):
+    bucket = TokenBucket(rate=2, burst=3)
+    assert [bucket.reserve(0) for _ in range(3)] == [0.0, 0.0, 0.0]
+    # Out of tokens: the next one is half a second away at 2/s
+    assert bucket.reserve(0.1) is None
+    assert bucket.reserve(1) == pytest.approx(0.5)
+    clock.now += 10
+    assert bucket.reserve(0) == 0.0
+
+
+def test_refused_reservation_takes_nothing(clock):
+    bucket = TokenBucket(rate=1, burst=1)
+    bucket.reserve(0)
+    assert bucket.reserve(0.5) is None
+    clock.now += 1
+    assert bucket.reserve(0) == 0.0
+
+
+def test_zero_rate_is_unlimited(clock):
+    bucket = TokenBucket(rate=0, burst=1)
+    assert all(bucket.reserve(0) == 0.0 for _ in range(100))
+
+
+def test_breaker_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker(threshold=3, reset_timeout=30)
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == 'closed' and breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == 'open' and not breaker.allow()
+    clock.now += 10
+    assert breaker.retry_after() == pytest.approx(20)
+
+
+def test_half_open_lets_one_trial_through(clock):
+    breaker = CircuitBreaker(threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    clock.now += 30
+    assert breaker.state == 'half_open'
+    assert breaker.allow()
+    assert not breaker.allow()
+    # A failed trial opens the breaker again right away
+    breaker.record_failure()
+    assert breaker.state == 'open' and not breaker.allow()
+    clock.now += 30
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == 'closed' and breaker.allow() and breaker.allow()
+
+
+def test_lost_trial_does_not_block_forever(clock):
+    breaker = CircuitBreaker(threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    clock.now += 30
+    assert breaker.allow()
+    clock.now += 30
+    assert breaker.allow()
+
+
+def test_policy_settings_per_school(monkeypatch):
+    monkeypatch.setenv('UPSTREAM_RETRIES', '4')
+    monkeypatch.setenv('UPSTREAM_RETRIES_NWAFU', '1')
+    assert UpstreamPolicy('xauat').retries == 4
+    policy = UpstreamPolicy('nwafu')
+    assert policy.attempts('GET') == 2
+    assert policy.attempts('POST') == 1
+    assert policy.attempts('POST', idempotent=True) == 2
+
+
+def test_policy_admit_refuses_when_rate_limited_or_open(clock, monkeypatch):
+    monkeypatch.setenv('UPSTREAM_RATE_TESTSCHOOL', '1')
+    monkeypatch.setenv('UPSTREAM_BURST_TESTSCHOOL', '1')
+    monkeypatch.setenv('UPSTREAM_MAX_QUEUE_WAIT_TESTSCHOOL', '0')
+    monkeypatch.setenv('UPSTREAM_BREAKER_THRESHOLD_TESTSCHOOL', '2')
+    policy = UpstreamPolicy('testschool')
+    assert policy.admit() == 0.0
+    with pytest.raises(UpstreamUnavailable):
+        policy.admit()
+
+    clock.now += 5
+    policy.record(503)
+    policy.record(429)
+    policy.record(None)
+    with pytest.raises(UpstreamUnavailable) as e:
+        policy.admit()
+    assert e.value.retry_after > 0
+
+
+def test_retry_delay_honours_retry_after():
+    policy = UpstreamPolicy('xauat')
+    assert 0 <= policy.retry_delay(1) <= policy.backoff * 2
+    assert policy.retry_delay(0, retry_after='3') >= 3
+    assert policy.retry_delay(0, retry_after='later') <= policy.backoff
@@ -0,0 +1,194 @@
+import threading
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timezone
+from recurrence import track_series
+from timetable_store import timetable_store
+
+
+def _course_identity(course):
+    fingerprint = (course['start'].isoformat(), course['end'].isoformat(),
+                   str(course['courseName']), str(course['personName']), str(course['roomZh']))
+    return ('course', str(course['lessonId'])), fingerprint
+
+
+def _exam_identity(exam):
+    fingerprint = (exam['start'].isoformat(), exam['end'].isoformat(),
+                   str(exam['room']), str(exam['seat_no']))
+    return ('exam', str(exam['course'])), fingerprint
+
+
+class TrackedEvent:
+    __slots__ = ('uid', 'group', 'fingerprint', 'sequence', 'last_modified')
+
+    def __init__(self, uid, group, fingerprint, sequence, last_modified):
+        self.uid = uid
+        self.group = group
+        self.fingerprint = fingerprint
+        self.sequence = sequence
+        self.last_modified = last_modified
+
+    @property
+    def start(self):
+        return self.fingerprint[0]
+
+    def to_list(self):
+        return [self.uid, list(self.group), list(self.fingerprint), self.sequence, self.last_modified.isoformat()]
+
+    @classmethod
+    def from_list(cls, data):
+        uid, group, fingerprint, sequence, last_modified = data
+        return cls(uid, tuple(group), tuple(fingerprint), sequence, datetime.fromisoformat(last_modified))
+
+
+class TimetableDiff:
+    """UIDs added, removed, moved (new time) or changed (same time) since the last fetch."""
+    __slots__ = ('added', 'removed', 'moved', 'changed')
+
+    def __init__(self):
+        self.added = []
+        self.removed = []
+        self.moved = []
+        self.changed = []
+
+    def __bool__(self):
+        return bool(self.added or self.removed or self.moved or self.changed)
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+def diff_timetable(previous, courses, exams, now=None):
+    """
+    Match freshly fetched courses and exams against the previous state.
+
+    Occurrences identical to a tracked one keep its UID, SEQUENCE and
+    LAST-MODIFIED. Within the same lesson, leftover new occurrences are paired
+    in time order with leftover old ones and inherit their UID with SEQUENCE
+    bumped, so a rescheduled class is an update instead of a delete plus add.
+
+    The events are annotated in place with 'uid', 'sequence' and
+    'lastModified'. Returns (state, TimetableDiff), where state maps UID to
+    TrackedEvent.
+    """
+    now = now or datetime.now(timezone.utc).replace(microsecond=0)
+    state = {}
+    diff = TimetableDiff()
+
+    old_groups = {}
+    for tracked in previous.values():
+        old_groups.setdefault(tracked.group, []).append(tracked)
+    new_groups = {}
+    for event in courses:
+        group, fingerprint = _course_identity(event)
+        new_groups.setdefault(group, []).append((fingerprint, event))
+    for event in exams:
+        group, fingerprint = _exam_identity(event)
+        new_groups.setdefault(group, []).append((fingerprint, event))
+
+    def keep(tracked, event):
+        state[tracked.uid] = tracked
+        event['uid'] = tracked.uid
+        event['sequence'] = tracked.sequence
+        event['lastModified'] = tracked.last_modified
+
+    for group, new_events in new_groups.items():
+        new_events.sort(key=lambda item: item[0][0])
+        olds = sorted(old_groups.pop(group, ()), key=lambda tracked: tracked.start)
+        by_fingerprint = {}
+        for tracked in olds:
+            by_fingerprint.setdefault(tracked.fingerprint, []).append(tracked)
+
+        unmatched = []
+        for fingerprint, event in new_events:
+            candidates = by_fingerprint.get(fingerprint)
+            if candidates:
+                keep(candidates.pop(0), event)
+            else:
+                unmatched.append((fingerprint, event))
+        leftovers = [tracked for tracked in olds if tracked.uid not in state]
+
+        for (fingerprint, event), tracked in zip(unmatched, leftovers):
+            (diff.moved if tracked.start != fingerprint[0] else diff.changed).append(tracked.uid)
+            keep(TrackedEvent(tracked.uid, group, fingerprint, tracked.sequence + 1, now), event)
+
+        for fingerprint, event in unmatched[len(leftovers):]:
+            uid = base_uid = f"{group[0]}-{group[1]}-{fingerprint[0]}"
+            suffix = 1
+            while uid in state or uid in previous:
+                suffix += 1
+                uid = f"{base_uid}-{suffix}"
+            diff.added.append(uid)
+            keep(TrackedEvent(uid, group, fingerprint, 0, now), event)
+
+        diff.removed.extend(tracked.uid for tracked in leftovers[len(unmatched):])
+
+    for olds in old_groups.values():
+        diff.removed.extend(tracked.uid for tracked in olds)
+
+    return state, diff
+
+
+class TimetableHistory:
+    """
+    The last normalized timetable of every subscriber, keyed by
+    (school, username hash).
+
+    Each state carries a revision token that only changes when the timetable
+    does, so renders tagged with the current revision are still up to date,
+    and the recurring series of the last fetch (see track_series). With a
+    ``store`` the states survive restarts, keeping UIDs stable.
+    """
+
+    def __init__(self, max_subscribers=4096, store=None):
+        self.max_subscribers = max_subscribers
+        self.store = store
+        self._states = OrderedDict()
+        self._diffs = {}
+        self._lock = threading.Lock()
+
+    def apply(self, key, courses, exams, semester=None):
+        """
+        Annotate the events with stable UIDs. Returns (diff, revision); the
+        first time a subscriber is seen everything counts as added.
+        """
+        with self._lock:
+            previous, series, revision = self._states.get(key, (None, None, None))
+        if previous is None:
+            previous, series, revision = self._load(key, semester)
+        state, diff = diff_timetable(previous, courses, exams)
+        series = track_series(series, courses, datetime.now(timezone.utc).replace(microsecond=0))
+        if diff or revision is None:
+            revision = uuid.uuid4().hex
+        if self.store is not None:
+            stored_state = {
+                'events': [tracked.to_list() for tracked in state.values()],
+                'series': {uid: [signature, sequence, modified.isoformat()]
+                           for uid, (signature, sequence, modified) in series.items()},
+            }
+            self.store.save_timetable_state(key[0], key[1], semester, stored_state, revision)
+        with self._lock:
+            self._states[key] = (state, series, revision)
+            self._states.move_to_end(key)
+            self._diffs[key] = diff
+            while len(self._states) > self.max_subscribers:
+                evicted, _ = self._states.popitem(last=False)
+                self._diffs.pop(evicted, None)
+        return diff, revision
+
+    def _load(self, key, semester):
+        stored = self.store.load_timetable_state(key[0], key[1], semester) if self.store is not None else None
+        if stored is None:
+            return {}, {}, None
+        state, revision = stored
+        tracked = [TrackedEvent.from_list(item) for item in state['events']]
+        series = {uid: [signature, sequence, datetime.fromisoformat(modified)]
+                  for uid, (signature, sequence, modified) in state['series'].items()}
+        return {event.uid: event for event in tracked}, series, revision
+
+    def last_diff(self, key):
+        with self._lock:
+            return self._diffs.get(key)
+
+
+timetable_history = TimetableHistory(store=timetable_store)
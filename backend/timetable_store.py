@@ -0,0 +1,208 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+# 2: artifact credential digests are keyed with the cache secret
+# 3: per-school metadata replaces the per-student semester_meta
+# 4: timetable state holds the recurring series next to the events
+# 5: timetables keep only the diff state, the courses and exams were never read back
+SCHEMA_VERSION = 5
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS timetables (
+    school TEXT NOT NULL,
+    user_hash TEXT NOT NULL,
+    semester TEXT NOT NULL,
+    state TEXT NOT NULL,
+    revision TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (school, user_hash, semester)
+);
+CREATE TABLE IF NOT EXISTS school_metadata (
+    school TEXT NOT NULL,
+    name TEXT NOT NULL,
+    value TEXT NOT NULL,
+    expires REAL NOT NULL,
+    PRIMARY KEY (school, name)
+);
+CREATE TABLE IF NOT EXISTS artifacts (
+    school TEXT NOT NULL,
+    user_hash TEXT NOT NULL,
+    variant TEXT NOT NULL,
+    semester TEXT,
+    body BLOB NOT NULL,
+    etag TEXT NOT NULL,
+    last_modified REAL NOT NULL,
+    created REAL NOT NULL,
+    revision TEXT,
+    credential_salt BLOB NOT NULL,
+    credential_digest BLOB NOT NULL,
+    PRIMARY KEY (school, user_hash, variant)
+);
+CREATE INDEX IF NOT EXISTS artifacts_semester ON artifacts (school, user_hash, semester);
+"""
+
+def _best_effort(default=None):
+    # The store is only a cache, a full or locked disk must not fail requests
+    def decorator(method):
+        @wraps(method)
+        def wrapper(*args, **kwargs):
+            try:
+                return method(*args, **kwargs)
+            except sqlite3.Error as e:
+                print(f"Timetable store {method.__name__} failed: {e}")
+                return default
+        return wrapper
+    return decorator
+
+
+def create_private_file(path):
+    """Create ``path`` readable by this user only, or tighten an existing file to 0600."""
+    try:
+        os.close(os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600))
+    except FileExistsError:
+        if os.stat(path).st_mode & 0o077:
+            os.chmod(path, 0o600)
+
+
+class TimetableStore:
+    """
+    SQLite (WAL mode) persistence for timetable states (see
+    TimetableHistory), per-school metadata (see SchoolMetadataCache) and
+    rendered calendars, so a fresh instance can answer from warm data
+    instead of logging every subscriber in again.
+
+    The database is only a cache: when the schema version doesn't match,
+    the tables are dropped and rebuilt.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        # SQLite gives the -wal and -shm files the permissions of the database
+        create_private_file(path)
+        self._local = threading.local()
+        self._migrate(self._connection())
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def _migrate(self, conn):
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        if version == SCHEMA_VERSION:
+            return
+        with self._transaction():
+            if conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+                for table in ('timetables', 'semester_meta', 'school_metadata', 'artifacts'):
+                    conn.execute(f"DROP TABLE IF EXISTS {table}")
+                for statement in SCHEMA.split(';'):
+                    if statement.strip():
+                        conn.execute(statement)
+                conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    @_best_effort()
+    def save_timetable_state(self, school, user_hash, semester, state, revision):
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO timetables VALUES (?, ?, ?, ?, ?, ?)",
+                (school, user_hash, semester or '', json.dumps(state, ensure_ascii=False), revision, time.time()))
+
+    @_best_effort()
+    def load_timetable_state(self, school, user_hash, semester=None):
+        """Returns (state, revision) of the given or most recent semester."""
+        query = "SELECT state, revision FROM timetables WHERE school = ? AND user_hash = ?"
+        params = [school, user_hash]
+        if semester is not None:
+            query += " AND semester = ?"
+            params.append(semester)
+        row = self._connection().execute(query + " ORDER BY updated_at DESC LIMIT 1", params).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1]
+
+    @_best_effort()
+    def save_school_metadata(self, school, name, value, expires):
+        with self._transaction() as conn:
+            conn.execute("INSERT OR REPLACE INTO school_metadata VALUES (?, ?, ?, ?)",
+                         (school, json.dumps(name), json.dumps(value), expires))
+
+    @_best_effort()
+    def load_school_metadata(self, school, name):
+        """Returns (value, expires) of an unexpired entry, or None."""
+        row = self._connection().execute(
+            "SELECT value, expires FROM school_metadata WHERE school = ? AND name = ? AND expires > ?",
+            (school, json.dumps(name), time.time())).fetchone()
+        return (json.loads(row[0]), row[1]) if row else None
+
+    @_best_effort()
+    def delete_school_metadata(self, school, name=None):
+        with self._transaction() as conn:
+            if name is None:
+                conn.execute("DELETE FROM school_metadata WHERE school = ?", (school,))
+            else:
+                conn.execute("DELETE FROM school_metadata WHERE school = ? AND name = ?", (school, json.dumps(name)))
+
+    @_best_effort()
+    def save_artifact(self, key, entry, semester=None):
+        school, user_hash, variant = key
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO artifacts VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (school, user_hash, json.dumps(variant), semester, entry.body, entry.etag,
+                 entry.last_modified, entry.created, entry.revision,
+                 entry.credential_salt, entry.credential_digest))
+
+    @_best_effort()
+    def load_artifact(self, key):
+        """Returns the stored render as a dict of CachedCalendar fields, or None."""
+        school, user_hash, variant = key
+        row = self._connection().execute(
+            "SELECT body, etag, last_modified, created, revision, credential_salt, credential_digest "
+            "FROM artifacts WHERE school = ? AND user_hash = ? AND variant = ?",
+            (school, user_hash, json.dumps(variant))).fetchone()
+        if row is None:
+            return None
+        names = ('body', 'etag', 'last_modified', 'created', 'revision', 'credential_salt', 'credential_digest')
+        return dict(zip(names, row))
+
+    @_best_effort()
+    def delete_artifact(self, key):
+        school, user_hash, variant = key
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM artifacts WHERE school = ? AND user_hash = ? AND variant = ?",
+                         (school, user_hash, json.dumps(variant)))
+
+
+def open_default_store():
+    # Persistence is off unless TIMETABLE_DB points at a persistent, private location
+    path = os.getenv("TIMETABLE_DB", default="")
+    if not path:
+        return None
+    try:
+        return TimetableStore(path)
+    except (OSError, sqlite3.Error) as e:
+        print(f"Failed to open timetable store {path}: {e}")
+        return None
+
+
+timetable_store = open_default_store()